@@ -1,7 +1,15 @@
+import asyncio
+import collections
+import contextlib
+import copy
+import glob
 import json
 import os
-import subprocess
-from typing import Callable, Dict, Optional
+import signal
+import struct
+import tempfile
+import threading
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
 
 from app.config import (
     YOUTUBE_CONCURRENT_FRAGMENT_DOWNLOADS,
@@ -14,20 +22,136 @@ from app.config import (
     YOUTUBE_COOKIES_PATH,
     YOUTUBE_PROXY,
 )
+from app.downloaders.ytdlp_pool import YTDLP_POOL, YTDLP_PROBE_POOL
 
+if TYPE_CHECKING:
+    from app.services.egress_pool import Egress
 
-def download_video(
-    url: str,
+
+# Overall limit for one download, on either execution path.
+DOWNLOAD_TIMEOUT_SECONDS = 600
+# Limit for an extraction-only run (metadata probe).
+PROBE_TIMEOUT_SECONDS = 120
+# Limit for a faststart remux (stream copy, disk bound).
+REMUX_TIMEOUT_SECONDS = 300
+
+# yt-dlp prints one line per progress update in this format (--newline).
+_PROGRESS_PREFIX = "[pdfswifter-progress]"
+_PROGRESS_TEMPLATE = (
+    f"download:{_PROGRESS_PREFIX} %(progress.status)s %(progress.downloaded_bytes)s "
+    "%(progress.total_bytes)s %(progress.total_bytes_estimate)s %(progress.fragment_count)s "
+    "%(info.format_id)s %(progress.filename)s"
+)
+# --print-json emits the whole info dict on one line.
+_STREAM_LIMIT = 16 * 1024 * 1024
+_STDERR_TAIL_LINES = 50
+
+
+# yt-dlp extractors whose URL patterns identify a video, per download source.
+_MEDIA_EXTRACTORS: Dict[str, tuple] = {
+    "youtube": ("Youtube",),
+    "tiktok": ("TikTok",),
+    "instagram": ("Instagram",),
+}
+
+
+def media_id(source: str, url: str) -> Optional[str]:
+    """Return ``"<extractor>:<video id>"`` for a URL, or None if it names no single video.
+
+    The id is read from the URL with yt-dlp's extractor patterns (no network
+    access), so ``youtu.be/X``, ``youtube.com/watch?v=X&t=5`` and
+    ``/shorts/X`` give the same id.
+    """
+    from yt_dlp.extractor import get_info_extractor
+
+    for name in _MEDIA_EXTRACTORS.get(source, ()):
+        extractor = get_info_extractor(name)
+        try:
+            video_id = extractor.get_temp_id(url) if extractor.suitable(url) else None
+        except Exception:
+            video_id = None
+        if video_id:
+            return f"{name}:{video_id}"
+    return None
+
+
+def media_key(source: str, url: str, fmt: Optional[str] = None) -> Optional[str]:
+    """Return ``"<extractor>:<video id>:<format>"`` for a download request."""
+    identifier = media_id(source, url)
+    return f"{identifier}:{fmt or 'default'}" if identifier else None
+
+
+def _capped_format(height: int) -> str:
+    # A progressive (single-file) format close to the cap needs no ffmpeg
+    # merge; otherwise the best video + audio pair under the cap, and the
+    # smallest format when nothing is under it (e.g. portrait video).
+    return (
+        f"b[height<={height}][height>{height * 2 // 3}][ext=mp4]"
+        f"/bv*[height<={height}][ext=mp4]+ba[ext=m4a]"
+        f"/b[height<={height}]/bv*[height<={height}]+ba/w"
+    )
+
+
+# Request-level quality tiers: yt-dlp format selector per tier.
+DEFAULT_QUALITY = "best"
+QUALITY_FORMATS: Dict[str, str] = {
+    "audio": "ba[ext=m4a]/ba/b",
+    "mp3": "ba/b",
+    "360": _capped_format(360),
+    "720": _capped_format(720),
+    "1080": _capped_format(1080),
+    "best": "bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]",
+}
+# Extra options per tier. "audio" only remuxes (an m4a stream is kept as is,
+# a video file has its AAC track copied out); "mp3" transcodes.
+_QUALITY_ARGS: Dict[str, List[str]] = {
+    "audio": ["--extract-audio", "--audio-format", "m4a"],
+    "mp3": ["--extract-audio", "--audio-format", "mp3"],
+}
+# Extensions the output-folder fallback in resolve_downloaded_file looks for.
+_OUTPUT_EXTENSIONS = (".mp4", ".m4a", ".mp3")
+
+
+def normalize_quality(quality: Optional[str]) -> str:
+    """Return the tier name for a request value; ValueError if unknown."""
+    tier = (quality or DEFAULT_QUALITY).strip().lower().removesuffix("p")
+    if tier not in QUALITY_FORMATS:
+        raise ValueError(
+            f"Unknown quality '{quality}'. Use one of: {', '.join(QUALITY_FORMATS)}."
+        )
+    return tier
+
+
+def select_format(info: Dict, quality: Optional[str] = None) -> Dict:
+    """Run a tier's format selection on an extracted info dict, offline.
+
+    Returns the info dict as a download would process it (``format``,
+    ``requested_formats``); nothing is fetched.
+    """
+    import yt_dlp
+
+    params = {"format": QUALITY_FORMATS[normalize_quality(quality)], "quiet": True, "no_warnings": True}
+    with yt_dlp.YoutubeDL(params) as ydl:
+        return ydl.process_ie_result(copy.deepcopy(info), download=False)
+
+
+def build_ytdlp_args(
     output_template: str,
     custom_options: Optional[Dict] = None,
-    progress_callback: Optional[Callable[[Dict], None]] = None,
-) -> str:
-    """Download remote video content to disk and return the resulting filename."""
+    quality: Optional[str] = None,
+    egress: Optional["Egress"] = None,
+) -> List[str]:
+    """yt-dlp command-line options (without the URL) shared by both execution paths.
 
-    cmd = [
-        "yt-dlp",
+    ``egress`` (from ``EGRESS_POOL``) replaces ``YOUTUBE_PROXY`` and
+    ``YOUTUBE_SOURCE_ADDRESS``.
+    """
+
+    tier = normalize_quality(quality)
+    args = [
         "--cache-dir", "/data/.yt-dlp-cache",
-        "--format", "bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]",
+        "--format", QUALITY_FORMATS[tier],
+        *_QUALITY_ARGS.get(tier, ()),
         "--output", output_template,
         "--merge-output-format", "mp4",
         "--no-playlist",
@@ -45,18 +169,18 @@ def download_video(
             "AppleWebKit/537.36 (KHTML, like Gecko) "
             "Chrome/121.0.0.0 Safari/537.36"
         ),
-        "--print-json",
-        "--no-simulate",
     ]
 
-    if YOUTUBE_SOURCE_ADDRESS:
-        cmd.extend(["--source-address", YOUTUBE_SOURCE_ADDRESS])
+    source_address = (egress.source_address if egress else None) or YOUTUBE_SOURCE_ADDRESS
+    if source_address:
+        args.extend(["--source-address", source_address])
 
-    if YOUTUBE_PROXY:
-        cmd.extend(["--proxy", YOUTUBE_PROXY])
+    proxy = egress.proxy if egress else YOUTUBE_PROXY
+    if proxy:
+        args.extend(["--proxy", proxy])
 
     if YOUTUBE_MAX_FILESIZE_MB and YOUTUBE_MAX_FILESIZE_MB > 0:
-        cmd.extend(["--max-filesize", f"{YOUTUBE_MAX_FILESIZE_MB}M"])
+        args.extend(["--max-filesize", f"{YOUTUBE_MAX_FILESIZE_MB}M"])
 
     cookies_path = None
     if custom_options and custom_options.get("cookiefile"):
@@ -65,58 +189,428 @@ def download_video(
         cookies_path = os.path.expanduser(YOUTUBE_COOKIES_PATH)
 
     if cookies_path and os.path.exists(cookies_path):
-        cmd.extend(["--cookies", cookies_path])
+        args.extend(["--cookies", cookies_path])
+
+    return args
+
+
+def _parse_progress_line(line: str) -> Optional[Dict]:
+    parts = line[len(_PROGRESS_PREFIX):].split(maxsplit=6)
+    if len(parts) != 7:
+        return None
+
+    def number(raw: str) -> Optional[float]:
+        try:
+            return float(raw)
+        except ValueError:
+            return None  # yt-dlp prints "NA" for unknown values
+
+    status, downloaded, total, estimate, fragments, format_id, filename = parts
+    return {
+        "status": status,
+        "downloaded_bytes": number(downloaded),
+        "total_bytes": number(total),
+        "total_bytes_estimate": number(estimate),
+        "fragment_count": number(fragments),
+        "format_id": None if format_id == "NA" else format_id,
+        "filename": None if filename == "NA" else filename,
+    }
 
-    cmd.append(url)
 
+def _partial_path(data: Dict) -> Optional[str]:
+    """The file a progressive download appends to, if it becomes the result as is.
+
+    Fragmented downloads and the parts of a merged format (``name.f137.mp4``)
+    are rewritten afterwards, so they have none.
+    """
+    filename = data.get("filename")
+    format_id = data.get("format_id")
+    if data.get("status") != "downloading" or not filename or not format_id:
+        return None
+    if data.get("fragment_count") or f".f{format_id}." in os.path.basename(filename):
+        return None
+    return data.get("tmpfilename") or f"{filename}.part"
+
+
+async def _kill_process_group(process: asyncio.subprocess.Process, grace: float = 5.0) -> None:
+    """SIGTERM yt-dlp and its ffmpeg children, then SIGKILL after ``grace`` seconds."""
+    if process.returncode is not None:
+        return
+    with contextlib.suppress(ProcessLookupError):
+        os.killpg(process.pid, signal.SIGTERM)
     try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=600,
-        )
+        await asyncio.wait_for(process.wait(), grace)
+    except asyncio.TimeoutError:
+        with contextlib.suppress(ProcessLookupError):
+            os.killpg(process.pid, signal.SIGKILL)
+        await process.wait()
+
+
+async def run_ytdlp_subprocess(
+    url: Optional[str],
+    args: List[str],
+    progress_callback: Optional[Callable[[Dict], None]] = None,
+    timeout: float = DOWNLOAD_TIMEOUT_SECONDS,
+    download: bool = True,
+) -> Optional[Dict]:
+    """Run the yt-dlp executable once and return the info dict it printed.
+
+    Progress lines are parsed as they arrive and passed to
+    ``progress_callback``. With ``download=False`` only extraction runs and
+    the full info dict is returned. ``url`` may be None when ``args`` has
+    ``--load-info-json``. On timeout or cancellation the whole process group
+    is killed.
+    """
 
-        if result.returncode != 0:
-            error_msg = result.stderr.strip() or result.stdout.strip() or "Download failed"
-            error_msg = error_msg.replace("\n", " ").strip()
-            raise RuntimeError(error_msg)
-
-        # Parse the JSON output to get the filename
-        output_lines = result.stdout.strip().split("\n")
-        info = None
-        for line in reversed(output_lines):
-            try:
-                info = json.loads(line)
-                break
-            except json.JSONDecodeError:
-                continue
-
-        filename = None
-        if info:
-            requested = info.get("requested_downloads")
-            if isinstance(requested, list) and requested:
-                filename = requested[0].get("filepath") or requested[0].get("filename")
-            filename = filename or info.get("_filename")
-
-        # Fallback: find the downloaded file based on template
-        if not filename or not os.path.exists(filename):
-            base_dir = os.path.dirname(output_template)
-            if os.path.isdir(base_dir):
-                files = [
-                    os.path.join(base_dir, f)
-                    for f in os.listdir(base_dir)
-                    if f.endswith(".mp4")
-                ]
-                if files:
-                    filename = max(files, key=os.path.getctime)
-
-        if not filename or not os.path.exists(filename):
-            raise FileNotFoundError("Failed to download video.")
-
-        return filename
-
-    except subprocess.TimeoutExpired:
-        raise RuntimeError("Download timed out after 10 minutes")
+    if download:
+        cmd = [
+            "yt-dlp",
+            *args,
+            "--newline",
+            "--progress",
+            "--progress-template", _PROGRESS_TEMPLATE,
+            "--print-json",
+            "--no-simulate",
+        ]
+    else:
+        cmd = ["yt-dlp", *args, "--dump-single-json"]
+    if url:
+        cmd.append(url)
+
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,
+            limit=_STREAM_LIMIT,
+        )
     except FileNotFoundError:
         raise RuntimeError("yt-dlp not found. Please install it.")
+
+    info: Optional[Dict] = None
+    stderr_tail: collections.deque = collections.deque(maxlen=_STDERR_TAIL_LINES)
+
+    async def read_stdout() -> None:
+        nonlocal info
+        async for raw in process.stdout:
+            line = raw.decode("utf-8", errors="replace").strip()
+            if line.startswith(_PROGRESS_PREFIX):
+                data = _parse_progress_line(line)
+                if data and progress_callback:
+                    progress_callback(data)
+            elif line.startswith("{"):
+                # Parse the JSON output to get the filename
+                try:
+                    info = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+    async def read_stderr() -> None:
+        async for raw in process.stderr:
+            line = raw.decode("utf-8", errors="replace").strip()
+            if line:
+                stderr_tail.append(line)
+
+    readers = asyncio.gather(read_stdout(), read_stderr(), process.wait())
+    try:
+        await asyncio.wait_for(readers, timeout)
+    except asyncio.TimeoutError:
+        await _kill_process_group(process)
+        raise RuntimeError(f"Download timed out after {timeout / 60:g} minutes")
+    except BaseException:
+        # Cancelled (or a failing progress callback): don't leave yt-dlp running.
+        await asyncio.shield(_kill_process_group(process))
+        raise
+    finally:
+        if readers.done() and not readers.cancelled():
+            readers.exception()
+
+    if process.returncode != 0:
+        error_msg = " ".join(stderr_tail).strip() or "Download failed"
+        raise RuntimeError(error_msg)
+
+    return info
+
+
+def resolve_downloaded_file(info: Optional[Dict], output_template: str) -> str:
+    filename = None
+    if info:
+        requested = info.get("requested_downloads")
+        if isinstance(requested, list) and requested:
+            filename = requested[0].get("filepath") or requested[0].get("filename")
+        filename = filename or info.get("_filename")
+
+    # Fallback: find the downloaded file based on template
+    if not filename or not os.path.exists(filename):
+        base_dir = os.path.dirname(output_template)
+        if os.path.isdir(base_dir):
+            files = [
+                os.path.join(base_dir, f)
+                for f in os.listdir(base_dir)
+                if f.endswith(_OUTPUT_EXTENSIONS)
+            ]
+            if files:
+                filename = max(files, key=os.path.getctime)
+
+    if not filename or not os.path.exists(filename):
+        raise RuntimeError("Failed to download video.")
+
+    return filename
+
+
+def remove_partial_files(paths) -> None:
+    """Delete what an interrupted yt-dlp run leaves next to each output path."""
+    for path in paths:
+        candidates = {path, f"{path}.part", f"{path}.ytdl"}
+        candidates.update(glob.glob(f"{glob.escape(path)}.part-Frag*"))
+        for candidate in candidates:
+            with contextlib.suppress(OSError):
+                os.remove(candidate)
+
+
+async def extract_video_info(
+    url: str,
+    custom_options: Optional[Dict] = None,
+    timeout: float = PROBE_TIMEOUT_SECONDS,
+    egress: Optional["Egress"] = None,
+) -> Dict:
+    """Run yt-dlp extraction only (no download) and return the info dict."""
+    args = build_ytdlp_args(
+        os.path.join(tempfile.gettempdir(), "%(id)s.%(ext)s"), custom_options, egress=egress
+    )
+    # Any format will do: tiers are applied to the result (select_format, or
+    # the download's own selection with --load-info-json).
+    args += ["--format", "bv*+ba/b"]
+    if YTDLP_PROBE_POOL.enabled:
+        try:
+            info = await YTDLP_PROBE_POOL.extract_async(url, args, timeout)
+        except TimeoutError:
+            raise RuntimeError(f"Extraction timed out after {timeout:g} seconds") from None
+    else:
+        info = await run_ytdlp_subprocess(url, args, timeout=timeout, download=False)
+    if not info:
+        raise RuntimeError("Extraction failed")
+    return info
+
+
+async def extract_playlist_entries(
+    url: str,
+    custom_options: Optional[Dict] = None,
+    limit: int = 50,
+    timeout: float = PROBE_TIMEOUT_SECONDS,
+    egress: Optional["Egress"] = None,
+) -> Tuple[Optional[str], List[Dict]]:
+    """Return ``(playlist title, entries)`` for a playlist URL, in one extraction.
+
+    Entries are ``{"url", "title"}`` dicts for at most ``limit`` videos, read
+    from the playlist page only (``--flat-playlist``: nothing is extracted
+    per video). A URL that names a single video gives one entry.
+    """
+    args = [
+        arg
+        for arg in build_ytdlp_args(
+            os.path.join(tempfile.gettempdir(), "%(id)s.%(ext)s"), custom_options, egress=egress
+        )
+        if arg != "--no-playlist"
+    ]
+    args += ["--yes-playlist", "--flat-playlist", "--playlist-end", str(max(int(limit), 1))]
+    if YTDLP_PROBE_POOL.enabled:
+        try:
+            info = await YTDLP_PROBE_POOL.extract_async(url, args, timeout)
+        except TimeoutError:
+            raise RuntimeError(f"Extraction timed out after {timeout:g} seconds") from None
+    else:
+        info = await run_ytdlp_subprocess(url, args, timeout=timeout, download=False)
+    if not info:
+        raise RuntimeError("Extraction failed")
+    if "entries" not in info:
+        return None, [{"url": info.get("webpage_url") or url, "title": info.get("title")}]
+    entries = []
+    for entry in info.get("entries") or []:
+        entry = entry or {}
+        # Flat entries link to the video's page; fully extracted ones (some
+        # extractors resolve every entry) have it as webpage_url, unless
+        # they were found on the playlist page itself.
+        entry_url = entry.get("webpage_url")
+        if entry.get("_type") in ("url", "url_transparent") or entry_url in (None, url):
+            entry_url = entry.get("url")
+        if entry_url and entry_url.startswith(("http://", "https://")):
+            entries.append({"url": entry_url, "title": entry.get("title")})
+    return info.get("title"), entries[: max(int(limit), 1)]
+
+
+async def download_video(
+    url: str,
+    output_template: str,
+    custom_options: Optional[Dict] = None,
+    progress_callback: Optional[Callable[[Dict], None]] = None,
+    info: Optional[Dict] = None,
+    quality: Optional[str] = None,
+    egress: Optional["Egress"] = None,
+) -> str:
+    """Download remote video content to disk and return the resulting filename.
+
+    Runs on a warm worker from ``YTDLP_POOL`` when the pool is enabled
+    (``YTDLP_WORKERS`` > 0), otherwise starts the ``yt-dlp`` executable.
+    With ``info`` (from ``extract_video_info``) yt-dlp skips extraction
+    (``--load-info-json``). ``quality`` is a ``QUALITY_FORMATS`` tier; the
+    last progress event (``finished``) names the format yt-dlp selected.
+    ``egress`` picks the proxy / source address (see ``build_ytdlp_args``).
+    Progress events of a file that becomes the result as is (not merged,
+    fragmented or converted afterwards) carry its ``partial_path``.
+    Cancelling the awaiting task stops the download on either path and
+    removes its partial files.
+    """
+
+    args = build_ytdlp_args(output_template, custom_options, quality, egress)
+    # Tiers with extra options convert the downloaded file.
+    followable = not _QUALITY_ARGS.get(normalize_quality(quality))
+    if info:
+        with tempfile.NamedTemporaryFile(
+            "w", suffix=".info.json", encoding="utf-8", delete=False
+        ) as handle:
+            json.dump(info, handle)
+        try:
+            args += ["--load-info-json", handle.name]
+            return await _download(None, args, output_template, progress_callback, followable)
+        finally:
+            with contextlib.suppress(OSError):
+                os.remove(handle.name)
+    return await _download(url, args, output_template, progress_callback, followable)
+
+
+async def _download(
+    url: Optional[str],
+    args: List[str],
+    output_template: str,
+    progress_callback: Optional[Callable[[Dict], None]],
+    followable: bool = False,
+) -> str:
+    output_files = set()
+
+    def hook(data: Dict) -> None:
+        if data.get("filename"):
+            output_files.add(data["filename"])
+        if followable:
+            data["partial_path"] = _partial_path(data)
+        if progress_callback:
+            progress_callback(data)
+
+    if not YTDLP_POOL.enabled:
+        try:
+            info = await run_ytdlp_subprocess(url, args, hook)
+        except asyncio.CancelledError:
+            remove_partial_files(output_files)
+            raise
+        return _finish_download(info, output_template, progress_callback)
+
+    cancel_event = threading.Event()
+    # Wait for a free worker here, not in a thread (see ytdlp_pool).
+    async with YTDLP_POOL.slot():
+        pool_download = asyncio.ensure_future(
+            asyncio.to_thread(
+                YTDLP_POOL.download,
+                url,
+                args,
+                hook,
+                DOWNLOAD_TIMEOUT_SECONDS,
+                cancel_event,
+            )
+        )
+        try:
+            info = await asyncio.shield(pool_download)
+        except asyncio.CancelledError:
+            cancel_event.set()
+            # Wait for the worker to be killed before deleting its files.
+            await asyncio.wait({pool_download}, timeout=5.0)
+            if pool_download.done() and not pool_download.cancelled():
+                pool_download.exception()
+            remove_partial_files(output_files)
+            raise
+        except TimeoutError as exc:
+            raise RuntimeError(str(exc)) from None
+    return _finish_download(info, output_template, progress_callback)
+
+
+def _finish_download(
+    info: Optional[Dict],
+    output_template: str,
+    progress_callback: Optional[Callable[[Dict], None]],
+) -> str:
+    filename = resolve_downloaded_file(info, output_template)
+    if progress_callback:
+        progress_callback(
+            {"status": "finished", "filename": filename, "format": (info or {}).get("format")}
+        )
+    return filename
+
+
+def needs_faststart(path: str) -> bool:
+    """True when an MP4's ``moov`` atom comes after its ``mdat`` (read from the atom headers).
+
+    Players then need the end of the file before they can start. Only the
+    top-level atom headers are read.
+    """
+    with open(path, "rb") as handle:
+        end = os.fstat(handle.fileno()).st_size
+        offset = 0
+        seen_mdat = False
+        while offset + 8 <= end:
+            handle.seek(offset)
+            header = handle.read(16)
+            size, kind = struct.unpack(">I4s", header[:8])
+            if size == 1 and len(header) == 16:
+                size = struct.unpack(">Q", header[8:])[0]
+            elif size == 0:
+                size = end - offset
+            if size < 8:
+                return False
+            if kind == b"moov":
+                return seen_mdat
+            if kind == b"mdat":
+                seen_mdat = True
+            offset += size
+    return False
+
+
+async def remux_faststart(path: str, timeout: float = REMUX_TIMEOUT_SECONDS) -> None:
+    """Rewrite ``path`` with its ``moov`` atom first: ffmpeg stream copy, no re-encoding.
+
+    The result replaces ``path`` only once ffmpeg succeeded. On timeout or
+    cancellation ffmpeg is killed and its output removed.
+    """
+    stem, ext = os.path.splitext(path)
+    temp_path = f"{stem}.faststart{ext}"
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin", "-y",
+        "-i", path,
+        "-map", "0", "-c", "copy", "-movflags", "+faststart",
+        temp_path,
+    ]
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,
+        )
+    except FileNotFoundError:
+        raise RuntimeError("ffmpeg not found. Please install it.")
+
+    try:
+        try:
+            _, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            await _kill_process_group(process)
+            raise RuntimeError(f"Remux timed out after {timeout:g} seconds")
+        except BaseException:
+            await asyncio.shield(_kill_process_group(process))
+            raise
+        if process.returncode != 0:
+            message = stderr.decode("utf-8", errors="replace").strip()
+            raise RuntimeError(message.splitlines()[-1] if message else "Remux failed")
+        os.replace(temp_path, path)
+    finally:
+        with contextlib.suppress(OSError):
+            os.remove(temp_path)
@@ -1,4 +1,13 @@
-"""Cookie management for yt-dlp downloads with automatic refresh."""
+"""Cookie management for yt-dlp downloads with automatic refresh.
+
+``COOKIE_POOL`` hands out the configured cookies.txt files (one per account)
+round-robin, preferring accounts with the fewest recent bot-check failures
+and resting those that keep failing, so one flagged account does not stall
+every YouTube download. A background check looks at each file on a schedule
+(login cookie expiry, then a metadata probe with it) and refreshes
+``YOUTUBE_COOKIES_PATH`` from the browser before it expires or once it is
+rejected, instead of waiting for a user's download to fail.
+"""
 
 import asyncio
 import logging
@@ -6,9 +15,20 @@ import os
 import subprocess
 import threading
 import time
-from typing import Optional
+from typing import Dict, Iterable, List, Optional, Tuple
 
-from app.config import YOUTUBE_COOKIES_BROWSER, YOUTUBE_COOKIES_PATH
+from app.config import (
+    YOUTUBE_COOKIES_BROWSER,
+    YOUTUBE_COOKIES_CHECK_INTERVAL_SECONDS,
+    YOUTUBE_COOKIES_COOLDOWN_SECONDS,
+    YOUTUBE_COOKIES_FAILURE_THRESHOLD,
+    YOUTUBE_COOKIES_PATH,
+    YOUTUBE_COOKIES_PATHS,
+    YOUTUBE_COOKIES_PROBE_URL,
+    YOUTUBE_COOKIES_REFRESH_BEFORE_SECONDS,
+)
+from app.downloaders.common import extract_video_info
+from app.services.redis_client import get_redis
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +36,40 @@ _refresh_lock = threading.Lock()
 _last_refresh_time: float = 0.0
 _MIN_REFRESH_INTERVAL_SECONDS = 60.0
 
+# Google account login cookies; the first of them to expire ends the session.
+_LOGIN_COOKIES = frozenset(("SID", "__Secure-1PSID", "__Secure-3PSID", "SAPISID", "LOGIN_INFO"))
+_STATE_TTL_SECONDS = 7 * 86400
+# Rested accounts come back after at most this many cooldowns' worth.
+_COOLDOWN_MAX_FACTOR = 8
+
+# KEYS: state hash. ARGV: ok (1/0), failure threshold, cooldown base ms,
+# cooldown cap ms. Returns the cooldown started, in ms (0 if none).
+_RECORD_SCRIPT = """
+local now = redis.call('TIME')
+local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+redis.call('EXPIRE', KEYS[1], %(ttl)d)
+if ARGV[1] == '1' then
+  redis.call('HSET', KEYS[1], 'strikes', 0, 'cooldowns', 0)
+  redis.call('HINCRBY', KEYS[1], 'successes', 1)
+  return 0
+end
+redis.call('HINCRBY', KEYS[1], 'failures', 1)
+local state = redis.call('HMGET', KEYS[1], 'strikes', 'cooldowns', 'cooldown_until_ms')
+-- Failures of jobs that took the account before it was rested count once.
+if tonumber(state[3] or 0) > now_ms then
+  return 0
+end
+local strikes = tonumber(state[1] or 0) + 1
+if strikes < tonumber(ARGV[2]) then
+  redis.call('HSET', KEYS[1], 'strikes', strikes)
+  return 0
+end
+local cooldowns = tonumber(state[2] or 0) + 1
+local cooldown = math.floor(math.min(tonumber(ARGV[4]), tonumber(ARGV[3]) * 2 ^ (cooldowns - 1)))
+redis.call('HSET', KEYS[1], 'strikes', 0, 'cooldowns', cooldowns, 'cooldown_until_ms', now_ms + cooldown)
+return cooldown
+""" % {"ttl": _STATE_TTL_SECONDS}
+
 
 def is_cookie_error(error: Exception) -> bool:
     """Check if an error indicates stale or missing cookies."""
@@ -134,9 +188,335 @@ def refresh_cookies() -> bool:
         success = _do_refresh_cookies()
         if success:
             _last_refresh_time = now
+            COOKIE_POOL.mark_refreshed(get_cookies_path())
         return success
 
 
 async def refresh_cookies_async() -> bool:
     """Async wrapper for cookie refresh."""
     return await asyncio.to_thread(refresh_cookies)
+
+
+def login_cookie_expiry(path: str) -> Optional[float]:
+    """Earliest expiry (epoch seconds) of the YouTube login cookies in a cookies.txt.
+
+    None if the file holds no persistent login cookies (logged out).
+    """
+    expiries = []
+    with open(path, encoding="utf-8", errors="replace") as handle:
+        for line in handle:
+            if line.startswith("#HttpOnly_"):
+                line = line[len("#HttpOnly_"):]
+            elif line.startswith("#") or not line.strip():
+                continue
+            fields = line.rstrip("\r\n").split("\t")
+            if len(fields) < 7 or fields[5] not in _LOGIN_COOKIES:
+                continue
+            if not fields[0].lstrip(".").endswith("youtube.com"):
+                continue
+            try:
+                expires = float(fields[4])
+            except ValueError:
+                continue
+            if expires > 0:
+                expiries.append(expires)
+    return min(expiries) if expiries else None
+
+
+class CookiePool:
+    def __init__(
+        self,
+        paths: Iterable[str],
+        refreshable_path: Optional[str] = None,
+        failure_threshold: int = YOUTUBE_COOKIES_FAILURE_THRESHOLD,
+        cooldown_seconds: float = YOUTUBE_COOKIES_COOLDOWN_SECONDS,
+        check_interval_seconds: int = YOUTUBE_COOKIES_CHECK_INTERVAL_SECONDS,
+        refresh_before_seconds: int = YOUTUBE_COOKIES_REFRESH_BEFORE_SECONDS,
+        probe_url: Optional[str] = YOUTUBE_COOKIES_PROBE_URL,
+        key_prefix: str = "cookie_pool:",
+    ) -> None:
+        self.paths: List[str] = list(dict.fromkeys(os.path.expanduser(path) for path in paths if path))
+        self.refreshable_path = os.path.expanduser(refreshable_path) if refreshable_path else None
+        self.failure_threshold = max(int(failure_threshold), 1)
+        self.cooldown_seconds = max(float(cooldown_seconds), 0.0)
+        self.check_interval_seconds = max(int(check_interval_seconds), 0)
+        self.refresh_before_seconds = max(int(refresh_before_seconds), 0)
+        self.probe_url = probe_url or None
+        self.key_prefix = key_prefix
+        self._scripts: Dict[str, object] = {}
+        self._client_id = None
+        self._lock = threading.Lock()
+        self._local: Dict[str, Dict[str, object]] = {}
+        self._cursor = 0
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # -- Redis helpers -----------------------------------------------------
+
+    def _key(self, path: str) -> str:
+        return f"{self.key_prefix}{path}"
+
+    def _script(self, client, name: str, source: str):
+        if self._client_id != id(client):
+            self._scripts = {}
+            self._client_id = id(client)
+        script = self._scripts.get(name)
+        if script is None:
+            script = client.register_script(source)
+            self._scripts[name] = script
+        return script
+
+    async def _call(self, func, *args):
+        if get_redis() is None:
+            return func(*args)
+        return await asyncio.to_thread(func, *args)
+
+    def _states_sync(self) -> Tuple[float, List[Dict]]:
+        """``(now ms, state per path)``."""
+        client = get_redis()
+        if client is None:
+            with self._lock:
+                return time.time() * 1000, [dict(self._local.get(path, {})) for path in self.paths]
+        pipe = client.pipeline(transaction=False)
+        pipe.time()
+        for path in self.paths:
+            pipe.hgetall(self._key(path))
+        (seconds, micros), *states = pipe.execute()
+        return seconds * 1000 + micros / 1000, states
+
+    def _update_sync(self, path: str, **fields) -> None:
+        client = get_redis()
+        if client is None:
+            with self._lock:
+                self._local.setdefault(path, {}).update(fields)
+            return
+        pipe = client.pipeline(transaction=False)
+        pipe.hset(self._key(path), mapping={name: str(value) for name, value in fields.items()})
+        pipe.expire(self._key(path), _STATE_TTL_SECONDS)
+        pipe.execute()
+
+    # -- Rotation ----------------------------------------------------------
+
+    def _acquire_sync(self, exclude: Tuple[str, ...]) -> Optional[str]:
+        now_ms, states = self._states_sync()
+        client = get_redis()
+        if client is None:
+            with self._lock:
+                self._cursor += 1
+                cursor = self._cursor
+        else:
+            cursor = int(client.incr(f"{self.key_prefix}cursor"))
+        count = len(self.paths)
+        order = [(self.paths[(cursor + i) % count], states[(cursor + i) % count]) for i in range(count)]
+        usable = [
+            (path, state)
+            for path, state in order
+            if path not in exclude and os.path.exists(path)
+        ]
+        if not usable:
+            return next((path for path in self.paths if path not in exclude), None)
+        ready = [
+            (path, state)
+            for path, state in usable
+            if float(state.get("cooldown_until_ms") or 0) <= now_ms
+        ]
+        if ready:
+            # Round-robin among the accounts with the fewest recent strikes.
+            return min(ready, key=lambda item: int(float(item[1].get("strikes") or 0)))[0]
+        # Every account is resting: take the one that comes back first.
+        return min(usable, key=lambda item: float(item[1].get("cooldown_until_ms") or 0))[0]
+
+    async def acquire(self, exclude: Iterable[str] = ()) -> Optional[str]:
+        """Cookies file for the next YouTube download (None when none are configured).
+
+        ``exclude`` skips files a job already tried.
+        """
+        exclude = tuple(exclude)
+        if len(self.paths) <= 1:
+            return next((path for path in self.paths if path not in exclude), None)
+        try:
+            return await self._call(self._acquire_sync, exclude)
+        except Exception as exc:
+            logger.warning("Choosing a cookies file failed: %s", exc)
+            return next((path for path in self.paths if path not in exclude), None)
+
+    def _record_sync(self, path: str, ok: bool) -> float:
+        cap = self.cooldown_seconds * _COOLDOWN_MAX_FACTOR
+        client = get_redis()
+        if client is not None:
+            cooldown_ms = self._script(client, "record", _RECORD_SCRIPT)(
+                keys=[self._key(path)],
+                args=[
+                    1 if ok else 0,
+                    self.failure_threshold,
+                    int(self.cooldown_seconds * 1000),
+                    int(cap * 1000),
+                ],
+            )
+            return int(cooldown_ms) / 1000
+        now_ms = time.time() * 1000
+        with self._lock:
+            state = self._local.setdefault(path, {})
+            if ok:
+                state.update(strikes=0, cooldowns=0, successes=int(state.get("successes", 0)) + 1)
+                return 0.0
+            state["failures"] = int(state.get("failures", 0)) + 1
+            if float(state.get("cooldown_until_ms", 0)) > now_ms:
+                return 0.0
+            state["strikes"] = int(state.get("strikes", 0)) + 1
+            if state["strikes"] < self.failure_threshold:
+                return 0.0
+            state["cooldowns"] = int(state.get("cooldowns", 0)) + 1
+            cooldown = min(cap, self.cooldown_seconds * 2 ** (state["cooldowns"] - 1))
+            state.update(strikes=0, cooldown_until_ms=now_ms + cooldown * 1000)
+            return cooldown
+
+    async def record(self, path: Optional[str], ok: bool) -> None:
+        """Score a cookies file after a download passed (or failed) the sign-in check."""
+        if not path or path not in self.paths:
+            return
+        try:
+            cooldown = await self._call(self._record_sync, path, ok)
+        except Exception as exc:
+            logger.warning("Recording the outcome for %s failed: %s", path, exc)
+            return
+        if cooldown:
+            logger.warning(
+                "Cookies %s keep failing YouTube's sign-in check; resting them for %.0fs",
+                path,
+                cooldown,
+            )
+
+    def mark_refreshed(self, path: Optional[str]) -> None:
+        """Put a freshly exported cookies file back into rotation."""
+        if not path or path not in self.paths:
+            return
+        try:
+            self._update_sync(
+                path, strikes=0, cooldown_until_ms=0, refreshed_ms=int(time.time() * 1000)
+            )
+        except Exception as exc:
+            logger.warning("Recording the refresh of %s failed: %s", path, exc)
+
+    # -- Health checks -----------------------------------------------------
+
+    def _refreshable(self, path: str) -> bool:
+        return path == self.refreshable_path and can_refresh_cookies()
+
+    def check(self, path: str) -> Dict[str, object]:
+        """Check one cookies file now; refreshes it when possible and needed."""
+        if not os.path.exists(path):
+            error = "file not found"
+            self._update_sync(
+                path, last_check_ms=int(time.time() * 1000), last_check_ok=0, last_error=error
+            )
+            return {"ok": False, "error": error, "refreshed": False, "expires_at": None}
+
+        refreshed = False
+        expires = login_cookie_expiry(path)
+        if (
+            expires is not None
+            and expires - time.time() < self.refresh_before_seconds
+            and self._refreshable(path)
+        ):
+            logger.info("Cookies %s expire in %.0fs; refreshing", path, expires - time.time())
+            refreshed = refresh_cookies()
+            expires = login_cookie_expiry(path) if refreshed else expires
+
+        ok, error = True, ""
+        if self.probe_url:
+            try:
+                asyncio.run(extract_video_info(self.probe_url, {"cookiefile": path}))
+            except Exception as exc:
+                error = str(exc).replace("\n", " ").strip()
+                if is_cookie_error(exc):
+                    ok = False
+                    self._record_sync(path, ok=False)
+                    if not refreshed and self._refreshable(path):
+                        # A fresh export goes back into rotation.
+                        refreshed = refresh_cookies()
+                        ok = refreshed
+                # Other errors (network, the probe video itself) say nothing
+                # about the account.
+            else:
+                self._record_sync(path, ok=True)
+
+        self._update_sync(
+            path,
+            last_check_ms=int(time.time() * 1000),
+            last_check_ok=int(ok),
+            last_error=error[:300],
+        )
+        return {"ok": ok, "error": error or None, "refreshed": refreshed, "expires_at": expires}
+
+    def check_all(self) -> Dict[str, Dict[str, object]]:
+        """Check every file; with Redis one instance per interval does it."""
+        client = get_redis()
+        if client is not None and self.check_interval_seconds:
+            lock_seconds = max(int(self.check_interval_seconds * 0.9), 1)
+            if not client.set(f"{self.key_prefix}check_lock", "1", nx=True, ex=lock_seconds):
+                return {}
+        results = {}
+        for path in self.paths:
+            try:
+                results[path] = self.check(path)
+            except Exception as exc:
+                logger.warning("Checking cookies %s failed: %s", path, exc)
+        return results
+
+    def start(self) -> None:
+        if not self.paths or not self.check_interval_seconds:
+            return
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0) -> None:
+        self._stop_event.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=timeout)
+
+    def _run_loop(self) -> None:
+        # First check shortly after startup, then on the interval.
+        delay = min(30, self.check_interval_seconds)
+        while not self._stop_event.wait(delay):
+            self.check_all()
+            delay = self.check_interval_seconds
+
+    # -- Metrics -----------------------------------------------------------
+
+    def stats(self) -> Dict[str, object]:
+        now_ms, states = self._states_sync()
+        cookies = {}
+        for path, state in zip(self.paths, states):
+            exists = os.path.exists(path)
+            try:
+                expires = login_cookie_expiry(path) if exists else None
+            except OSError:
+                expires = None
+            last_check = float(state.get("last_check_ms") or 0)
+            last_ok = state.get("last_check_ok")
+            cookies[path] = {
+                "exists": exists,
+                "logged_in": expires is not None,
+                "expires_in_seconds": int(expires - now_ms / 1000) if expires else None,
+                "refreshable": self._refreshable(path),
+                "strikes": int(float(state.get("strikes") or 0)),
+                "resting_for_seconds": round(
+                    max(float(state.get("cooldown_until_ms") or 0) - now_ms, 0.0) / 1000, 1
+                ),
+                "successes": int(float(state.get("successes") or 0)),
+                "failures": int(float(state.get("failures") or 0)),
+                "last_check_seconds_ago": int((now_ms - last_check) / 1000) if last_check else None,
+                "last_check_ok": bool(int(last_ok)) if last_ok not in (None, "") else None,
+                "last_error": state.get("last_error") or None,
+            }
+        return {
+            "check_interval_seconds": self.check_interval_seconds,
+            "cookies": cookies,
+        }
+
+
+COOKIE_POOL = CookiePool([YOUTUBE_COOKIES_PATH, *YOUTUBE_COOKIES_PATHS], YOUTUBE_COOKIES_PATH)
@@ -1,30 +1,55 @@
 import asyncio
+import importlib.util
+import logging
 import os
 import time
 import uuid
 from abc import ABC, abstractmethod
-from typing import Optional
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
 from urllib.parse import unquote
 
 import httpx
 
 from app.config import (
     DOWNLOAD_FOLDER,
+    DOWNLOAD_JOB_FLUSH_INTERVAL_SECONDS,
     DOWNLOAD_RETENTION_SECONDS,
     YOUTUBE_MAX_RETRIES,
     YOUTUBE_RETRY_DELAY_SECONDS,
-    YOUTUBE_COOKIES_PATH,
+    YOUTUBE_REMOTE_DIRECT_BUFFER_MB,
     YOUTUBE_REMOTE_ENDPOINT,
+    YOUTUBE_REMOTE_HTTP2,
+    YOUTUBE_REMOTE_SEGMENT_MIN_MB,
+    YOUTUBE_REMOTE_SEGMENTS,
 )
 from app.downloaders.common import download_video
 from app.downloaders.cookie_manager import (
+    COOKIE_POOL,
     can_refresh_cookies,
+    get_cookies_path,
     is_cookie_error,
     refresh_cookies_async,
 )
 from app.services.download_tracker import DOWNLOAD_TRACKER
+from app.services.egress_pool import EGRESS_INFO_KEY, EGRESS_POOL, info_for_egress
+from app.services.faststart import apply_faststart
+from app.services.host_throttle import HOST_THROTTLE, is_throttle_error
+from app.services.media_info import MEDIA_INFO
 from app.utils.file_ops import delete_file_later
 
+logger = logging.getLogger(__name__)
+
+_HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+_REMOTE_TIMEOUT = httpx.Timeout(connect=10.0, read=60.0, write=60.0, pool=10.0)
+_REMOTE_LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=64)
+# Attempts to resume one byte range after a dropped connection.
+_SEGMENT_RETRIES = 2
+# Read size of direct streams; their buffer holds whole chunks.
+_DIRECT_CHUNK_BYTES = 64 * 1024
+# Response headers a direct stream passes on to the client.
+_DIRECT_HEADERS = ("content-length", "content-type", "content-disposition", "content-encoding")
+
 
 def extract_filename_from_disposition(content_disposition: str) -> Optional[str]:
     """Return filename value from a Content-Disposition header if present."""
@@ -47,14 +72,18 @@ def extract_filename_from_disposition(content_disposition: str) -> Optional[str]
     return filename
 
 
-def build_youtube_download_options() -> dict:
-    """Return yt-dlp options for authenticated YouTube downloads when configured."""
-    if not YOUTUBE_COOKIES_PATH:
+def build_youtube_download_options(cookies_path: Optional[str] = None) -> dict:
+    """Return yt-dlp options for authenticated YouTube downloads when configured.
+
+    ``cookies_path`` is a file from ``COOKIE_POOL.acquire()``; it defaults to
+    ``YOUTUBE_COOKIES_PATH``.
+    """
+    cookies_path = cookies_path or get_cookies_path()
+    if not cookies_path:
         return {}
-    cookies_path = os.path.expanduser(YOUTUBE_COOKIES_PATH)
     if not os.path.exists(cookies_path):
         raise FileNotFoundError(
-            f"YOUTUBE_COOKIES_PATH not found: {cookies_path}"
+            f"Cookies file not found: {cookies_path}"
         )
     return {"cookiefile": cookies_path}
 
@@ -113,97 +142,510 @@ def is_retryable_error(error: Exception) -> bool:
     return any(token in message for token in retryable)
 
 
+class _Interrupted(RuntimeError):
+    """The remote response ended before the file was complete."""
+
+
+class _RestartRequired(Exception):
+    """A resume was refused; the file has to be fetched from the start."""
+
+
+@dataclass
+class _Transfer:
+    """One remote file and how much of it is on disk, kept across attempts."""
+
+    file_path: str
+    remote_name: Optional[str]
+    url: httpx.URL
+    total_bytes: Optional[int]
+    # Strong ETag or Last-Modified, sent as If-Range when resuming.
+    validator: Optional[str]
+    ranges: bool
+    segmented: bool
+    # Inclusive byte ranges and how many bytes of each are written.
+    pieces: List[Tuple[int, int]]
+    done: List[int]
+    bytes_resumed: int = 0
+
+    @property
+    def received(self) -> int:
+        return sum(self.done)
+
+    def prefix(self) -> int:
+        """Bytes from the start of the file that are all written."""
+        # The first response always writes from byte 0 onwards.
+        end = self.done[0]
+        for (start, last), done in zip(self.pieces, self.done):
+            if done < last - start + 1:
+                return max(end, start + done)
+        return max(end, self.total_bytes or 0)
+
+    def resumable(self) -> bool:
+        return bool(
+            self.ranges
+            and self.validator
+            and self.total_bytes
+            and 0 < self.received < self.total_bytes
+        )
+
+
+async def _gather_or_cancel(coroutines) -> None:
+    """Run ``coroutines`` together; the first failure cancels the rest."""
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
 class BaseYouTubeDownloader(ABC):
     """Strategy interface for downloading YouTube videos."""
 
     @abstractmethod
-    async def download(self, video_url: str, process_id: str) -> None:
+    async def download(
+        self, video_url: str, process_id: str, quality: Optional[str] = None
+    ) -> None:
         """Download video and update tracker status."""
         raise NotImplementedError
 
+    async def aclose(self) -> None:
+        """Release shared connections (on shutdown)."""
 
-class RemoteYouTubeDownloader(BaseYouTubeDownloader):
-    """Streams downloads through a remote API endpoint."""
 
-    def __init__(self, endpoint: str, download_folder: str) -> None:
+class RemoteYouTubeDownloader(BaseYouTubeDownloader):
+    """Streams downloads through a remote API endpoint.
+
+    Every job in the process shares one keep-alive client (HTTP/2 when
+    available). When the endpoint accepts Range requests and the file is
+    large enough, the first response only supplies the first segment and
+    the rest arrives as parallel byte ranges written into a preallocated
+    file. The ranges use a separate HTTP/1.1 client so each gets its own
+    connection; over HTTP/2 they would share one TCP flow and one
+    per-connection bandwidth cap.
+
+    A transfer that breaks off is retried from where it stopped: the
+    partial file stays, and the missing bytes are requested with ``Range``
+    and ``If-Range``. Only when the endpoint lacks ranges (or a validator)
+    or the file changed does a retry start over.
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        download_folder: str,
+        segments: int = YOUTUBE_REMOTE_SEGMENTS,
+        segment_min_bytes: int = YOUTUBE_REMOTE_SEGMENT_MIN_MB * 1024 * 1024,
+        http2: bool = YOUTUBE_REMOTE_HTTP2,
+        direct_buffer_bytes: int = YOUTUBE_REMOTE_DIRECT_BUFFER_MB * 1024 * 1024,
+    ) -> None:
         self.endpoint = endpoint
         self.download_folder = download_folder
-
-    async def download(self, video_url: str, process_id: str) -> None:
+        self.segments = max(int(segments), 1)
+        self.segment_min_bytes = max(int(segment_min_bytes), 1)
+        self.direct_buffer_bytes = max(int(direct_buffer_bytes), _DIRECT_CHUNK_BYTES)
+        self.http2 = http2 and _HTTP2_AVAILABLE
+        if http2 and not _HTTP2_AVAILABLE:
+            logger.warning("YOUTUBE_REMOTE_HTTP2 is on but h2 is not installed; using HTTP/1.1")
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _client(self, name: str) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Connections belong to the loop that opened them.
+            self._clients = {}
+            self._loop = loop
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                timeout=_REMOTE_TIMEOUT,
+                limits=_REMOTE_LIMITS,
+                http2=self.http2 and name == "main",
+            )
+            self._clients[name] = client
+        return client
+
+    async def aclose(self) -> None:
+        clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            await client.aclose()
+
+    def _segment_bounds(self, response: httpx.Response, total_bytes: Optional[int]):
+        """Byte ranges to fetch in parallel, or None to read the response alone."""
+        if self.segments < 2 or not total_bytes or total_bytes < self.segment_min_bytes:
+            return None
+        if response.headers.get("accept-ranges", "").lower() != "bytes":
+            return None
+        if response.headers.get("content-encoding", "identity") != "identity":
+            return None
+        size = -(-total_bytes // self.segments)
+        return [
+            (start, min(start + size, total_bytes) - 1)
+            for start in range(0, total_bytes, size)
+        ]
+
+    async def open_stream(
+        self, video_url: str, quality: Optional[str] = None
+    ) -> Tuple[Dict[str, str], AsyncIterator[bytes]]:
+        """Open the remote response for a client that receives it directly.
+
+        Returns the headers to pass on and the body, which nothing writes to
+        disk. A reader task fills a buffer of ``direct_buffer_bytes``; while
+        it is full the reader stops, so a slow client slows the remote
+        transfer through TCP flow control instead of growing memory. The
+        body is passed on as received (``Content-Encoding`` included), so
+        ``Content-Length`` stays true.
+        """
         params = {"url": video_url}
-        DOWNLOAD_TRACKER.update_job(process_id, status="running", progress=0.0)
+        if quality:
+            params["quality"] = quality
+        client = self._client("main")
+        request = client.build_request(
+            "GET", self.endpoint, params=params, headers={"Accept-Encoding": "identity"}
+        )
+        try:
+            response = await client.send(request, stream=True, follow_redirects=True)
+        except httpx.RequestError as exc:
+            raise RuntimeError(f"Failed to reach remote API: {exc}") from exc
+        if response.status_code >= 400:
+            error_body = (await response.aread()).decode(errors="ignore")
+            await response.aclose()
+            raise RuntimeError(
+                f"Remote API error ({response.status_code}): {error_body.strip() or 'unexpected response'}"
+            )
+        headers = {
+            name: response.headers[name] for name in _DIRECT_HEADERS if name in response.headers
+        }
+        return headers, self._pipe(response)
+
+    async def _pipe(self, response: httpx.Response) -> AsyncIterator[bytes]:
+        buffer: asyncio.Queue = asyncio.Queue(
+            maxsize=self.direct_buffer_bytes // _DIRECT_CHUNK_BYTES
+        )
 
-        timeout = httpx.Timeout(connect=10.0, read=60.0, write=60.0, pool=10.0)
-        limits = httpx.Limits(max_keepalive_connections=10, max_connections=20)
-        async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        async def read() -> None:
             try:
-                async with client.stream(
-                    "GET", self.endpoint, params=params, follow_redirects=True
-                ) as response:
-                    if response.status_code >= 400:
-                        error_body = (await response.aread()).decode(errors="ignore")
-                        raise RuntimeError(
-                            f"Remote API error ({response.status_code}): {error_body.strip() or 'unexpected response'}"
-                        )
+                async for chunk in response.aiter_raw(_DIRECT_CHUNK_BYTES):
+                    await buffer.put(chunk)
+                await buffer.put(None)
+            except Exception as exc:
+                await buffer.put(exc)
+            finally:
+                await response.aclose()
+
+        reader = asyncio.ensure_future(read())
+        try:
+            while True:
+                item = await buffer.get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise RuntimeError(f"Remote API stream broke off: {item}") from item
+                yield item
+        finally:
+            # Client gone or stream done: stop reading from the remote.
+            reader.cancel()
+            await asyncio.gather(reader, return_exceptions=True)
+
+    def _transfer_for(
+        self, response: httpx.Response, previous: Optional[_Transfer]
+    ) -> _Transfer:
+        """Describe the file ``response`` delivers from byte 0.
+
+        A restart gets a new file rather than rewriting the previous one in
+        place: clients following ``partial_path`` hold the old file open, and
+        seeing the path change is how they learn to stop.
+        """
+        remote_name = extract_filename_from_disposition(
+            response.headers.get("content-disposition", "")
+        )
+        ext = os.path.splitext(remote_name)[1] if remote_name else ".mp4"
+        file_path = os.path.join(self.download_folder, f"{uuid.uuid4().hex}{ext}")
+        if previous and os.path.exists(previous.file_path):
+            os.remove(previous.file_path)
+
+        total_bytes_header = response.headers.get("content-length")
+        total_bytes = int(total_bytes_header) if total_bytes_header else None
+        etag = response.headers.get("etag")
+        # If-Range only takes a strong ETag; Last-Modified is the fallback.
+        validator = (
+            etag if etag and not etag.startswith("W/") else response.headers.get("last-modified")
+        )
+        bounds = self._segment_bounds(response, total_bytes)
+        pieces = bounds or [(0, (total_bytes or 0) - 1)]
+        return _Transfer(
+            file_path=file_path,
+            remote_name=remote_name,
+            url=response.url,
+            total_bytes=total_bytes,
+            validator=validator,
+            ranges=(
+                response.headers.get("accept-ranges", "").lower() == "bytes"
+                and response.headers.get("content-encoding", "identity") == "identity"
+            ),
+            segmented=bounds is not None,
+            pieces=pieces,
+            done=[0] * len(pieces),
+            bytes_resumed=previous.bytes_resumed if previous else 0,
+        )
 
-                    remote_name = extract_filename_from_disposition(
-                        response.headers.get("content-disposition", "")
-                    )
-                    ext = os.path.splitext(remote_name)[1] if remote_name else ".mp4"
-                    filename = f"{uuid.uuid4().hex}{ext}"
-                    file_path = os.path.join(self.download_folder, filename)
+    async def download(
+        self, video_url: str, process_id: str, quality: Optional[str] = None
+    ) -> None:
+        params = {"url": video_url}
+        if quality:
+            params["quality"] = quality
+        DOWNLOAD_TRACKER.update_job(process_id, status="running", progress=0.0)
 
-                    total_bytes_header = response.headers.get("content-length")
-                    total_bytes = int(total_bytes_header) if total_bytes_header else None
-                    if total_bytes:
-                        DOWNLOAD_TRACKER.update_job(
-                            process_id, total_bytes=total_bytes, progress=0.0
-                        )
+        transfer: Optional[_Transfer] = None
+        published = 0.0
+
+        def report(bytes_downloaded: int) -> None:
+            nonlocal published
+            total_bytes = transfer.total_bytes
+            progress = (
+                (bytes_downloaded / total_bytes) * 100
+                if total_bytes
+                else 0.0
+            )
+            # Buffered by the tracker; flushed on its own tick.
+            DOWNLOAD_TRACKER.update_job(
+                process_id,
+                bytes_downloaded=bytes_downloaded,
+                progress=progress,
+            )
+            now = time.monotonic()
+            if transfer.segmented and now - published >= DOWNLOAD_JOB_FLUSH_INTERVAL_SECONDS:
+                # Ranges land out of order; readers of the partial file
+                # stop at the written prefix.
+                published = now
+                DOWNLOAD_TRACKER.update_job(process_id, partial_bytes=transfer.prefix())
 
-                    bytes_downloaded = 0
-                    last_update_time = 0.0
-                    last_progress_bucket = -1
-                    last_bytes_reported = 0
-                    with open(file_path, "wb") as file_handle:
-                        async for chunk in response.aiter_bytes():
-                            if chunk:
-                                file_handle.write(chunk)
-                                bytes_downloaded += len(chunk)
-                                progress = (
-                                    (bytes_downloaded / total_bytes) * 100
-                                    if total_bytes
-                                    else 0.0
+        attempt = 0
+        try:
+            while True:
+                try:
+                    if transfer is not None and transfer.resumable():
+                        # Keep what the partial file already holds.
+                        with open(transfer.file_path, "r+b") as file_handle:
+                            await self._resume(transfer, file_handle.fileno(), report)
+                        break
+
+                    async with self._client("main").stream(
+                        "GET", self.endpoint, params=params, follow_redirects=True
+                    ) as response:
+                        if response.status_code >= 400:
+                            error_body = (await response.aread()).decode(errors="ignore")
+                            raise RuntimeError(
+                                f"Remote API error ({response.status_code}): {error_body.strip() or 'unexpected response'}"
+                            )
+
+                        transfer = self._transfer_for(response, transfer)
+                        started = {
+                            "progress": 0.0,
+                            # The file can be followed while it downloads.
+                            "partial_path": transfer.file_path,
+                            "partial_bytes": 0 if transfer.segmented else None,
+                            "suggested_name": transfer.remote_name
+                            or os.path.basename(transfer.file_path),
+                        }
+                        if transfer.total_bytes:
+                            started["total_bytes"] = transfer.total_bytes
+                        DOWNLOAD_TRACKER.update_job(process_id, **started)
+
+                        with open(transfer.file_path, "wb") as file_handle:
+                            if transfer.segmented:
+                                await self._fetch_segments(
+                                    response, file_handle.fileno(), transfer, report
                                 )
-                                now = time.monotonic()
-                                progress_bucket = int(progress)
-                                should_emit = False
-                                if progress_bucket != last_progress_bucket:
-                                    should_emit = True
-                                elif bytes_downloaded - last_bytes_reported >= 1024 * 1024:
-                                    should_emit = True
-                                elif now - last_update_time >= 0.75:
-                                    should_emit = True
-
-                                if should_emit:
-                                    last_update_time = now
-                                    last_progress_bucket = progress_bucket
-                                    last_bytes_reported = bytes_downloaded
-                                    DOWNLOAD_TRACKER.update_job(
-                                        process_id,
-                                        bytes_downloaded=bytes_downloaded,
-                                        progress=progress,
-                                    )
-            except httpx.RequestError as exc:
+                            else:
+                                async for chunk in response.aiter_bytes():
+                                    if chunk:
+                                        file_handle.write(chunk)
+                                        transfer.done[0] += len(chunk)
+                                        report(transfer.done[0])
+                    if transfer.total_bytes and transfer.received < transfer.total_bytes:
+                        raise _Interrupted("Remote API closed the download early")
+                    break
+                except _RestartRequired:
+                    # No resume possible for this file; fetch it again from byte 0.
+                    logger.info("Remote API did not resume %s; restarting it", transfer.url)
+                    transfer.ranges = False
+                except (httpx.TransportError, _Interrupted) as exc:
+                    attempt += 1
+                    if attempt > max(YOUTUBE_MAX_RETRIES, 0):
+                        raise
+                    DOWNLOAD_TRACKER.update_job(process_id, status="retrying", error=str(exc))
+                    await asyncio.sleep(YOUTUBE_RETRY_DELAY_SECONDS * attempt)
+                    DOWNLOAD_TRACKER.update_job(process_id, status="running", error=None)
+        except BaseException as exc:
+            # Failed or cancelled: don't leave a partial file behind.
+            if transfer is not None and os.path.exists(transfer.file_path):
+                os.remove(transfer.file_path)
+            if isinstance(exc, httpx.RequestError):
                 raise RuntimeError(f"Failed to reach remote API: {exc}") from exc
-
+            raise
+
+        if transfer.bytes_resumed:
+            logger.info(
+                "Remote download %s resumed; %d bytes not fetched again",
+                process_id,
+                transfer.bytes_resumed,
+            )
         DOWNLOAD_TRACKER.update_job(
             process_id,
             status="completed",
             progress=100.0,
-            file_path=file_path,
-            suggested_name=remote_name or filename,
+            bytes_downloaded=transfer.received,
+            total_bytes=transfer.received,
+            file_path=transfer.file_path,
+            suggested_name=transfer.remote_name or os.path.basename(transfer.file_path),
+            bytes_resumed=transfer.bytes_resumed or None,
+        )
+        delete_file_later(transfer.file_path, delay=DOWNLOAD_RETENTION_SECONDS)
+
+    async def _resume(
+        self, transfer: _Transfer, fd: int, report: Callable[[int], None]
+    ) -> None:
+        """Fetch the pieces ``transfer`` is missing as Range requests.
+
+        Each request carries ``If-Range`` with the file's validator; a
+        response other than ``206`` for exactly the asked range (the file
+        changed, or ranges are no longer honoured) raises ``_RestartRequired``.
+        """
+        saved = transfer.received
+        counted = False
+
+        async def fetch(index: int) -> None:
+            nonlocal counted
+            start, end = transfer.pieces[index]
+            offset = start + transfer.done[index]
+            last = end + 1 == transfer.total_bytes
+            headers = {
+                "Range": f"bytes={offset}-" if last else f"bytes={offset}-{end}",
+                "If-Range": transfer.validator,
+            }
+            async with self._client("ranges").stream("GET", transfer.url, headers=headers) as part:
+                expected = f"bytes {offset}-{end}/{transfer.total_bytes}"
+                if part.status_code != 206 or part.headers.get("content-range") != expected:
+                    raise _RestartRequired()
+                if not counted:
+                    counted = True
+                    transfer.bytes_resumed += saved
+                async for chunk in part.aiter_bytes():
+                    chunk = chunk[: end + 1 - offset]
+                    os.pwrite(fd, chunk, offset)
+                    offset += len(chunk)
+                    transfer.done[index] = offset - start
+                    report(transfer.received)
+            if offset <= end:
+                raise _Interrupted("Remote API closed a range early")
+
+        await _gather_or_cancel(
+            [
+                fetch(index)
+                for index, (start, end) in enumerate(transfer.pieces)
+                if start + transfer.done[index] <= end
+            ]
         )
-        delete_file_later(file_path, delay=DOWNLOAD_RETENTION_SECONDS)
+
+    async def _fetch_segments(
+        self,
+        response: httpx.Response,
+        fd: int,
+        transfer: _Transfer,
+        report: Callable[[int], None],
+    ) -> None:
+        """Fill ``fd`` from ``response`` (first range) plus parallel Range requests.
+
+        Until every range request has answered 206 for the same file, the
+        first response is not cut off; if any of them does not, the ranges
+        are abandoned and the first response is read to the end instead.
+        """
+        total_bytes = transfer.total_bytes
+        try:
+            os.posix_fallocate(fd, 0, total_bytes)
+        except (AttributeError, OSError):
+            os.ftruncate(fd, total_bytes)
+
+        url = transfer.url
+        validator = transfer.validator
+        bounds = transfer.pieces
+        done = transfer.done
+        verified: set = set()
+        ranges_ok: asyncio.Future = asyncio.get_running_loop().create_future()
+
+        def settle(ok: bool) -> None:
+            if not ranges_ok.done():
+                ranges_ok.set_result(ok)
+                # A later attempt cannot resume pieces the server ignored.
+                transfer.ranges = ok
+
+        def abandoned() -> bool:
+            return ranges_ok.done() and not ranges_ok.result()
+
+        async def first() -> None:
+            offset, end = 0, bounds[0][1] + 1
+            async for chunk in response.aiter_bytes():
+                if offset + len(chunk) >= end and not ranges_ok.done():
+                    await ranges_ok
+                if not abandoned():
+                    chunk = chunk[: end - offset]
+                if chunk:
+                    os.pwrite(fd, chunk, offset)
+                    offset += len(chunk)
+                    done[0] = offset
+                    report(sum(done))
+                if not abandoned() and offset >= end:
+                    return
+            if offset < (total_bytes if abandoned() else end):
+                raise _Interrupted("Remote API closed the download early")
+
+        async def fetch(index: int, start: int, end: int) -> None:
+            offset, attempts = start, 0
+            while offset <= end:
+                headers = {"Range": f"bytes={offset}-{end}"}
+                if validator:
+                    headers["If-Range"] = validator
+                try:
+                    async with self._client("ranges").stream("GET", url, headers=headers) as part:
+                        expected = f"bytes {offset}-{end}/{total_bytes}"
+                        if part.status_code != 206 or part.headers.get("content-range") != expected:
+                            # Range ignored, or the file changed.
+                            settle(False)
+                            return
+                        verified.add(index)
+                        if len(verified) == len(bounds) - 1:
+                            settle(True)
+                        async for chunk in part.aiter_bytes():
+                            if abandoned():
+                                done[index] = 0  # the first response rewrites it
+                                return
+                            chunk = chunk[: end + 1 - offset]
+                            os.pwrite(fd, chunk, offset)
+                            offset += len(chunk)
+                            done[index] = offset - start
+                            report(sum(done))
+                except httpx.TransportError:
+                    attempts += 1
+                    if attempts > _SEGMENT_RETRIES:
+                        raise
+                    # Resume the range where it stopped.
+                    continue
+                if offset <= end:
+                    attempts += 1
+                    if attempts > _SEGMENT_RETRIES:
+                        raise _Interrupted("Remote API closed a range early")
+
+        await _gather_or_cancel(
+            [first()] + [fetch(index, start, end) for index, (start, end) in enumerate(bounds) if index]
+        )
+        if abandoned():
+            logger.info("Remote API ignored Range requests; read %s in one stream", url)
+            transfer.pieces, transfer.done = [(0, total_bytes - 1)], [total_bytes]
 
 
 class LocalYouTubeDownloader(BaseYouTubeDownloader):
@@ -212,68 +654,69 @@ class LocalYouTubeDownloader(BaseYouTubeDownloader):
     def __init__(self, download_folder: str) -> None:
         self.download_folder = download_folder
 
-    async def download(self, video_url: str, process_id: str) -> None:
+    async def download(
+        self, video_url: str, process_id: str, quality: Optional[str] = None
+    ) -> None:
         output_template = os.path.join(
             self.download_folder, "%(id)s_%(title)s.%(ext)s"
         )
         DOWNLOAD_TRACKER.update_job(process_id, status="running", progress=0.0)
-        custom_options = build_youtube_download_options()
+        cookies_path = await COOKIE_POOL.acquire()
+        cookies_tried = {cookies_path}
+        custom_options = build_youtube_download_options(cookies_path)
 
-        last_update_time = 0.0
-        last_progress_bucket = -1
-        last_bytes_reported = 0
+        hook = DOWNLOAD_TRACKER.progress_hook(process_id)
         cookies_refreshed = False
-
-        def hook(data):
-            nonlocal last_update_time, last_progress_bucket, last_bytes_reported
-            status = data.get("status")
-            if status == "downloading":
-                downloaded = int(data.get("downloaded_bytes") or 0)
-                total = data.get("total_bytes") or data.get("total_bytes_estimate")
-                progress = (
-                    (downloaded / total) * 100 if total and total > 0 else 0.0
-                )
-
-                now = time.monotonic()
-                progress_bucket = int(progress)
-                should_emit = False
-                if progress_bucket != last_progress_bucket:
-                    should_emit = True
-                elif downloaded - last_bytes_reported >= 1024 * 1024:
-                    should_emit = True
-                elif now - last_update_time >= 0.75:
-                    should_emit = True
-
-                if not should_emit:
-                    return
-
-                last_update_time = now
-                last_progress_bucket = progress_bucket
-                last_bytes_reported = downloaded
-
-                DOWNLOAD_TRACKER.update_job(
-                    process_id,
-                    bytes_downloaded=downloaded,
-                    total_bytes=int(total) if total else None,
-                    progress=progress,
-                )
-            elif status == "finished":
-                DOWNLOAD_TRACKER.update_job(process_id, progress=100.0)
+        # Info from an earlier /youtube/info probe skips extraction.
+        info = await MEDIA_INFO.cached("youtube", video_url)
 
         attempt = 0
         while True:
             try:
-                file_path = await asyncio.to_thread(
-                    download_video,
-                    video_url,
-                    output_template,
-                    custom_options,
-                    hook,
-                )
+                # Each attempt picks an egress afresh, so retries move off a failing one.
+                pinned = (info or {}).get(EGRESS_INFO_KEY)
+                async with EGRESS_POOL.use("youtube", prefer=pinned) as lease:
+                    info = info_for_egress(info, lease)
+                    file_path = await download_video(
+                        video_url,
+                        output_template,
+                        custom_options,
+                        hook,
+                        info=info,
+                        quality=quality,
+                        egress=lease.egress,
+                    )
+                    lease.bytes = os.path.getsize(file_path)
+                await COOKIE_POOL.record(cookies_path, ok=True)
                 break
             except Exception as exc:
+                if info is not None:
+                    # Retries extract afresh.
+                    info = None
+                    await MEDIA_INFO.forget("youtube", video_url)
+                if is_cookie_error(exc) and cookies_path:
+                    await COOKIE_POOL.record(cookies_path, ok=False)
+                    # Another account first: no refresh wait, and the
+                    # refresh rate limit stays free for the background check.
+                    next_path = await COOKIE_POOL.acquire(exclude=cookies_tried)
+                    if next_path:
+                        cookies_path = next_path
+                        cookies_tried.add(next_path)
+                        custom_options = build_youtube_download_options(cookies_path)
+                        DOWNLOAD_TRACKER.update_job(
+                            process_id,
+                            status="retrying",
+                            error="Cookies were rejected, retrying with another account...",
+                            progress=0.0,
+                        )
+                        continue
                 # Try refreshing cookies if this looks like a cookie error
-                if not cookies_refreshed and is_cookie_error(exc) and can_refresh_cookies():
+                if (
+                    not cookies_refreshed
+                    and is_cookie_error(exc)
+                    and can_refresh_cookies()
+                    and cookies_path == get_cookies_path()
+                ):
                     DOWNLOAD_TRACKER.update_job(
                         process_id,
                         status="refreshing_cookies",
@@ -284,7 +727,7 @@ class LocalYouTubeDownloader(BaseYouTubeDownloader):
                     cookies_refreshed = True
                     if refreshed:
                         # Reload options with fresh cookies
-                        custom_options = build_youtube_download_options()
+                        custom_options = build_youtube_download_options(cookies_path)
                         DOWNLOAD_TRACKER.update_job(
                             process_id,
                             status="retrying",
@@ -302,6 +745,9 @@ class LocalYouTubeDownloader(BaseYouTubeDownloader):
                     raise
 
                 delay = YOUTUBE_RETRY_DELAY_SECONDS * attempt
+                if is_throttle_error(exc):
+                    # Also narrows and pauses starts of every other YouTube job.
+                    delay = max(delay, await HOST_THROTTLE.record("youtube", throttled=True))
                 DOWNLOAD_TRACKER.update_job(
                     process_id,
                     status="retrying",
@@ -310,10 +756,14 @@ class LocalYouTubeDownloader(BaseYouTubeDownloader):
                 )
                 await asyncio.sleep(delay)
 
+        await apply_faststart(process_id, file_path)
+        size = os.path.getsize(file_path)
         DOWNLOAD_TRACKER.update_job(
             process_id,
             status="completed",
             progress=100.0,
+            bytes_downloaded=size,
+            total_bytes=size,
             file_path=file_path,
             suggested_name=os.path.basename(file_path),
         )
@@ -0,0 +1,354 @@
+"""Long-lived yt-dlp worker processes.
+
+Starting the ``yt-dlp`` executable per download pays interpreter startup and
+extractor imports every time. Each worker here imports ``yt_dlp`` once and
+then runs downloads (or extraction-only probes) sent over a pipe, using the
+same command-line arguments as the subprocess path (``yt_dlp.parse_options``,
+including ``--load-info-json``), and streams progress hooks back to the caller.
+
+Async callers hold ``slot()`` around a pool call (``extract_async`` does):
+they wait for a free worker on the event loop and only then take a thread from the default
+executor, which they share with tracker reads, lease renewals and the like.
+Downloads and extraction-only probes have separate pools (``YTDLP_POOL``,
+``YTDLP_PROBE_POOL``).
+
+A worker is replaced after ``YTDLP_WORKER_MAX_JOBS`` downloads, when its
+resident memory exceeds ``YTDLP_WORKER_MAX_RSS_MB``, on timeout, or if it dies.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import weakref
+from typing import Callable, Dict, List, Optional
+
+from app.config import (
+    YTDLP_PROBE_WORKERS,
+    YTDLP_WORKER_MAX_JOBS,
+    YTDLP_WORKER_MAX_RSS_MB,
+    YTDLP_WORKERS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Minimum spacing of "downloading" progress messages sent by a worker.
+_PROGRESS_INTERVAL_SECONDS = 0.2
+_PROGRESS_KEYS = (
+    "status",
+    "downloaded_bytes",
+    "total_bytes",
+    "total_bytes_estimate",
+    "filename",
+    "tmpfilename",
+    "fragment_count",
+    "speed",
+    "eta",
+)
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as handle:
+            return int(handle.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _worker_main(conn) -> None:
+    """Worker process loop: ``(url, args, download)`` in, progress/result messages out."""
+    # Own process group, so a kill also reaches ffmpeg children.
+    os.setsid()
+    import yt_dlp
+
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+        url, args, download = request
+
+        last_sent = 0.0
+
+        def hook(data: Dict) -> None:
+            nonlocal last_sent
+            now = time.monotonic()
+            if data.get("status") == "downloading" and now - last_sent < _PROGRESS_INTERVAL_SECONDS:
+                return
+            last_sent = now
+            message = {key: data.get(key) for key in _PROGRESS_KEYS}
+            message["format_id"] = (data.get("info_dict") or {}).get("format_id")
+            conn.send(("progress", message))
+
+        final_paths = []
+        selected = {}
+
+        def pp_hook(data: Dict) -> None:
+            # Post-processors (MoveFiles always runs) see the final info dict,
+            # also when it was loaded with --load-info-json.
+            if data.get("status") == "finished":
+                selected["format"] = (data.get("info_dict") or {}).get("format")
+
+        try:
+            parsed = yt_dlp.parse_options(list(args) + ([url] if url else []))
+            ydl_opts = parsed.ydl_opts
+            ydl_opts.update(
+                {
+                    "ignoreerrors": False,
+                    "quiet": True,
+                    "noprogress": True,
+                    "forcejson": False,
+                    "progress_hooks": [hook],
+                    "post_hooks": [final_paths.append],
+                    "postprocessor_hooks": [pp_hook],
+                }
+            )
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                if not download:
+                    info = ydl.extract_info(url, download=False)
+                    if not info:
+                        raise RuntimeError("Extraction failed")
+                    conn.send(("done", ydl.sanitize_info(info), _rss_bytes()))
+                    continue
+                if parsed.options.load_info_filename:
+                    # Falls back to extracting from the page if the saved
+                    # format URLs no longer work.
+                    ydl.download_with_info_file(parsed.options.load_info_filename)
+                    info = {"requested_downloads": [{"filepath": path} for path in final_paths]}
+                else:
+                    info = ydl.extract_info(url, download=True)
+            if not info:
+                raise RuntimeError("Download failed")
+            requested = info.get("requested_downloads") or []
+            result = {
+                "requested_downloads": [
+                    {"filepath": item.get("filepath"), "filename": item.get("filename")}
+                    for item in requested
+                    if isinstance(item, dict)
+                ],
+                "_filename": info.get("_filename"),
+                "format": selected.get("format") or info.get("format"),
+            }
+            conn.send(("done", result, _rss_bytes()))
+        except Exception as exc:
+            message = str(exc).replace("\n", " ").strip() or exc.__class__.__name__
+            conn.send(("error", message, _rss_bytes()))
+
+
+class _Worker:
+    __slots__ = ("process", "conn", "jobs")
+
+    def __init__(self, context) -> None:
+        parent_conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn,), name="yt-dlp-worker", daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.jobs = 0
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except (OSError, BrokenPipeError):
+            pass
+        self.process.join(timeout=1.0)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(timeout=1.0)
+        self.conn.close()
+
+    def kill(self) -> None:
+        """Stop a worker in the middle of a download, children included."""
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            self.process.kill()
+        self.process.join(timeout=1.0)
+        self.conn.close()
+
+
+class YtDlpWorkerPool:
+    def __init__(
+        self,
+        size: int = YTDLP_WORKERS,
+        max_jobs: int = YTDLP_WORKER_MAX_JOBS,
+        max_rss_mb: int = YTDLP_WORKER_MAX_RSS_MB,
+    ) -> None:
+        self.size = max(int(size), 0)
+        self.max_jobs = max(int(max_jobs), 1)
+        self.max_rss_bytes = max(int(max_rss_mb), 0) * 1024 * 1024
+        self._condition = threading.Condition()
+        self._idle: List[_Worker] = []
+        self._started = 0
+        self._closed = False
+        self._context = None
+        # Free workers as seen by each event loop (see slot).
+        self._slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0 and not self._closed
+
+    def _get_context(self):
+        if self._context is None:
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                self._context = multiprocessing.get_context("forkserver")
+                # The fork server imports yt_dlp once; each worker inherits it.
+                self._context.set_forkserver_preload(["yt_dlp"])
+            else:
+                self._context = multiprocessing.get_context("spawn")
+        return self._context
+
+    def _checkout(self) -> _Worker:
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError("yt-dlp worker pool is closed")
+                if self._idle:
+                    return self._idle.pop()
+                if self._started < self.size:
+                    self._started += 1
+                    break
+                self._condition.wait()
+        try:
+            return _Worker(self._get_context())
+        except Exception:
+            with self._condition:
+                self._started -= 1
+                self._condition.notify()
+            raise
+
+    def _checkin(self, worker: _Worker, reusable: bool, busy: bool = False) -> None:
+        with self._condition:
+            if reusable and not self._closed:
+                self._idle.append(worker)
+                self._condition.notify()
+                return
+            self._started -= 1
+            self._condition.notify()
+        if busy:
+            worker.kill()
+        else:
+            worker.stop()
+
+    def prestart(self) -> None:
+        """Start every worker now instead of on first use."""
+        workers = [self._checkout() for _ in range(self.size)]
+        for worker in workers:
+            self._checkin(worker, True)
+
+    def download(
+        self,
+        url: Optional[str],
+        args: List[str],
+        progress_callback: Optional[Callable[[Dict], None]] = None,
+        timeout: float = 600.0,
+        cancel_event: Optional[threading.Event] = None,
+    ) -> Dict:
+        """Run one download on a worker and return its (trimmed) info dict.
+
+        ``url`` may be None when ``args`` has ``--load-info-json``. Setting
+        ``cancel_event`` kills the worker (and its ffmpeg children) within
+        half a second.
+        """
+        return self._run((url, list(args), True), progress_callback, timeout, cancel_event)
+
+    def extract(self, url: str, args: List[str], timeout: float = 120.0) -> Dict:
+        """Run extraction only on a worker and return the full info dict."""
+        return self._run((url, list(args), False), None, timeout, None)
+
+    def slot(self) -> asyncio.Semaphore:
+        """This event loop's count of free workers; hold it around a pool call
+        so jobs beyond the pool size wait here instead of in a thread."""
+        loop = asyncio.get_running_loop()
+        slots = self._slots.get(loop)
+        if slots is None:
+            slots = self._slots[loop] = asyncio.Semaphore(max(self.size, 1))
+        return slots
+
+    async def extract_async(self, url: str, args: List[str], timeout: float = 120.0) -> Dict:
+        """``extract`` in a thread, once a worker is free."""
+        async with self.slot():
+            return await asyncio.to_thread(self.extract, url, args, timeout)
+
+    def _run(
+        self,
+        request: tuple,
+        progress_callback: Optional[Callable[[Dict], None]],
+        timeout: float,
+        cancel_event: Optional[threading.Event],
+    ) -> Dict:
+        worker = self._checkout()
+        reusable = False
+        busy = True
+        try:
+            if cancel_event is not None and cancel_event.is_set():
+                # Cancelled while waiting for this worker: send nothing.
+                reusable, busy = True, False
+                raise RuntimeError("Download cancelled")
+            try:
+                worker.conn.send(request)
+            except OSError:
+                raise RuntimeError("yt-dlp worker exited unexpectedly") from None
+            deadline = time.monotonic() + timeout
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise RuntimeError("Download cancelled")
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"Download timed out after {timeout / 60:g} minutes")
+                if not worker.conn.poll(min(remaining, 0.5)):
+                    continue
+                try:
+                    message = worker.conn.recv()
+                except (EOFError, OSError):
+                    raise RuntimeError("yt-dlp worker exited unexpectedly") from None
+
+                kind = message[0]
+                if kind == "progress":
+                    if progress_callback:
+                        progress_callback(message[1])
+                    continue
+
+                busy = False
+                worker.jobs += 1
+                rss = message[2]
+                reusable = worker.jobs < self.max_jobs and (
+                    not self.max_rss_bytes or rss < self.max_rss_bytes
+                )
+                if not reusable:
+                    logger.info(
+                        "Recycling yt-dlp worker after %d jobs (%.0f MB resident)",
+                        worker.jobs, rss / 1024 / 1024,
+                    )
+                if kind == "error":
+                    raise RuntimeError(message[1])
+                return message[1]
+        finally:
+            self._checkin(worker, reusable, busy)
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._started -= len(idle)
+            self._condition.notify_all()
+        for worker in idle:
+            worker.stop()
+
+
+YTDLP_POOL = YtDlpWorkerPool()
+YTDLP_PROBE_POOL = YtDlpWorkerPool(size=YTDLP_PROBE_WORKERS)
@@ -1,29 +1,292 @@
+import asyncio
+import mimetypes
 import os
+from typing import List, Optional
 
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
 
+from app.config import (
+    DOWNLOAD_BATCH_MAX_ENTRIES,
+    DOWNLOAD_FILE_OFFLOAD,
+    DOWNLOAD_FOLLOW_PARTIAL,
+    DOWNLOAD_STATUS_BATCH_MAX,
+    JOB_EVENTS_HEARTBEAT_SECONDS,
+)
+from app.downloaders.common import normalize_quality
+from app.downloaders.cookie_manager import COOKIE_POOL
+from app.routes.youtube import is_allowed_youtube_url
+from app.services.batch_downloads import BATCH_KIND, create_batch, stream_zip, zip_entries
+from app.services.download_scheduler import DOWNLOAD_SCHEDULER, client_identity
 from app.services.download_tracker import DOWNLOAD_TRACKER
+from app.services.egress_pool import EGRESS_POOL
+from app.services.file_follow import follow_job_file
+from app.services.host_throttle import HOST_THROTTLE
+from app.services.job_cancel import CANCELLED, cancel_job
+from app.services.job_events import format_sse, iter_job_states
+from app.services.media_cache import MEDIA_CACHE
 from app.utils.file_ops import ascii_filename
+from app.utils.file_serving import serve_file
 
 router = APIRouter(prefix="/downloads", tags=["Download Jobs"])
 
 
+def _parse_event_id(raw: Optional[str]) -> Optional[int]:
+    if not raw:
+        return None
+    try:
+        return int(raw)
+    except ValueError:
+        return None
+
+
+class BatchStatusRequest(BaseModel):
+    process_ids: List[str]
+
+
+@router.post("/batch")
+async def get_download_statuses(body: BatchStatusRequest):
+    """Return the status of many jobs in one call (one Redis round trip)."""
+    process_ids = list(dict.fromkeys(pid for pid in body.process_ids if pid))
+    if len(process_ids) > DOWNLOAD_STATUS_BATCH_MAX:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {DOWNLOAD_STATUS_BATCH_MAX} process ids per request.",
+        )
+
+    jobs = await asyncio.to_thread(DOWNLOAD_TRACKER.get_jobs, process_ids)
+    DOWNLOAD_TRACKER.mark_polled(jobs)
+    found = {}
+    not_found = []
+    for process_id in process_ids:
+        job = jobs.get(process_id)
+        if job:
+            found[process_id] = DOWNLOAD_TRACKER.job_payload(job)
+        else:
+            not_found.append(process_id)
+    return {"jobs": found, "not_found": not_found}
+
+
+class PlaylistDownloadRequest(BaseModel):
+    source: str = "youtube"
+    # A playlist (or channel) URL, or a list of video URLs.
+    url: Optional[str] = None
+    urls: List[str] = []
+    quality: Optional[str] = None
+
+
+@router.post("/playlist")
+async def request_playlist_download(body: PlaylistDownloadRequest, request: Request):
+    """Download a playlist's videos, or many URLs, as one batch job.
+
+    Returns the parent ``process_id``; its ``children`` are the entry jobs
+    once the entry list is known. See ``app/services/batch_downloads.py``.
+    """
+    if body.source not in DOWNLOAD_SCHEDULER.limits:
+        raise HTTPException(status_code=400, detail=f"Unknown source '{body.source}'.")
+    urls = list(dict.fromkeys(url.strip() for url in body.urls if url.strip()))
+    if bool(body.url) == bool(urls):
+        raise HTTPException(status_code=400, detail="Send either url or urls.")
+    if len(urls) > DOWNLOAD_BATCH_MAX_ENTRIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {DOWNLOAD_BATCH_MAX_ENTRIES} URLs per batch.",
+        )
+    if body.source == "youtube" and not all(
+        is_allowed_youtube_url(url) for url in urls or [body.url]
+    ):
+        raise HTTPException(status_code=400, detail="Only public YouTube URLs are allowed.")
+    try:
+        quality = normalize_quality(body.quality)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    client_key, premium = client_identity(request)
+    process_id = create_batch(body.source, body.url, urls, quality, client_key, premium)
+    return {"process_id": process_id}
+
+
+@router.get("/cache/stats")
+async def get_media_cache_stats():
+    """Media cache size, hit rate and bytes saved (cluster totals with Redis)."""
+    return await asyncio.to_thread(MEDIA_CACHE.stats)
+
+
+@router.get("/throttle/stats")
+async def get_throttle_stats():
+    """Live per-host concurrency limit, start tokens and throttle counts."""
+    return await asyncio.to_thread(HOST_THROTTLE.stats)
+
+
+@router.get("/egress/stats")
+async def get_egress_stats():
+    """Per-egress health and throughput for each site, and cooldowns."""
+    return await asyncio.to_thread(EGRESS_POOL.stats)
+
+
+@router.get("/cookies/stats")
+async def get_cookie_stats():
+    """Health of each YouTube cookies file (never the cookies themselves)."""
+    return await asyncio.to_thread(COOKIE_POOL.stats)
+
+
 @router.get("/{process_id}")
 async def get_download_status(process_id: str):
     payload = DOWNLOAD_TRACKER.serialize_job(process_id)
     if not payload:
         raise HTTPException(status_code=404, detail="Process not found")
+    DOWNLOAD_TRACKER.mark_polled([process_id])
     return payload
 
 
+@router.delete("/{process_id}")
+async def cancel_download(process_id: str):
+    """Cancel a queued or running job.
+
+    A queued job leaves the queue at once; a running one is stopped by
+    whichever worker runs it, which also removes its partial files. A
+    download other requests share only stops for this caller.
+    """
+    job = DOWNLOAD_TRACKER.get_job(process_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Process not found")
+    if DOWNLOAD_TRACKER.is_terminal(job.status) or job.detached:
+        status = CANCELLED if job.detached else job.status
+        raise HTTPException(status_code=409, detail=f"Job already {status}")
+
+    cancelled = cancel_job(process_id, "Cancelled by user")
+    if cancelled is None:
+        # It ended between the read above and the cancel.
+        job = DOWNLOAD_TRACKER.get_job(process_id)
+        raise HTTPException(status_code=409, detail=f"Job already {job.status if job else 'gone'}")
+    if cancelled:
+        await DOWNLOAD_SCHEDULER.cancel(job.source, process_id)
+    return DOWNLOAD_TRACKER.serialize_job(process_id)
+
+
+@router.get("/{process_id}/events")
+async def stream_download_status(process_id: str, request: Request, last_event_id: Optional[str] = None):
+    """Stream job state changes as Server-Sent Events.
+
+    Each event carries the full status payload; its id is the job version, so
+    reconnecting clients resume via the standard Last-Event-ID header (or the
+    ``last_event_id`` query parameter). The stream closes on a terminal state.
+    """
+
+    if not DOWNLOAD_TRACKER.get_job(process_id):
+        raise HTTPException(status_code=404, detail="Process not found")
+
+    resume_from = _parse_event_id(request.headers.get("last-event-id") or last_event_id)
+
+    async def event_stream():
+        yield "retry: 3000\n\n"
+        async for kind, payload in iter_job_states(
+            DOWNLOAD_TRACKER, process_id, resume_from, JOB_EVENTS_HEARTBEAT_SECONDS
+        ):
+            if await request.is_disconnected():
+                return
+            DOWNLOAD_TRACKER.mark_polled([process_id])
+            if kind == "heartbeat":
+                yield format_sse("heartbeat")
+            else:
+                yield format_sse("status", payload, event_id=payload.get("version"))
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=headers)
+
+
+@router.websocket("/{process_id}/ws")
+async def websocket_download_status(websocket: WebSocket, process_id: str):
+    """WebSocket variant of the event stream; messages are JSON objects."""
+    await websocket.accept()
+    resume_from = _parse_event_id(websocket.query_params.get("last_event_id"))
+
+    if not DOWNLOAD_TRACKER.get_job(process_id):
+        await websocket.send_json({"type": "error", "detail": "Process not found"})
+        await websocket.close(code=4404)
+        return
+
+    try:
+        async for kind, payload in iter_job_states(
+            DOWNLOAD_TRACKER, process_id, resume_from, JOB_EVENTS_HEARTBEAT_SECONDS
+        ):
+            DOWNLOAD_TRACKER.mark_polled([process_id])
+            if kind == "heartbeat":
+                await websocket.send_json({"type": "heartbeat"})
+            else:
+                await websocket.send_json({"type": "status", "data": payload})
+    except WebSocketDisconnect:
+        return
+    await websocket.close()
+
+
 @router.get("/{process_id}/file")
-async def get_downloaded_file(process_id: str):
+async def get_downloaded_file(process_id: str, request: Request):
+    """Send the result file, with byte ranges and validators (``file_serving.py``).
+
+    While the job runs, a file that is already being written (see
+    ``file_follow.py``) is streamed as it grows, without Content-Length.
+    """
     job = DOWNLOAD_TRACKER.get_job(process_id)
     if not job:
         raise HTTPException(status_code=404, detail="Process not found")
+    if job.detached:
+        raise HTTPException(status_code=400, detail="File not ready")
+    if job.status != "completed" and DOWNLOAD_FOLLOW_PARTIAL and job.partial_path:
+        response = _follow_partial_file(job)
+        if response is not None:
+            return response
+    if job.source == BATCH_KIND:
+        raise HTTPException(
+            status_code=400, detail=f"Batch results are served from /downloads/{process_id}/zip"
+        )
     if job.status != "completed" or not job.file_path or not os.path.exists(job.file_path):
         raise HTTPException(status_code=400, detail="File not ready")
 
     safe_filename = ascii_filename(job.suggested_name or os.path.basename(job.file_path))
-    return FileResponse(job.file_path, filename=safe_filename)
+    return serve_file(request, job.file_path, safe_filename, offload=DOWNLOAD_FILE_OFFLOAD)
+
+
+@router.get("/{process_id}/zip")
+async def get_batch_zip(process_id: str):
+    """Send a finished batch's downloaded entries as one zip, built as it is sent."""
+    job = DOWNLOAD_TRACKER.get_job(process_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Process not found")
+    if job.source != BATCH_KIND:
+        raise HTTPException(status_code=400, detail="Not a batch job")
+    if job.status != "completed" or not job.children:
+        raise HTTPException(status_code=400, detail="Batch not finished")
+
+    order = job.children.split(",")
+    children = await asyncio.to_thread(DOWNLOAD_TRACKER.get_jobs, order)
+    entries = await asyncio.to_thread(zip_entries, children, order)
+    if not entries:
+        raise HTTPException(status_code=400, detail="The batch files have expired")
+    name = ascii_filename(job.suggested_name or "batch.zip")
+    return StreamingResponse(
+        stream_zip(entries),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{name}"'},
+    )
+
+
+def _follow_partial_file(job) -> Optional[StreamingResponse]:
+    if DOWNLOAD_TRACKER.is_terminal(job.status):
+        return None
+    try:
+        handle = open(job.partial_path, "rb")
+    except OSError:
+        return None
+    name = job.suggested_name or os.path.basename(job.partial_path).removesuffix(".part")
+    headers = {
+        "Content-Disposition": f'attachment; filename="{ascii_filename(name)}"',
+        "Cache-Control": "no-store",
+        "X-Accel-Buffering": "no",
+    }
+    return StreamingResponse(
+        follow_job_file(job.process_id, handle),
+        media_type=mimetypes.guess_type(name)[0] or "application/octet-stream",
+        headers=headers,
+    )
@@ -1,107 +1,66 @@
 import asyncio
-import os
-import time
+from typing import Optional
+from urllib.parse import urlparse
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
 
-from app.config import DOWNLOAD_FOLDER
-from app.config import DOWNLOAD_RETENTION_SECONDS
-from app.downloaders.common import download_video
-from app.services.download_tracker import DOWNLOAD_TRACKER
-from app.utils.file_ops import delete_file_later
+from app.downloaders.common import normalize_quality
+from app.services.download_scheduler import DOWNLOAD_SCHEDULER, client_identity
+from app.services.job_handlers import INSTAGRAM_OPTIONS
+from app.services.media_info import MEDIA_INFO, describe_info
 
 router = APIRouter(prefix="/instagram", tags=["Instagram"])
 
 
-@router.post("/download")
-async def request_instagram_download(url: str):
-    """Kick off an Instagram download and return a process identifier."""
-    job = DOWNLOAD_TRACKER.create_job(source="instagram", url=url)
-
-    output_template = os.path.join(
-        DOWNLOAD_FOLDER, "instagram_%(id)s_%(timestamp)s.%(ext)s"
-    )
-    custom_options = {
-        "retries": 5,
-        "fragment_retries": 5,
-        "skip_unavailable_fragments": True,
-        "extractor_retries": 3,
-        "http_headers": {
-            "User-Agent": (
-                "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
-                "AppleWebKit/537.36 (KHTML, like Gecko) "
-                "Chrome/121.0.0.0 Safari/537.36"
-            ),
-            "Referer": "https://www.instagram.com/",
-        },
-    }
-
-    async def runner():
-        DOWNLOAD_TRACKER.update_job(job.process_id, status="running", progress=0.0)
-
-        last_update_time = 0.0
-        last_progress_bucket = -1
-        last_bytes_reported = 0
-
-        def hook(data):
-            nonlocal last_update_time, last_progress_bucket, last_bytes_reported
-            status = data.get("status")
-            if status == "downloading":
-                downloaded = int(data.get("downloaded_bytes") or 0)
-                total = data.get("total_bytes") or data.get("total_bytes_estimate")
-                progress = (
-                    (downloaded / total) * 100 if total and total > 0 else 0.0
-                )
-
-                now = time.monotonic()
-                progress_bucket = int(progress)
-                should_emit = False
-                if progress_bucket != last_progress_bucket:
-                    should_emit = True
-                elif downloaded - last_bytes_reported >= 1024 * 1024:
-                    should_emit = True
-                elif now - last_update_time >= 0.75:
-                    should_emit = True
+def is_allowed_instagram_url(raw_url: str) -> bool:
+    if not raw_url:
+        return False
+    parsed = urlparse(raw_url)
+    if parsed.scheme not in {"http", "https"}:
+        return False
+    host = (parsed.hostname or "").lower()
+    if host in {"instagram.com", "instagr.am"} or host.endswith(".instagram.com"):
+        return True
+    return False
 
-                if not should_emit:
-                    return
 
-                last_update_time = now
-                last_progress_bucket = progress_bucket
-                last_bytes_reported = downloaded
-
-                DOWNLOAD_TRACKER.update_job(
-                    job.process_id,
-                    bytes_downloaded=downloaded,
-                    total_bytes=int(total) if total else None,
-                    progress=progress,
-                )
-            elif status == "finished":
-                DOWNLOAD_TRACKER.update_job(job.process_id, progress=100.0)
+@router.post("/download")
+async def request_instagram_download(url: str, request: Request, quality: Optional[str] = None):
+    """Kick off a Instagram download and return a process identifier."""
+    try:
+        quality = normalize_quality(quality)
+    except ValueError as exc:
+        return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+    client_key, premium = client_identity(request)
+    process_id = await DOWNLOAD_SCHEDULER.submit(
+        "instagram", url, {"url": url, "quality": quality}, client_key, premium=premium
+    )
+    if process_id is None:
+        return JSONResponse(
+            status_code=429,
+            content={
+                "detail": "Download queue is full. Please retry in a few minutes."
+            },
+        )
+    return {"process_id": process_id}
 
-        try:
-            filename = await asyncio.to_thread(
-                download_video,
-                url,
-                output_template,
-                custom_options,
-                hook,
-            )
-        except Exception as exc:
-            message = str(exc).replace("\n", " ").strip()
-            DOWNLOAD_TRACKER.update_job(
-                job.process_id, status="failed", error=message
-            )
-            return
 
-        DOWNLOAD_TRACKER.update_job(
-            job.process_id,
-            status="completed",
-            progress=100.0,
-            file_path=filename,
-            suggested_name=os.path.basename(filename),
+@router.get("/info")
+async def get_instagram_info(url: str, quality: Optional[str] = None):
+    """Return title, duration and estimated size (for ``quality``) without downloading."""
+    if not is_allowed_instagram_url(url):
+        return JSONResponse(
+            status_code=400,
+            content={"detail": "Only public Instagram URLs are allowed."},
         )
-        delete_file_later(filename, delay=DOWNLOAD_RETENTION_SECONDS)
-
-    asyncio.create_task(runner())
-    return {"process_id": job.process_id}
+    try:
+        info, cached = await MEDIA_INFO.probe("instagram", url, INSTAGRAM_OPTIONS)
+        summary = await asyncio.to_thread(describe_info, info, quality)
+    except Exception as exc:
+        return JSONResponse(
+            status_code=400,
+            content={"detail": str(exc).replace("\n", " ").strip()},
+        )
+    return {**summary, "cached": cached}
@@ -17,6 +17,7 @@ from app.config import (
 )
 
 from app.services.download_tracker import DOWNLOAD_TRACKER
+from app.services.job_queue import JOB_QUEUE
 
 from app.utils.file_ops import (
     ascii_filename,
@@ -28,14 +29,10 @@ from app.utils.pdf_ops import (
     convert_pdf_tables_to_excel,
     convert_pdf_to_docx,
     create_images_zip,
-    compress_pdf,
 )
 
 router = APIRouter(prefix="/pdf", tags=["PDF"])
 
-PDF_COMPRESS_CONCURRENCY = int(os.environ.get("PDF_COMPRESS_CONCURRENCY", "4"))
-_PDF_COMPRESS_SEMAPHORE = asyncio.Semaphore(max(PDF_COMPRESS_CONCURRENCY, 1))
-
 
 @router.post("/to-excel")
 async def pdf_to_excel(file: UploadFile = File(...)):
@@ -156,42 +153,14 @@ async def compress_pdf_endpoint(file: UploadFile = File(...), level: str = "bala
     output_pdf_path = os.path.join(DOWNLOAD_FOLDER, suggested_name)
 
     job = DOWNLOAD_TRACKER.create_job(source="pdf_compress", url=file.filename)
-
-    async def runner():
-        DOWNLOAD_TRACKER.update_job(job.process_id, status="running", progress=0.0)
-
-        try:
-            async with _PDF_COMPRESS_SEMAPHORE:
-                # Ensure output directory exists
-                os.makedirs(os.path.dirname(output_pdf_path), exist_ok=True)
-                await asyncio.to_thread(compress_pdf, input_pdf_path, output_pdf_path, level)
-                
-                # Verify output was actually created and is valid
-                if not os.path.exists(output_pdf_path):
-                    raise RuntimeError("Compression failed: output file was not created")
-                if os.path.getsize(output_pdf_path) < 100:
-                    raise RuntimeError(f"Compression failed: output file is only {os.path.getsize(output_pdf_path)} bytes")
-        except Exception as exc:
-            if os.path.exists(output_pdf_path):
-                try:
-                    os.remove(output_pdf_path)
-                except Exception:
-                    pass
-            message = str(exc).replace("\n", " ").strip()
-            DOWNLOAD_TRACKER.update_job(job.process_id, status="failed", error=message)
-            delete_file_later(input_pdf_path, delay=UPLOAD_RETENTION_SECONDS)
-            return
-
-        DOWNLOAD_TRACKER.update_job(
-            job.process_id,
-            status="completed",
-            progress=100.0,
-            file_path=output_pdf_path,
-            suggested_name=suggested_name,
-        )
-
-        delete_file_later(input_pdf_path, delay=UPLOAD_RETENTION_SECONDS)
-        delete_file_later(output_pdf_path, delay=DOWNLOAD_RETENTION_SECONDS)
-
-    asyncio.create_task(runner())
+    JOB_QUEUE.submit(
+        "pdf_compress",
+        job.process_id,
+        {
+            "input_path": input_pdf_path,
+            "output_path": output_pdf_path,
+            "suggested_name": suggested_name,
+            "level": level,
+        },
+    )
     return {"process_id": job.process_id}
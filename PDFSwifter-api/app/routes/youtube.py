@@ -1,36 +1,27 @@
 import asyncio
+from typing import Optional
 from urllib.parse import urlparse
 
 from fastapi import APIRouter, Request
-from fastapi.responses import JSONResponse
-
-from app.config import YOUTUBE_CONCURRENCY, YOUTUBE_QUEUE_SIZE
-from app.downloaders.youtube import YOUTUBE_DOWNLOADER
-from app.services.download_tracker import DOWNLOAD_TRACKER
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+
+from app.downloaders.common import normalize_quality
+from app.downloaders.cookie_manager import COOKIE_POOL
+from app.downloaders.youtube import build_youtube_download_options, map_youtube_download_error
+from app.services.direct_stream import (
+    DirectStream,
+    DirectStreamBusy,
+    DirectStreamUnavailable,
+    open_direct_stream,
+)
+from app.services.download_scheduler import DOWNLOAD_SCHEDULER, client_identity
+from app.services.media_info import MEDIA_INFO, describe_info
+from app.utils.file_ops import ascii_filename
 
 router = APIRouter(prefix="/youtube", tags=["YouTube"])
-_YOUTUBE_SEMAPHORE = asyncio.Semaphore(max(YOUTUBE_CONCURRENCY, 1))
-_inflight = 0
-_inflight_lock = asyncio.Lock()
-_max_inflight = max(YOUTUBE_CONCURRENCY, 1) + max(YOUTUBE_QUEUE_SIZE, 0)
-
-
-async def _reserve_slot() -> bool:
-    global _inflight
-    async with _inflight_lock:
-        if _inflight >= _max_inflight:
-            return False
-        _inflight += 1
-        return True
-
 
-async def _release_slot() -> None:
-    global _inflight
-    async with _inflight_lock:
-        _inflight = max(_inflight - 1, 0)
 
-
-def _is_allowed_youtube_url(raw_url: str) -> bool:
+def is_allowed_youtube_url(raw_url: str) -> bool:
     if not raw_url:
         return False
     parsed = urlparse(raw_url)
@@ -46,25 +37,25 @@ def _is_allowed_youtube_url(raw_url: str) -> bool:
     return False
 
 
-async def _extract_url(request: Request) -> str | None:
+async def _extract_param(request: Request, name: str) -> str | None:
     # Prefer query param.
-    url = request.query_params.get("url")
-    if url:
-        return url
+    value = request.query_params.get(name)
+    if value:
+        return value
 
     content_type = (request.headers.get("content-type") or "").lower()
     if "application/json" in content_type:
         try:
             payload = await request.json()
             if isinstance(payload, dict):
-                return payload.get("url")
+                return payload.get(name)
         except Exception:
             return None
 
     if "application/x-www-form-urlencoded" in content_type or "multipart/form-data" in content_type:
         try:
             form = await request.form()
-            return form.get("url")
+            return form.get(name)
         except Exception:
             return None
 
@@ -74,41 +65,108 @@ async def _extract_url(request: Request) -> str | None:
 @router.post("/download")
 async def request_youtube_download(request: Request):
     """Kick off a YouTube download and return a process identifier."""
-    url = await _extract_url(request)
+    url = await _extract_param(request, "url")
     if not url:
         return JSONResponse(
             status_code=400,
             content={"detail": "Missing url parameter."},
         )
 
-    if not _is_allowed_youtube_url(url):
+    if not is_allowed_youtube_url(url):
         return JSONResponse(
             status_code=400,
             content={"detail": "Only public YouTube URLs are allowed."},
         )
 
-    if not await _reserve_slot():
+    try:
+        quality = normalize_quality(await _extract_param(request, "quality"))
+    except ValueError as exc:
+        return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+    client_key, premium = client_identity(request)
+    process_id = await DOWNLOAD_SCHEDULER.submit(
+        "youtube", url, {"url": url, "quality": quality}, client_key, premium=premium
+    )
+    if process_id is None:
         return JSONResponse(
             status_code=429,
             content={
                 "detail": "Download queue is full. Please retry in a few minutes."
             },
         )
+    return {"process_id": process_id}
+
+
+@router.get("/info")
+async def get_youtube_info(url: str, quality: Optional[str] = None):
+    """Return title, duration and estimated size (for ``quality``) without downloading."""
+    if not is_allowed_youtube_url(url):
+        return JSONResponse(
+            status_code=400,
+            content={"detail": "Only public YouTube URLs are allowed."},
+        )
+    try:
+        cookies = build_youtube_download_options(await COOKIE_POOL.acquire())
+        info, cached = await MEDIA_INFO.probe("youtube", url, cookies)
+        summary = await asyncio.to_thread(describe_info, info, quality)
+    except Exception as exc:
+        detail = map_youtube_download_error(exc) or str(exc).replace("\n", " ").strip()
+        return JSONResponse(status_code=400, content={"detail": detail})
+    return {**summary, "cached": cached}
 
-    job = DOWNLOAD_TRACKER.create_job(source="youtube", url=url)
-    DOWNLOAD_TRACKER.update_job(job.process_id, status="queued", progress=0.0)
 
-    async def runner():
+class _DirectStreamResponse(StreamingResponse):
+    """Closes the direct stream however sending ends (also on early disconnects,
+    where ``background`` tasks are skipped)."""
+
+    def __init__(self, stream: DirectStream, **kwargs) -> None:
+        super().__init__(stream.body, **kwargs)
+        self._stream = stream
+
+    async def __call__(self, scope, receive, send) -> None:
         try:
-            async with _YOUTUBE_SEMAPHORE:
-                DOWNLOAD_TRACKER.update_job(job.process_id, status="running")
-                await YOUTUBE_DOWNLOADER.download(url, job.process_id)
-        except Exception as exc:
-            DOWNLOAD_TRACKER.update_job(
-                job.process_id, status="failed", error=str(exc)
-            )
+            await super().__call__(scope, receive, send)
         finally:
-            await _release_slot()
+            await self._stream.close()
+
+
+@router.get("/stream")
+async def stream_youtube_download(url: str, quality: Optional[str] = None):
+    """Pipe a YouTube download straight to the client, without a job or a file.
+
+    Needs ``YOUTUBE_REMOTE_ENDPOINT``; see ``app/services/direct_stream.py``.
+    """
+    if not is_allowed_youtube_url(url):
+        return JSONResponse(
+            status_code=400,
+            content={"detail": "Only public YouTube URLs are allowed."},
+        )
+    try:
+        quality = normalize_quality(quality)
+    except ValueError as exc:
+        return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+    try:
+        stream = await open_direct_stream(url, quality)
+    except DirectStreamUnavailable as exc:
+        return JSONResponse(status_code=404, content={"detail": str(exc)})
+    except DirectStreamBusy as exc:
+        return JSONResponse(status_code=429, content={"detail": str(exc)})
+    except Exception as exc:
+        detail = map_youtube_download_error(exc) or str(exc).replace("\n", " ").strip()
+        return JSONResponse(status_code=400, content={"detail": detail})
+
+    if stream.cached:
+        return FileResponse(
+            stream.cached.file_path, filename=ascii_filename(stream.cached.suggested_name)
+        )
+    headers = {
+        name: value for name, value in stream.headers.items() if name != "content-type"
+    }
+    headers["X-Accel-Buffering"] = "no"
+    return _DirectStreamResponse(
+        stream,
+        media_type=stream.headers.get("content-type", "video/mp4"),
+        headers=headers,
+    )
 
-    asyncio.create_task(runner())
-    return {"process_id": job.process_id}
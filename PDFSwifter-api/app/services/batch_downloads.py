@@ -0,0 +1,289 @@
+"""Batch downloads: a playlist, or a list of URLs, as one parent job.
+
+``POST /downloads/playlist`` creates the parent job (source ``batch``) and
+hands it to ``JOB_QUEUE`` like any other job. ``run_batch_job`` then:
+
+- extracts a playlist's entry list once (``extract_playlist_entries``,
+  page only), or takes the given URLs;
+- creates one child job per entry up front (``batch_id`` points at the
+  parent, the parent's ``children`` lists them in order), so clients see
+  every entry at once, e.g. through ``POST /downloads/batch``;
+- submits at most ``DOWNLOAD_BATCH_CONCURRENCY`` children at a time to
+  ``DOWNLOAD_SCHEDULER`` under the requesting client's identity. Each child
+  still waits for a slot of its source and takes its turn with other
+  clients' jobs, and uses the media cache and single-flight as usual;
+- reports finished entries as the parent's ``progress`` and completes when
+  every entry has finished (failed if none was downloaded).
+
+Cancelling the parent cancels its unfinished children. The parent's job
+only waits on other jobs, so it does not take a worker slot (see
+``JobWorker``). A re-delivered parent picks up the children it created.
+
+``stream_zip`` sends the finished entries as one zip, built while it is
+sent (stored, not compressed: media files do not shrink).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+import zipfile
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from app.config import (
+    CHUNK_SIZE,
+    DOWNLOAD_BATCH_CONCURRENCY,
+    DOWNLOAD_BATCH_MAX_ENTRIES,
+    DOWNLOAD_BATCH_POLL_SECONDS,
+)
+from app.downloaders.common import extract_playlist_entries
+from app.downloaders.cookie_manager import COOKIE_POOL
+from app.downloaders.youtube import build_youtube_download_options
+from app.services.download_scheduler import DOWNLOAD_SCHEDULER
+from app.services.download_tracker import DOWNLOAD_TRACKER, DownloadJob
+from app.services.egress_pool import EGRESS_POOL
+from app.services.job_cancel import CANCELLED, cancel_job
+from app.services.job_queue import JOB_QUEUE
+
+BATCH_KIND = "batch"
+# Children created but not yet handed to the scheduler.
+_PENDING = "pending"
+# Wait before re-submitting entries the scheduler refused (queue full).
+_QUEUE_FULL_RETRY_SECONDS = 10.0
+
+
+def create_batch(
+    source: str,
+    url: Optional[str],
+    urls: List[str],
+    quality: str,
+    client_key: str,
+    premium: bool = False,
+) -> str:
+    """Create the parent job and queue it; returns its process id."""
+    job = DOWNLOAD_TRACKER.create_job(BATCH_KIND, url or urls[0], quality)
+    payload = {
+        "source": source,
+        "url": url,
+        "urls": urls,
+        "quality": quality,
+        "client_key": client_key,
+        "premium": premium,
+    }
+    DOWNLOAD_TRACKER.update_job(job.process_id, status="queued", progress=0.0)
+    JOB_QUEUE.submit(BATCH_KIND, job.process_id, payload)
+    return job.process_id
+
+
+async def _extract_entries(source: str, url: str) -> Tuple[Optional[str], List[Dict]]:
+    # Imported lazily: job_handlers registers run_batch_job.
+    from app.services.job_handlers import INSTAGRAM_OPTIONS, TIKTOK_OPTIONS
+
+    if source == "youtube":
+        options = build_youtube_download_options(await COOKIE_POOL.acquire())
+    else:
+        options = {"tiktok": TIKTOK_OPTIONS, "instagram": INSTAGRAM_OPTIONS}.get(source)
+    async with EGRESS_POOL.use(source) as lease:
+        return await extract_playlist_entries(
+            url, options, limit=DOWNLOAD_BATCH_MAX_ENTRIES, egress=lease.egress
+        )
+
+
+def _create_children(process_id: str, source: str, entries: List[Dict], quality: str) -> List[str]:
+    children = []
+    for entry in entries:
+        child = DOWNLOAD_TRACKER.create_job(source, entry["url"], quality)
+        DOWNLOAD_TRACKER.update_job(
+            child.process_id,
+            status=_PENDING,
+            batch_id=process_id,
+            suggested_name=entry.get("title") or None,
+        )
+        children.append(child.process_id)
+    return children
+
+
+async def run_batch_job(process_id: str, payload: Dict[str, object]) -> None:
+    source = str(payload["source"])
+    quality = str(payload.get("quality") or "")
+    job = await asyncio.to_thread(DOWNLOAD_TRACKER.get_job, process_id)
+    children = job.children.split(",") if job and job.children else []
+    DOWNLOAD_TRACKER.update_job(process_id, status="running")
+
+    if not children:
+        title = None
+        if payload.get("url"):
+            try:
+                title, entries = await _extract_entries(source, str(payload["url"]))
+            except Exception as exc:
+                message = str(exc).replace("\n", " ").strip()
+                DOWNLOAD_TRACKER.update_job(process_id, status="failed", error=message)
+                return
+        else:
+            entries = [{"url": url} for url in payload.get("urls") or []]
+        if not entries:
+            DOWNLOAD_TRACKER.update_job(
+                process_id, status="failed", error="The playlist has no downloadable entries."
+            )
+            return
+        children = await asyncio.to_thread(
+            _create_children, process_id, source, entries, quality
+        )
+        DOWNLOAD_TRACKER.update_job(
+            process_id, children=",".join(children), suggested_name=f"{title or 'batch'}.zip"
+        )
+
+    try:
+        jobs = await _run_children(process_id, source, quality, children, payload)
+    except asyncio.CancelledError:
+        await asyncio.shield(_cancel_children(source, children))
+        raise
+
+    completed = sum(1 for child in jobs.values() if child and child.status == "completed")
+    failed = len(children) - completed
+    if not completed:
+        DOWNLOAD_TRACKER.update_job(
+            process_id, status="failed", error="None of the entries could be downloaded."
+        )
+        return
+    DOWNLOAD_TRACKER.update_job(
+        process_id,
+        status="completed",
+        progress=100.0,
+        error=f"{failed} of {len(children)} entries failed." if failed else None,
+    )
+
+
+async def _run_children(
+    process_id: str,
+    source: str,
+    quality: str,
+    children: List[str],
+    payload: Dict[str, object],
+) -> Dict[str, Optional[DownloadJob]]:
+    limit = max(DOWNLOAD_BATCH_CONCURRENCY, 1)
+    retry_at = 0.0
+    last_progress = None
+    while True:
+        jobs = await asyncio.to_thread(DOWNLOAD_TRACKER.get_jobs, children)
+        pending = [pid for pid in children if jobs.get(pid) and jobs[pid].status == _PENDING]
+        active = [
+            pid
+            for pid in children
+            if jobs.get(pid)
+            and jobs[pid].status != _PENDING
+            and not DOWNLOAD_TRACKER.is_terminal(jobs[pid].status)
+        ]
+        finished = len(children) - len(pending) - len(active)
+        progress = round(finished * 100.0 / len(children), 1)
+        if progress != last_progress:
+            bytes_downloaded = sum(job.bytes_downloaded or 0 for job in jobs.values() if job)
+            DOWNLOAD_TRACKER.update_job(
+                process_id, progress=progress, bytes_downloaded=bytes_downloaded
+            )
+            last_progress = progress
+        if not pending and not active:
+            return jobs
+        # The entries are waited on here, not by a client.
+        DOWNLOAD_TRACKER.mark_polled(active)
+
+        if time.monotonic() >= retry_at:
+            for child in pending[: max(limit - len(active), 0)]:
+                if not await _submit_child(source, jobs[child], quality, payload):
+                    retry_at = time.monotonic() + _QUEUE_FULL_RETRY_SECONDS
+                    break
+        await asyncio.sleep(DOWNLOAD_BATCH_POLL_SECONDS)
+
+
+async def _submit_child(
+    source: str, child: DownloadJob, quality: str, payload: Dict[str, object]
+) -> bool:
+    submitted = await DOWNLOAD_SCHEDULER.submit(
+        source,
+        child.url,
+        {"url": child.url, "quality": quality},
+        str(payload.get("client_key") or "batch"),
+        premium=bool(payload.get("premium")),
+        process_id=child.process_id,
+    )
+    if submitted is None:
+        # Queue full: try this entry again later.
+        DOWNLOAD_TRACKER.update_job(child.process_id, status=_PENDING, error=None)
+        return False
+    return True
+
+
+async def _cancel_children(source: str, children: List[str]) -> None:
+    jobs = await asyncio.to_thread(DOWNLOAD_TRACKER.get_jobs, children)
+    for process_id, job in jobs.items():
+        if job is None or DOWNLOAD_TRACKER.is_terminal(job.status):
+            continue
+        if job.status == _PENDING:
+            DOWNLOAD_TRACKER.update_job_if_active(
+                process_id, status=CANCELLED, error="Batch cancelled"
+            )
+        elif await asyncio.to_thread(cancel_job, process_id, "Batch cancelled"):
+            await DOWNLOAD_SCHEDULER.cancel(source, process_id)
+
+
+class _ZipSink:
+    """Write-only file object that hands out what ``ZipFile`` wrote so far."""
+
+    def __init__(self) -> None:
+        self._chunks: List[bytes] = []
+        self._offset = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._offset
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def zip_entries(
+    children: Dict[str, Optional[DownloadJob]], order: List[str]
+) -> List[Tuple[str, str]]:
+    """``(file path, name in the zip)`` for each finished entry whose file still exists."""
+    entries = []
+    for index, process_id in enumerate(order, start=1):
+        job = children.get(process_id)
+        if not job or job.status != "completed" or not job.file_path:
+            continue
+        if not os.path.exists(job.file_path):
+            continue
+        name = job.suggested_name or os.path.basename(job.file_path)
+        entries.append((job.file_path, f"{index:0{len(str(len(order)))}d} - {name}"))
+    return entries
+
+
+async def stream_zip(entries: List[Tuple[str, str]]) -> AsyncIterator[bytes]:
+    """Zip ``entries`` on the fly; sizes and CRCs follow each file's data."""
+    sink = _ZipSink()
+    archive = zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED, allowZip64=True)
+    for path, name in entries:
+        try:
+            source = open(path, "rb")
+        except OSError:
+            continue
+        with source:
+            info = zipfile.ZipInfo.from_file(path, arcname=name)
+            with archive.open(info, "w", force_zip64=True) as member:
+                while True:
+                    chunk = await asyncio.to_thread(source.read, CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    member.write(chunk)
+                    yield sink.take()
+    archive.close()
+    yield sink.take()
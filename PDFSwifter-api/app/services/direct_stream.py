@@ -0,0 +1,172 @@
+"""Zero-disk YouTube downloads through the remote endpoint (``GET /youtube/stream``).
+
+With ``YOUTUBE_REMOTE_ENDPOINT`` set, the remote response can be piped
+straight to the requesting client (``RemoteYouTubeDownloader.open_stream``)
+instead of being written to ``DOWNLOAD_FOLDER`` as a job file that the client
+fetches afterwards.
+
+- A stream holds one of YouTube's download slots (the scheduler's
+  cluster-wide semaphore) while it runs. If no slot is free, the stream is
+  refused rather than queued. When a stream ends, queued jobs can take its
+  slot.
+- A video already in the media cache is served from there.
+- With ``YOUTUBE_REMOTE_DIRECT_CACHE``, the body is also written into the
+  media cache folder as it passes. It is added to the cache once it is
+  complete, and dropped if the client goes away first.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import os
+import uuid
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Optional
+
+from app.config import DOWNLOAD_FOLDER, DOWNLOAD_RETENTION_SECONDS, YOUTUBE_REMOTE_DIRECT_CACHE
+from app.downloaders.common import media_key
+from app.downloaders.youtube import (
+    YOUTUBE_DOWNLOADER,
+    RemoteYouTubeDownloader,
+    extract_filename_from_disposition,
+)
+from app.services.distributed_semaphore import Lease
+from app.services.download_scheduler import DOWNLOAD_SCHEDULER
+from app.services.media_cache import MEDIA_CACHE, CachedMedia
+from app.utils.file_ops import delete_file_later
+
+logger = logging.getLogger(__name__)
+
+
+class DirectStreamUnavailable(RuntimeError):
+    """No remote endpoint is configured."""
+
+
+class DirectStreamBusy(RuntimeError):
+    """Every YouTube download slot is taken."""
+
+
+class _Relay:
+    """The body to send. ``close`` frees the slot and the remote connection
+    however the response ended, including when it never started sending."""
+
+    def __init__(
+        self,
+        body: AsyncIterator[bytes],
+        lease: Lease,
+        headers: Dict[str, str],
+        tee_key: Optional[str],
+    ) -> None:
+        self._body = body
+        self._lease = lease
+        self._headers = headers
+        self._tee_key = tee_key
+        self._relay: Optional[AsyncIterator[bytes]] = None
+        self._closed = False
+
+    def __aiter__(self) -> AsyncIterator[bytes]:
+        if self._relay is None:
+            self._relay = _relay(self._body, self._lease, self._headers, self._tee_key)
+        return self._relay
+
+    async def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if self._relay is not None:
+            # Runs _relay's cleanup now if the sender stopped iterating early.
+            await self._relay.aclose()
+            return
+        try:
+            await self._body.aclose()
+        finally:
+            await asyncio.shield(DOWNLOAD_SCHEDULER.slots["youtube"].release(self._lease))
+            await DOWNLOAD_SCHEDULER.dispatch("youtube")
+
+
+@dataclass
+class DirectStream:
+    """Headers and body to send, or the cached file to send instead.
+
+    The sender must call ``close`` when it is done with the stream.
+    """
+
+    headers: Dict[str, str]
+    body: Optional[_Relay] = None
+    cached: Optional[CachedMedia] = None
+
+    async def close(self) -> None:
+        if self.body is not None:
+            await self.body.close()
+
+
+async def open_direct_stream(url: str, quality: Optional[str] = None) -> DirectStream:
+    """Start piping ``url`` to the caller; raises before any byte is sent."""
+    if not isinstance(YOUTUBE_DOWNLOADER, RemoteYouTubeDownloader):
+        raise DirectStreamUnavailable("Direct streaming needs YOUTUBE_REMOTE_ENDPOINT.")
+
+    key = media_key("youtube", url, quality) if MEDIA_CACHE.enabled else None
+    if key:
+        cached = await asyncio.to_thread(MEDIA_CACHE.checkout, key, str(DOWNLOAD_FOLDER))
+        if cached:
+            delete_file_later(cached.file_path, delay=DOWNLOAD_RETENTION_SECONDS)
+            return DirectStream(headers={}, cached=cached)
+
+    slots = DOWNLOAD_SCHEDULER.slots["youtube"]
+    lease = await slots.try_acquire()
+    if lease is None:
+        raise DirectStreamBusy(
+            "All YouTube download slots are busy. Retry shortly or use POST /youtube/download."
+        )
+    try:
+        headers, body = await YOUTUBE_DOWNLOADER.open_stream(url, quality)
+    except BaseException:
+        await asyncio.shield(slots.release(lease))
+        await DOWNLOAD_SCHEDULER.dispatch("youtube")
+        raise
+    tee_key = key if YOUTUBE_REMOTE_DIRECT_CACHE else None
+    if headers.get("content-encoding", "identity") != "identity":
+        tee_key = None  # the cache keeps plain files
+    return DirectStream(headers=headers, body=_Relay(body, lease, headers, tee_key))
+
+
+async def _relay(
+    body: AsyncIterator[bytes],
+    lease: Lease,
+    headers: Dict[str, str],
+    tee_key: Optional[str],
+) -> AsyncIterator[bytes]:
+    suggested_name = extract_filename_from_disposition(headers.get("content-disposition", ""))
+    tee_path = None
+    tee = None
+    if tee_key:
+        ext = os.path.splitext(suggested_name or "")[1] or ".mp4"
+        tee_path = os.path.join(MEDIA_CACHE.folder, f"{uuid.uuid4().hex}{ext}")
+        tee = open(tee_path, "wb")
+
+    size = 0
+    complete = False
+    try:
+        async with DOWNLOAD_SCHEDULER.slots["youtube"].adopt(lease):
+            async for chunk in body:
+                if tee:
+                    tee.write(chunk)
+                size += len(chunk)
+                yield chunk
+            expected = headers.get("content-length")
+            complete = expected is None or int(expected) == size
+    finally:
+        await body.aclose()
+        if tee:
+            tee.close()
+            if complete:
+                try:
+                    await asyncio.to_thread(MEDIA_CACHE.store, tee_key, tee_path, suggested_name)
+                except Exception as exc:
+                    logger.warning("Adding a direct stream to the media cache failed: %s", exc)
+            # The cache keeps its own link.
+            with contextlib.suppress(OSError):
+                os.remove(tee_path)
+        await DOWNLOAD_SCHEDULER.dispatch("youtube")
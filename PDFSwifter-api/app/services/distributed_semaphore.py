@@ -0,0 +1,313 @@
+"""Cluster-wide counting semaphore with expiring leases.
+
+Holders live in a Redis sorted set scored by lease expiry (Redis server
+time), so a crashed holder frees its slot once the lease runs out. Every
+successful acquire also returns a fence number from a monotonically
+increasing counter, which identifies the grant in logs.
+
+Holders keep their lease alive in the background. If it expires anyway
+(renewals stalled, Redis was away), the holder takes a slot again as soon
+as one is free; if none frees up within a lease period, the holder is
+cancelled and sees ``LeaseLost``, so the limit is never exceeded for long.
+
+Without Redis the same interface is served by an in-process implementation.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from app.config import SEMAPHORE_LEASE_SECONDS
+from app.services.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# KEYS: holders zset, fence counter. ARGV: lease_ms, limit, token.
+_ACQUIRE_SCRIPT = """
+local now = redis.call('TIME')
+local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local lease_ms = tonumber(ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now_ms)
+if redis.call('ZSCORE', KEYS[1], ARGV[3]) then
+  redis.call('ZADD', KEYS[1], now_ms + lease_ms, ARGV[3])
+  return redis.call('GET', KEYS[2]) or 0
+end
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[2]) then
+  return 0
+end
+redis.call('ZADD', KEYS[1], now_ms + lease_ms, ARGV[3])
+if redis.call('PTTL', KEYS[1]) < lease_ms then
+  redis.call('PEXPIRE', KEYS[1], lease_ms)
+end
+return redis.call('INCR', KEYS[2])
+"""
+
+# KEYS: holders zset. ARGV: lease_ms, token. Returns 1 if the lease was extended.
+_RENEW_SCRIPT = """
+local now = redis.call('TIME')
+local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local score = redis.call('ZSCORE', KEYS[1], ARGV[2])
+if not score or tonumber(score) <= now_ms then
+  redis.call('ZREM', KEYS[1], ARGV[2])
+  return 0
+end
+redis.call('ZADD', KEYS[1], now_ms + tonumber(ARGV[1]), ARGV[2])
+if redis.call('PTTL', KEYS[1]) < tonumber(ARGV[1]) then
+  redis.call('PEXPIRE', KEYS[1], ARGV[1])
+end
+return 1
+"""
+
+# KEYS: holders zset. Returns the number of live holders.
+_COUNT_SCRIPT = """
+local now = redis.call('TIME')
+local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now_ms)
+return redis.call('ZCARD', KEYS[1])
+"""
+
+
+class LeaseLost(RuntimeError):
+    """The holder's lease expired and no slot freed up to take it back."""
+
+
+@dataclass(frozen=True)
+class Lease:
+    token: str
+    fence: int
+    local: bool
+
+
+class DistributedSemaphore:
+    """``async with`` drop-in for ``asyncio.Semaphore`` that holds cluster-wide.
+
+    Besides the blocking form it supports non-blocking reservations
+    (``try_acquire``) that can be handed to another task or process by token
+    and later renewed/released there (``adopt``), which is how the queue-depth
+    limit follows a job from the API into the worker.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        limit: int,
+        lease_seconds: float = SEMAPHORE_LEASE_SECONDS,
+        poll_interval_seconds: float = 0.25,
+        key_prefix: str = "semaphore:",
+    ) -> None:
+        self.name = name
+        self.limit = max(int(limit), 1)
+        self.lease_seconds = max(float(lease_seconds), 1.0)
+        self._poll_interval_seconds = poll_interval_seconds
+        self.holders_key = f"{key_prefix}{name}:holders"
+        self.fence_key = f"{key_prefix}{name}:fence"
+        self._scripts: Dict[str, object] = {}
+        self._client_id = None
+
+        # In-process fallback state.
+        self._local_holders: Dict[str, float] = {}
+        self._local_fence = 0
+
+        # Leases taken through ``async with``, keyed by the owning task.
+        self._task_leases: Dict[asyncio.Task, Tuple[Lease, asyncio.Task, List[bool]]] = {}
+
+    # -- Redis helpers -----------------------------------------------------
+
+    def _script(self, client, name: str, source: str):
+        if self._client_id != id(client):
+            self._scripts = {}
+            self._client_id = id(client)
+        script = self._scripts.get(name)
+        if script is None:
+            script = client.register_script(source)
+            self._scripts[name] = script
+        return script
+
+    @property
+    def _lease_ms(self) -> int:
+        return int(self.lease_seconds * 1000)
+
+    # -- Local helpers -----------------------------------------------------
+
+    def _local_purge(self) -> None:
+        now = time.monotonic()
+        for token in [t for t, expires in self._local_holders.items() if expires <= now]:
+            del self._local_holders[token]
+
+    # -- Public API --------------------------------------------------------
+
+    def _try_acquire_sync(self, token: str) -> Optional[Lease]:
+        client = get_redis()
+        if client is not None:
+            fence = self._script(client, "acquire", _ACQUIRE_SCRIPT)(
+                keys=[self.holders_key, self.fence_key],
+                args=[self._lease_ms, self.limit, token],
+            )
+            fence = int(fence or 0)
+            return Lease(token, fence, local=False) if fence else None
+
+        self._local_purge()
+        if token not in self._local_holders and len(self._local_holders) >= self.limit:
+            return None
+        if token not in self._local_holders:
+            self._local_fence += 1
+        self._local_holders[token] = time.monotonic() + self.lease_seconds
+        return Lease(token, self._local_fence, local=True)
+
+    async def try_acquire(self, token: Optional[str] = None) -> Optional[Lease]:
+        """Take a slot if one is free right now; ``None`` otherwise."""
+        token = token or uuid.uuid4().hex
+        if get_redis() is None:
+            return self._try_acquire_sync(token)
+        return await asyncio.to_thread(self._try_acquire_sync, token)
+
+    async def acquire(self, token: Optional[str] = None) -> Lease:
+        """Wait for a slot (polling with jittered backoff)."""
+        token = token or uuid.uuid4().hex
+        delay = self._poll_interval_seconds
+        while True:
+            lease = await self.try_acquire(token)
+            if lease:
+                return lease
+            await asyncio.sleep(delay * (0.5 + random.random()))
+            delay = min(delay * 1.5, 2.0)
+
+    def _renew_sync(self, lease: Lease) -> bool:
+        if lease.local:
+            expires = self._local_holders.get(lease.token)
+            if expires is None or expires <= time.monotonic():
+                self._local_holders.pop(lease.token, None)
+                return False
+            self._local_holders[lease.token] = time.monotonic() + self.lease_seconds
+            return True
+        client = get_redis()
+        if client is None:
+            return False
+        renewed = self._script(client, "renew", _RENEW_SCRIPT)(
+            keys=[self.holders_key], args=[self._lease_ms, lease.token]
+        )
+        return bool(renewed)
+
+    async def renew(self, lease: Lease) -> bool:
+        """Extend a lease; ``False`` means it already expired and was lost."""
+        if lease.local:
+            return self._renew_sync(lease)
+        return await asyncio.to_thread(self._renew_sync, lease)
+
+    def _release_sync(self, lease: Lease) -> None:
+        if lease.local:
+            self._local_holders.pop(lease.token, None)
+            return
+        client = get_redis()
+        if client is not None:
+            client.zrem(self.holders_key, lease.token)
+
+    async def release(self, lease: Lease) -> None:
+        if lease.local:
+            self._release_sync(lease)
+            return
+        try:
+            await asyncio.to_thread(self._release_sync, lease)
+        except Exception as exc:
+            # The lease expires on its own.
+            logger.warning("Releasing %s lease failed: %s", self.name, exc)
+
+    def _count_sync(self) -> int:
+        client = get_redis()
+        if client is not None:
+            return int(self._script(client, "count", _COUNT_SCRIPT)(keys=[self.holders_key]))
+        self._local_purge()
+        return len(self._local_holders)
+
+    async def count(self) -> int:
+        """Number of live holders across the cluster (or this process)."""
+        if get_redis() is None:
+            return self._count_sync()
+        return await asyncio.to_thread(self._count_sync)
+
+    async def _keep_alive(self, lease: Lease, owner: asyncio.Task, lost: List[bool]) -> None:
+        interval = self.lease_seconds / 3
+        lost_at: Optional[float] = None
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if await self.renew(lease):
+                    continue
+                regained = await self.try_acquire(lease.token)
+            except Exception as exc:
+                logger.warning("Renewing %s lease failed: %s", self.name, exc)
+                continue
+            if regained:
+                logger.warning(
+                    "%s lease %s expired before release; re-acquired (fence %s -> %s)",
+                    self.name, lease.token, lease.fence, regained.fence,
+                )
+                lease, lost_at = regained, None
+                continue
+            lost_at = lost_at or time.monotonic()
+            if time.monotonic() - lost_at < self.lease_seconds:
+                logger.warning(
+                    "%s lease %s (fence %s) expired and no slot is free; retrying",
+                    self.name, lease.token, lease.fence,
+                )
+                continue
+            logger.error("%s lease %s lost; stopping its holder", self.name, lease.token)
+            lost.append(True)
+            owner.cancel()
+            return
+
+    def _lost_error(self, owner: asyncio.Task) -> LeaseLost:
+        # The cancellation was ours, not a request to stop the task.
+        owner.uncancel()
+        return LeaseLost(f"Lost the {self.name} slot to another holder")
+
+    @contextlib.asynccontextmanager
+    async def adopt(self, lease: Lease) -> AsyncIterator[Lease]:
+        """Keep an existing lease alive for the duration of the block, then release it.
+
+        Raises ``LeaseLost`` in the block if the lease cannot be kept.
+        """
+        owner = asyncio.current_task()
+        lost: List[bool] = []
+        keeper = asyncio.create_task(self._keep_alive(lease, owner, lost))
+        try:
+            yield lease
+        except asyncio.CancelledError:
+            if lost:
+                raise self._lost_error(owner) from None
+            raise
+        finally:
+            keeper.cancel()
+            await self.release(lease)
+
+    @contextlib.asynccontextmanager
+    async def hold(self, token: Optional[str] = None) -> AsyncIterator[Lease]:
+        lease = await self.acquire(token)
+        async with self.adopt(lease):
+            yield lease
+
+    async def __aenter__(self) -> Lease:
+        lease = await self.acquire()
+        owner = asyncio.current_task()
+        lost: List[bool] = []
+        keeper = asyncio.create_task(self._keep_alive(lease, owner, lost))
+        self._task_leases[owner] = (lease, keeper, lost)
+        return lease
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        owner = asyncio.current_task()
+        held = self._task_leases.pop(owner, None)
+        if held is None:
+            return
+        lease, keeper, lost = held
+        keeper.cancel()
+        await self.release(lease)
+        if lost and exc_type is asyncio.CancelledError:
+            raise self._lost_error(owner) from None
@@ -0,0 +1,612 @@
+"""One admission and dispatch point for all media downloads.
+
+Routes ``submit`` a job; it waits in a per-source queue until a slot for that
+source is free, then it is handed to ``JOB_QUEUE`` and the handler runs it
+inside ``running()``, which holds the slot and starts the next job when done.
+
+- Each source has its own concurrency limit (running jobs, cluster-wide
+  leases from ``DistributedSemaphore``) and queue cap (waiting jobs; beyond
+  it ``submit`` refuses the job).
+- Waiting jobs are ordered by start-time fair queuing: a job's tag is
+  ``max(client's last tag, tag of the last dispatched job) + 1``, so clients
+  (API key, else IP) take turns instead of one burst filling every slot.
+- Premium clients (``PREMIUM_API_KEYS``) form a priority class that is always
+  dispatched before the regular one, fairly among themselves.
+- Waiting jobs carry ``queue_position`` and ``estimated_wait_seconds``
+  (position in slot "waves" times the running average job duration).
+- How many of those slots are used, and how fast jobs start, adapts to
+  each host's throttling (see ``host_throttle``).
+- A request for a video in the media cache completes at once; one for a
+  video that is already queued or downloading joins that download instead
+  (see ``single_flight``). Neither takes a queue slot.
+
+State lives in Redis when available so every API instance and worker shares
+one queue; otherwise it is kept in-process.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import bisect
+import contextlib
+import hashlib
+import json
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from app.config import (
+    DOWNLOAD_DEFAULT_DURATION_SECONDS,
+    DOWNLOAD_DISPATCH_LEASE_SECONDS,
+    DOWNLOAD_FOLDER,
+    DOWNLOAD_RETENTION_SECONDS,
+    DOWNLOAD_SINGLE_FLIGHT,
+    INSTAGRAM_CONCURRENCY,
+    INSTAGRAM_QUEUE_SIZE,
+    PREMIUM_API_KEYS,
+    TIKTOK_CONCURRENCY,
+    TIKTOK_QUEUE_SIZE,
+    YOUTUBE_CONCURRENCY,
+    YOUTUBE_QUEUE_SIZE,
+)
+from app.downloaders.common import media_key
+from app.services.distributed_semaphore import DistributedSemaphore, Lease, LeaseLost
+from app.services.download_tracker import DOWNLOAD_TRACKER
+from app.services.host_throttle import HOST_THROTTLE, is_throttle_error
+from app.services.job_queue import JOB_QUEUE
+from app.services.redis_client import get_redis
+from app.services.media_cache import MEDIA_CACHE
+from app.services.single_flight import SINGLE_FLIGHT
+from app.utils.file_ops import delete_file_later
+
+logger = logging.getLogger(__name__)
+
+# Score offset of the regular class; premium jobs score below it.
+_CLASS_BAND = 2 ** 40
+PREMIUM, REGULAR = 0, 1
+
+_TICK_SECONDS = 2.0
+_CLIENT_TAG_TTL_SECONDS = 86400
+# Weight of the newest duration in the running average.
+_DURATION_ALPHA = 0.2
+
+# KEYS: waiting zset, payload hash, client tag hash, vclock.
+# ARGV: queue cap, process id, client, class, payload.
+# Returns the 1-based queue position, or 0 when the queue is full.
+_ENQUEUE_SCRIPT = """
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[1]) then
+  return 0
+end
+local vclock = tonumber(redis.call('GET', KEYS[4]) or '0')
+local last = tonumber(redis.call('HGET', KEYS[3], ARGV[3]) or '0')
+local tag = math.max(last, vclock) + 1
+redis.call('HSET', KEYS[3], ARGV[3], tag)
+redis.call('EXPIRE', KEYS[3], %(client_ttl)d)
+redis.call('ZADD', KEYS[1], tonumber(ARGV[4]) * %(band)d + tag, ARGV[2])
+redis.call('HSET', KEYS[2], ARGV[2], ARGV[5])
+return redis.call('ZRANK', KEYS[1], ARGV[2]) + 1
+""" % {"band": _CLASS_BAND, "client_ttl": _CLIENT_TAG_TTL_SECONDS}
+
+# KEYS: waiting zset, payload hash, vclock, slot holders zset, slot fence.
+# ARGV: limit, dispatch lease ms, max starts.
+# Moves as many waiting jobs as there are free slots (at most max starts)
+# into the holders set and returns a flat list of (process id, fence, payload).
+_DISPATCH_SCRIPT = """
+local now = redis.call('TIME')
+local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local lease_ms = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[4], '-inf', now_ms)
+local free = math.min(tonumber(ARGV[1]) - redis.call('ZCARD', KEYS[4]), tonumber(ARGV[3]))
+local vclock = tonumber(redis.call('GET', KEYS[3]) or '0')
+local out = {}
+while free > 0 do
+  local head = redis.call('ZPOPMIN', KEYS[1])
+  if #head == 0 then
+    break
+  end
+  local process_id = head[1]
+  local tag = tonumber(head[2]) %% %(band)d
+  if tag > vclock then
+    vclock = tag
+  end
+  local payload = redis.call('HGET', KEYS[2], process_id)
+  redis.call('HDEL', KEYS[2], process_id)
+  if payload then
+    redis.call('ZADD', KEYS[4], now_ms + lease_ms, process_id)
+    local fence = redis.call('INCR', KEYS[5])
+    table.insert(out, process_id)
+    table.insert(out, fence)
+    table.insert(out, payload)
+    free = free - 1
+  end
+end
+redis.call('SET', KEYS[3], vclock)
+if redis.call('PTTL', KEYS[4]) < lease_ms then
+  redis.call('PEXPIRE', KEYS[4], lease_ms)
+end
+return out
+""" % {"band": _CLASS_BAND}
+
+
+@dataclass(frozen=True)
+class SourceLimits:
+    concurrency: int
+    queue_size: int
+
+
+DEFAULT_LIMITS: Dict[str, SourceLimits] = {
+    "youtube": SourceLimits(YOUTUBE_CONCURRENCY, YOUTUBE_QUEUE_SIZE),
+    "tiktok": SourceLimits(TIKTOK_CONCURRENCY, TIKTOK_QUEUE_SIZE),
+    "instagram": SourceLimits(INSTAGRAM_CONCURRENCY, INSTAGRAM_QUEUE_SIZE),
+}
+
+
+def client_identity(request) -> Tuple[str, bool]:
+    """Return ``(client key, is premium)`` for a request.
+
+    Clients are told apart by API key when one is sent, else by address
+    (the first ``X-Forwarded-For`` hop set by Caddy).
+    """
+    api_key = (request.headers.get("x-api-key") or "").strip()
+    if api_key:
+        digest = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+        return f"key:{digest}", api_key in PREMIUM_API_KEYS
+    forwarded = (request.headers.get("x-forwarded-for") or "").split(",")[0].strip()
+    host = forwarded or (request.client.host if request.client else "") or "unknown"
+    return f"ip:{host}", False
+
+
+class _LocalQueue:
+    """In-process equivalent of one source's Redis keys."""
+
+    def __init__(self) -> None:
+        self.waiting: List[Tuple[float, str]] = []
+        self.payloads: Dict[str, str] = {}
+        # Client of each waiting job, to queue it in Redis when that returns.
+        self.clients: Dict[str, str] = {}
+        self.client_tags: Dict[str, int] = {}
+        self.vclock = 0
+
+
+class DownloadScheduler:
+    def __init__(
+        self,
+        limits: Optional[Dict[str, SourceLimits]] = None,
+        key_prefix: str = "download_scheduler:",
+        dispatch_lease_seconds: float = DOWNLOAD_DISPATCH_LEASE_SECONDS,
+    ) -> None:
+        self.limits = dict(limits or DEFAULT_LIMITS)
+        self.key_prefix = key_prefix
+        self.dispatch_lease_seconds = max(float(dispatch_lease_seconds), 1.0)
+        self.slots: Dict[str, DistributedSemaphore] = {
+            source: DistributedSemaphore(f"download:{source}", limit.concurrency)
+            for source, limit in self.limits.items()
+        }
+        self._scripts: Dict[str, object] = {}
+        self._client_id = None
+        self._local: Dict[str, _LocalQueue] = {source: _LocalQueue() for source in self.limits}
+        self._local_durations: Dict[str, float] = {}
+        # Last position written per waiting job, to skip unchanged updates.
+        self._positions: Dict[str, Dict[str, int]] = {source: {} for source in self.limits}
+        self._ticker: Optional[asyncio.Task] = None
+        self._wakeups: Dict[str, asyncio.TimerHandle] = {}
+
+    # -- Redis helpers -----------------------------------------------------
+
+    def _key(self, source: str, name: str) -> str:
+        return f"{self.key_prefix}{source}:{name}"
+
+    def _script(self, client, name: str, source: str):
+        if self._client_id != id(client):
+            self._scripts = {}
+            self._client_id = id(client)
+        script = self._scripts.get(name)
+        if script is None:
+            script = client.register_script(source)
+            self._scripts[name] = script
+        return script
+
+    # -- Admission ---------------------------------------------------------
+
+    def _enqueue_sync(
+        self, source: str, process_id: str, client_key: str, priority: int, payload: str
+    ) -> int:
+        cap = max(self.limits[source].queue_size, 0)
+        client = get_redis()
+        if client is not None:
+            return int(
+                self._script(client, "enqueue", _ENQUEUE_SCRIPT)(
+                    keys=[
+                        self._key(source, "waiting"),
+                        self._key(source, "payloads"),
+                        self._key(source, "clients"),
+                        self._key(source, "vclock"),
+                    ],
+                    args=[cap, process_id, client_key, priority, payload],
+                )
+            )
+
+        queue = self._local[source]
+        if len(queue.waiting) >= cap:
+            return 0
+        tag = max(queue.client_tags.get(client_key, 0), queue.vclock) + 1
+        queue.client_tags[client_key] = tag
+        entry = (priority * _CLASS_BAND + tag, process_id)
+        bisect.insort(queue.waiting, entry)
+        queue.payloads[process_id] = payload
+        queue.clients[process_id] = client_key
+        return queue.waiting.index(entry) + 1
+
+    def _migrate_sync(self, client, source: str, entries: List[Tuple[int, str, str, str]]) -> None:
+        script = self._script(client, "enqueue", _ENQUEUE_SCRIPT)
+        jobs = DOWNLOAD_TRACKER.get_jobs([entry[1] for entry in entries])
+        for priority, process_id, client_key, payload in entries:
+            job = jobs.get(process_id)
+            if job is None or DOWNLOAD_TRACKER.is_terminal(job.status):
+                # Cancelled while Redis was away.
+                continue
+            # Already admitted: no queue cap.
+            script(
+                keys=[
+                    self._key(source, "waiting"),
+                    self._key(source, "payloads"),
+                    self._key(source, "clients"),
+                    self._key(source, "vclock"),
+                ],
+                args=[2 ** 31, process_id, client_key, priority, payload],
+            )
+
+    async def _migrate_local(self, client, source: str) -> None:
+        """Move jobs queued in-process while Redis was down into Redis, in order."""
+        queue = self._local[source]
+        if not queue.waiting:
+            return
+        entries = [
+            (
+                int(score) // _CLASS_BAND,
+                process_id,
+                queue.clients.pop(process_id, "local"),
+                queue.payloads.pop(process_id),
+            )
+            for score, process_id in queue.waiting
+            if process_id in queue.payloads
+        ]
+        waiting, queue.waiting = queue.waiting, []
+        try:
+            await asyncio.to_thread(self._migrate_sync, client, source, entries)
+        except Exception:
+            # Redis went away again: keep them here. Moving them later
+            # rewrites any entries this attempt already wrote.
+            queue.waiting = sorted(waiting + queue.waiting)
+            for _, process_id, client_key, payload in entries:
+                queue.payloads[process_id] = payload
+                queue.clients[process_id] = client_key
+            raise
+        logger.info("Moved %d queued %s downloads to Redis", len(entries), source)
+
+    async def submit(
+        self,
+        source: str,
+        url: str,
+        payload: Dict[str, object],
+        client_key: str,
+        premium: bool = False,
+        process_id: Optional[str] = None,
+    ) -> Optional[str]:
+        """Create and enqueue a download job; ``None`` when the queue is full.
+
+        With ``process_id``, that existing job (a batch entry) is enqueued
+        instead of a new one.
+        """
+        quality = payload.get("quality")
+        job = DOWNLOAD_TRACKER.get_job(process_id) if process_id else None
+        if job is None:
+            job = DOWNLOAD_TRACKER.create_job(source=source, url=url, quality=quality)
+
+        key = None
+        if MEDIA_CACHE.enabled or DOWNLOAD_SINGLE_FLIGHT:
+            key = media_key(source, url, quality)
+        if key and MEDIA_CACHE.enabled:
+            cached = await asyncio.to_thread(MEDIA_CACHE.checkout, key, str(DOWNLOAD_FOLDER))
+            if cached:
+                DOWNLOAD_TRACKER.update_job(
+                    job.process_id,
+                    status="completed",
+                    progress=100.0,
+                    bytes_downloaded=cached.size,
+                    total_bytes=cached.size,
+                    file_path=cached.file_path,
+                    suggested_name=cached.suggested_name,
+                    selected_format=cached.selected_format,
+                )
+                delete_file_later(cached.file_path, delay=DOWNLOAD_RETENTION_SECONDS)
+                return job.process_id
+            payload = {**payload, "media_key": key}
+
+        DOWNLOAD_TRACKER.update_job(job.process_id, status="queued", progress=0.0)
+        flight = key if DOWNLOAD_SINGLE_FLIGHT else None
+        if flight:
+            if await SINGLE_FLIGHT.join(flight, job.process_id):
+                return job.process_id
+            payload = {**payload, "flight": flight}
+
+        position = await self._call(
+            self._enqueue_sync,
+            source,
+            job.process_id,
+            client_key,
+            PREMIUM if premium else REGULAR,
+            json.dumps(payload),
+        )
+        if not position:
+            DOWNLOAD_TRACKER.update_job(
+                job.process_id, status="failed", error="Download queue is full."
+            )
+            if flight:
+                await SINGLE_FLIGHT.finish(job.process_id, flight)
+            return None
+
+        self._ensure_ticker()
+        await self.dispatch(source)
+        return job.process_id
+
+    # -- Dispatch ----------------------------------------------------------
+
+    def _dispatch_redis(
+        self, client, source: str, max_starts: int
+    ) -> List[Tuple[str, int, bool, str]]:
+        slots = self.slots[source]
+        flat = self._script(client, "dispatch", _DISPATCH_SCRIPT)(
+            keys=[
+                self._key(source, "waiting"),
+                self._key(source, "payloads"),
+                self._key(source, "vclock"),
+                slots.holders_key,
+                slots.fence_key,
+            ],
+            args=[slots.limit, int(self.dispatch_lease_seconds * 1000), max_starts],
+        )
+        return [
+            (str(flat[i]), int(flat[i + 1]), False, str(flat[i + 2]))
+            for i in range(0, len(flat or []), 3)
+        ]
+
+    async def _dispatch_local(
+        self, source: str, max_starts: int
+    ) -> List[Tuple[str, int, bool, str]]:
+        queue = self._local[source]
+        dispatched = []
+        while queue.waiting and len(dispatched) < max_starts:
+            score, process_id = queue.waiting[0]
+            lease = await self.slots[source].try_acquire(process_id)
+            if lease is None:
+                break
+            queue.waiting.pop(0)
+            queue.vclock = max(queue.vclock, int(score) % _CLASS_BAND)
+            queue.clients.pop(process_id, None)
+            payload = queue.payloads.pop(process_id, None)
+            if payload is None:
+                await self.slots[source].release(lease)
+                continue
+            dispatched.append((process_id, lease.fence, lease.local, payload))
+        return dispatched
+
+    def _waiting_sync(self, source: str) -> Tuple[List[str], float]:
+        client = get_redis()
+        if client is not None:
+            pipe = client.pipeline(transaction=False)
+            pipe.zrange(self._key(source, "waiting"), 0, -1)
+            pipe.hget(self._key("stats", "duration_seconds"), source)
+            waiting, duration = pipe.execute()
+            return list(waiting), float(duration or DOWNLOAD_DEFAULT_DURATION_SECONDS)
+        duration = self._local_durations.get(source, DOWNLOAD_DEFAULT_DURATION_SECONDS)
+        return [process_id for _, process_id in self._local[source].waiting], duration
+
+    async def dispatch(self, source: str) -> int:
+        """Start as many waiting ``source`` jobs as there are free slots.
+
+        The host's adaptive limit sets the number of slots and its token
+        bucket the number of starts; when starts run out, another dispatch
+        is scheduled for when the next one is allowed.
+        """
+        limit, starts, wait = await HOST_THROTTLE.admit(source, self.limits[source].concurrency)
+        self.slots[source].limit = max(limit, 1)
+        try:
+            client = get_redis()
+            if client is not None:
+                await self._migrate_local(client, source)
+            if starts <= 0:
+                dispatched = []
+            elif client is not None:
+                dispatched = await asyncio.to_thread(self._dispatch_redis, client, source, starts)
+            else:
+                dispatched = await self._dispatch_local(source, starts)
+        except Exception as exc:
+            logger.warning("Dispatching %s downloads failed: %s", source, exc)
+            return 0
+        await HOST_THROTTLE.consume(source, len(dispatched))
+        if len(dispatched) >= starts:
+            self._wake_later(source, wait or 1 / HOST_THROTTLE.start_rate)
+
+        for process_id, fence, local, raw_payload in dispatched:
+            payload = json.loads(raw_payload or "{}")
+            payload.update({"slot_fence": fence, "slot_local": local})
+            DOWNLOAD_TRACKER.update_job(
+                process_id, queue_position=None, estimated_wait_seconds=None
+            )
+            self._positions[source].pop(process_id, None)
+            try:
+                JOB_QUEUE.submit(source, process_id, payload)
+            except Exception as exc:
+                await self.slots[source].release(Lease(process_id, fence, local))
+                DOWNLOAD_TRACKER.update_job(process_id, status="failed", error=str(exc))
+                await SINGLE_FLIGHT.finish(process_id, payload.get("flight"))
+
+        await self._publish_positions(source)
+        return len(dispatched)
+
+    def _wake_later(self, source: str, delay: float) -> None:
+        loop = asyncio.get_running_loop()
+        pending = self._wakeups.get(source)
+        if pending is not None:
+            if pending.when() <= loop.time() + delay:
+                return
+            pending.cancel()
+
+        def wake() -> None:
+            self._wakeups.pop(source, None)
+            asyncio.ensure_future(self.dispatch(source))
+
+        self._wakeups[source] = loop.call_later(delay, wake)
+
+    async def _publish_positions(self, source: str) -> None:
+        try:
+            waiting, duration = await self._call(self._waiting_sync, source)
+        except Exception as exc:
+            logger.warning("Reading the %s download queue failed: %s", source, exc)
+            return
+        concurrency = self.slots[source].limit
+        known = self._positions[source]
+        current = {}
+        for index, process_id in enumerate(waiting):
+            position = index + 1
+            current[process_id] = position
+            if known.get(process_id) == position:
+                continue
+            DOWNLOAD_TRACKER.update_job(
+                process_id,
+                queue_position=position,
+                estimated_wait_seconds=round(math.ceil(position / concurrency) * duration, 1),
+            )
+        self._positions[source] = current
+
+    # -- Cancellation ------------------------------------------------------
+
+    def _cancel_redis(self, client, source: str, process_id: str) -> bool:
+        pipe = client.pipeline()
+        pipe.zrem(self._key(source, "waiting"), process_id)
+        pipe.hdel(self._key(source, "payloads"), process_id)
+        pipe.zrem(self.slots[source].holders_key, process_id)
+        removed, _, _ = pipe.execute()
+        return bool(removed)
+
+    async def cancel(self, source: str, process_id: str) -> bool:
+        """Drop a job from the queue and free its slot if it was dispatched.
+
+        Returns True if the job was still waiting. A running job's own task
+        is stopped separately (see ``job_cancel``); its slot is freed here
+        right away so the next job does not wait for that to finish.
+        """
+        if source not in self.limits:
+            return False
+        client = get_redis()
+        if client is not None:
+            removed = await asyncio.to_thread(self._cancel_redis, client, source, process_id)
+        else:
+            queue = self._local[source]
+            entries = [entry for entry in queue.waiting if entry[1] == process_id]
+            for entry in entries:
+                queue.waiting.remove(entry)
+            queue.payloads.pop(process_id, None)
+            queue.clients.pop(process_id, None)
+            await self.slots[source].release(Lease(process_id, 0, local=True))
+            removed = bool(entries)
+        self._positions[source].pop(process_id, None)
+        await SINGLE_FLIGHT.finish(process_id)
+        await self.dispatch(source)
+        return removed
+
+    # -- Running -----------------------------------------------------------
+
+    @contextlib.asynccontextmanager
+    async def running(
+        self, source: str, process_id: str, payload: Dict[str, object]
+    ) -> AsyncIterator[Lease]:
+        """Hold the slot a dispatched job was given until the job ends."""
+        self._ensure_ticker()
+        slots = self.slots[source]
+        lease = Lease(
+            token=process_id,
+            fence=int(payload.get("slot_fence") or 0),
+            local=bool(payload.get("slot_local")),
+        )
+        try:
+            if not await slots.renew(lease):
+                # The dispatch lease ran out (e.g. the job was re-delivered
+                # after a worker crash); wait for a fresh slot.
+                lease = await slots.acquire(token=process_id)
+        except BaseException:
+            await asyncio.shield(slots.release(lease))
+            raise
+
+        started = time.monotonic()
+        try:
+            async with slots.adopt(lease):
+                yield lease
+        except LeaseLost as exc:
+            logger.warning("Download %s stopped: %s", process_id, exc)
+            DOWNLOAD_TRACKER.update_job_if_active(
+                process_id,
+                status="failed",
+                error="The server was too busy to finish this download. Please retry.",
+            )
+        finally:
+            await self._record_duration(source, time.monotonic() - started)
+            await self._record_outcome(source, process_id)
+            if payload.get("flight"):
+                await asyncio.shield(SINGLE_FLIGHT.finish(process_id, str(payload["flight"])))
+            await self.dispatch(source)
+
+    def _record_duration_sync(self, source: str, seconds: float) -> None:
+        client = get_redis()
+        key = self._key("stats", "duration_seconds")
+        previous = (
+            client.hget(key, source) if client is not None else self._local_durations.get(source)
+        )
+        value = seconds if previous is None else (
+            _DURATION_ALPHA * seconds + (1 - _DURATION_ALPHA) * float(previous)
+        )
+        if client is not None:
+            client.hset(key, source, f"{value:.3f}")
+        else:
+            self._local_durations[source] = value
+
+    async def _record_duration(self, source: str, seconds: float) -> None:
+        try:
+            await self._call(self._record_duration_sync, source, seconds)
+        except Exception as exc:
+            logger.warning("Recording %s download duration failed: %s", source, exc)
+
+    async def _record_outcome(self, source: str, process_id: str) -> None:
+        # Completed jobs raise the host's limit, throttled ones cut it;
+        # other failures and cancellations say nothing about the host.
+        job = DOWNLOAD_TRACKER.get_job(process_id)
+        if job is None:
+            return
+        if job.status == "completed":
+            await HOST_THROTTLE.record(source, throttled=False)
+        elif job.status == "failed" and is_throttle_error(job.error):
+            await HOST_THROTTLE.record(source, throttled=True)
+
+    # -- Housekeeping ------------------------------------------------------
+
+    async def _call(self, func, *args):
+        if get_redis() is None:
+            return func(*args)
+        return await asyncio.to_thread(func, *args)
+
+    def _ensure_ticker(self) -> None:
+        if self._ticker is None or self._ticker.done():
+            self._ticker = asyncio.create_task(self._tick_loop())
+
+    async def _tick_loop(self) -> None:
+        # Picks up slots freed by expired leases (crashed holders).
+        while True:
+            await asyncio.sleep(_TICK_SECONDS)
+            for source in self.limits:
+                await self.dispatch(source)
+
+
+DOWNLOAD_SCHEDULER = DownloadScheduler()
@@ -2,14 +2,42 @@ from __future__ import annotations
 
 import os
 import threading
+import time
 import uuid
 from dataclasses import dataclass, asdict
-from typing import Dict, Optional
+from typing import Callable, Dict, Iterable, List, Optional
 
+from redis.exceptions import WatchError
+
+from app.config import (
+    DOWNLOAD_JOB_ENCODING,
+    DOWNLOAD_JOB_FLUSH_INTERVAL_SECONDS,
+    DOWNLOAD_JOB_MEMORY_MAX_ENTRIES,
+    DOWNLOAD_JOB_TERMINAL_CACHE_SECONDS,
+    DOWNLOAD_JOB_TTL_SECONDS,
+    FILE_EXISTS_CACHE_SECONDS,
+    REDIS_RECONNECT_INTERVAL_SECONDS,
+)
+from app.services import job_codec
+from app.services.job_events import JobEventBroker
+from app.services.job_store import MemoryJobStore
 from app.services.redis_client import get_redis
 
+# Fields that change many times per second while a job runs. Updates touching
+# only these fields are merged in memory and written to Redis on the flush tick.
+PROGRESS_FIELDS = frozenset({"progress", "bytes_downloaded", "total_bytes"})
+
+# Statuses after which a job never changes again.
+TERMINAL_STATUSES = frozenset({"completed", "failed", "cancelled"})
+
+# What a detached job reports instead of the shared download's state.
+DETACHED_ERROR = "Cancelled by user"
+
+# Poll timestamps are written at most this often per job.
+_POLL_MARK_INTERVAL_SECONDS = 5
 
-@dataclass
+
+@dataclass(slots=True)
 class DownloadJob:
     process_id: str
     source: str
@@ -21,15 +49,81 @@ class DownloadJob:
     file_path: Optional[str] = None
     suggested_name: Optional[str] = None
     error: Optional[str] = None
+    # Set while the job waits in the download scheduler (1 = next to start).
+    queue_position: Optional[int] = None
+    estimated_wait_seconds: Optional[float] = None
+    # Requested quality tier and the format yt-dlp picked for it.
+    quality: Optional[str] = None
+    selected_format: Optional[str] = None
+    # Bytes a retried transfer did not fetch again (kept from the partial file).
+    bytes_resumed: Optional[int] = None
+    # File the running download writes, once it is the result as is (see
+    # file_follow.py), and how much of it is final when that is not simply
+    # its size (segmented transfers preallocate).
+    partial_path: Optional[str] = None
+    partial_bytes: Optional[int] = None
+    # Batch downloads (batch_downloads.py): an entry's parent job, and the
+    # parent's entry jobs in order (comma-separated; a list in job_payload).
+    batch_id: Optional[str] = None
+    children: Optional[str] = None
+    # Set when the caller cancelled a download other requests still follow:
+    # it keeps running for them but reads as cancelled (see job_cancel.py).
+    detached: bool = False
+    # Monotonic per-job change counter; doubles as the SSE event id.
+    version: int = 0
 
 
 class DownloadTracker:
-    def __init__(self) -> None:
-        self._jobs: Dict[str, DownloadJob] = {}
+    def __init__(
+        self,
+        flush_interval_seconds: float = DOWNLOAD_JOB_FLUSH_INTERVAL_SECONDS,
+        memory_max_entries: int = DOWNLOAD_JOB_MEMORY_MAX_ENTRIES,
+        encoding: str = DOWNLOAD_JOB_ENCODING,
+        redis_prefix: Optional[str] = None,
+    ) -> None:
         self._lock = threading.Lock()
-        self._redis = get_redis()
-        self._redis_prefix = "download_job:"
-        self._redis_ttl_seconds = int(os.environ.get("DOWNLOAD_JOB_TTL_SECONDS", "7200"))
+        # "packed" stores one binary value per job and needs a bytes client.
+        self._packed = encoding == "packed"
+        self._redis = get_redis(decode_responses=not self._packed)
+        # Separate key spaces so switching encodings never hits WRONGTYPE.
+        self._redis_prefix = redis_prefix or ("download_job_packed:" if self._packed else "download_job:")
+        self._redis_ttl_seconds = DOWNLOAD_JOB_TTL_SECONDS
+        # Fallback store when Redis is unavailable; bounded by TTL and LRU cap.
+        self._jobs: MemoryJobStore[DownloadJob] = MemoryJobStore(
+            ttl_seconds=self._redis_ttl_seconds, max_entries=memory_max_entries
+        )
+        self._last_reconnect_check = time.monotonic()
+
+        # Read caches (Redis mode): terminal jobs are immutable, and the
+        # file_exists check only needs to be roughly current.
+        self._terminal_cache: MemoryJobStore[DownloadJob] = MemoryJobStore(
+            ttl_seconds=DOWNLOAD_JOB_TERMINAL_CACHE_SECONDS, max_entries=4096
+        )
+        self._file_exists_cache: MemoryJobStore[bool] = MemoryJobStore(
+            ttl_seconds=FILE_EXISTS_CACHE_SECONDS, max_entries=4096
+        )
+
+        # Write-behind buffer for progress updates (Redis mode only).
+        # _write_lock serializes Redis writes so a late flush can never
+        # overwrite a newer write-through update for the same job.
+        self._pending: Dict[str, Dict[str, object]] = {}
+        self._write_lock = threading.Lock()
+        self._flush_interval_seconds = max(float(flush_interval_seconds), 0.05)
+        self._stop_event = threading.Event()
+        self._background_thread: Optional[threading.Thread] = None
+
+        self._last_version = 0
+        self.events = JobEventBroker(self._redis)
+
+        # When each job was last looked at by a client (see mark_polled).
+        self._polls_key = "download_job_polls"
+        self._polls: MemoryJobStore[float] = MemoryJobStore(
+            ttl_seconds=self._redis_ttl_seconds, max_entries=memory_max_entries
+        )
+        self._recent_polls: MemoryJobStore[bool] = MemoryJobStore(
+            ttl_seconds=_POLL_MARK_INTERVAL_SECONDS, max_entries=memory_max_entries
+        )
+        self._last_polls_trim = 0.0
 
     def _redis_key(self, process_id: str) -> str:
         return f"{self._redis_prefix}{process_id}"
@@ -54,7 +148,7 @@ class DownloadTracker:
             except ValueError:
                 return None
 
-        def opt_float(name: str, default: float = 0.0) -> float:
+        def opt_float(name: str, default: Optional[float] = 0.0) -> Optional[float]:
             raw = data.get(name)
             if raw is None or raw == "":
                 return default
@@ -74,86 +168,494 @@ class DownloadTracker:
             file_path=data.get("file_path") or None,
             suggested_name=data.get("suggested_name") or None,
             error=data.get("error") or None,
+            queue_position=opt_int("queue_position"),
+            estimated_wait_seconds=opt_float("estimated_wait_seconds", None),
+            quality=data.get("quality") or None,
+            selected_format=data.get("selected_format") or None,
+            bytes_resumed=opt_int("bytes_resumed"),
+            partial_path=data.get("partial_path") or None,
+            partial_bytes=opt_int("partial_bytes"),
+            batch_id=data.get("batch_id") or None,
+            children=data.get("children") or None,
+            detached=data.get("detached") == "1",
+            version=opt_int("version") or 0,
         )
 
-    def create_job(self, source: str, url: str) -> DownloadJob:
+    def _queue_write_full(self, pipe, process_id: str, data: Dict[str, object], ttl: int) -> None:
+        key = self._redis_key(process_id)
+        if self._packed:
+            pipe.set(key, job_codec.pack_job(data), ex=ttl)
+            return
+        mapping = {
+            field: encoded
+            for field, encoded in ((f, self._redis_encode(v)) for f, v in data.items())
+            if encoded is not None
+        }
+        pipe.hset(key, mapping=mapping)
+        pipe.expire(key, ttl)
+
+    def _queue_read(self, pipe, process_id: str) -> None:
+        if self._packed:
+            pipe.get(self._redis_key(process_id))
+        else:
+            pipe.hgetall(self._redis_key(process_id))
+
+    def _decode_read(self, raw) -> Optional[DownloadJob]:
+        if self._packed:
+            data = job_codec.unpack_job(raw)
+            return self.job_from_dict(data) if data else None
+        return self._redis_decode_job(raw)
+
+    def _next_version(self) -> int:
+        # Microsecond clock, forced strictly increasing within this process.
+        with self._lock:
+            self._last_version = max(time.time_ns() // 1000, self._last_version + 1)
+            return self._last_version
+
+    def create_job(self, source: str, url: str, quality: Optional[str] = None) -> DownloadJob:
         process_id = uuid.uuid4().hex
-        job = DownloadJob(process_id=process_id, source=source, url=url)
+        job = DownloadJob(
+            process_id=process_id,
+            source=source,
+            url=url,
+            quality=quality,
+            version=self._next_version(),
+        )
 
         if self._redis:
-            key = self._redis_key(process_id)
-            mapping = {
-                "process_id": process_id,
-                "source": source,
-                "url": url,
-                "status": job.status,
-                "progress": self._redis_encode(job.progress) or "0",
-                "bytes_downloaded": self._redis_encode(job.bytes_downloaded) or "0",
-            }
             pipe = self._redis.pipeline()
-            pipe.hset(key, mapping=mapping)
-            pipe.expire(key, self._redis_ttl_seconds)
+            self._queue_write_full(pipe, process_id, asdict(job), self._redis_ttl_seconds)
+            pipe.zadd(self._polls_key, {process_id: time.time()})
             pipe.execute()
             return job
 
         with self._lock:
-            self._jobs[process_id] = job
+            if self._redis is None:
+                self._jobs.set(process_id, job)
+                self._polls.set(process_id, time.time())
+                stored = True
+            else:
+                stored = False
+        if not stored:
+            # Redis came back while we were deciding; retry on that path.
+            return self.create_job(source, url, quality)
+        self._ensure_background()
         return job
 
     def get_job(self, process_id: str) -> Optional[DownloadJob]:
         if self._redis:
-            data = self._redis.hgetall(self._redis_key(process_id))
-            return self._redis_decode_job(data)
+            with self._lock:
+                cached = self._terminal_cache.get(process_id)
+            if cached:
+                return cached
+            pipe = self._redis.pipeline(transaction=False)
+            self._queue_read(pipe, process_id)
+            return self._finish_redis_read(process_id, pipe.execute()[0])
 
         with self._lock:
             return self._jobs.get(process_id)
 
-    def update_job(self, process_id: str, **updates) -> None:
-        if self._redis:
-            key = self._redis_key(process_id)
-            mapping: Dict[str, str] = {}
-            deletions = []
+    def get_jobs(self, process_ids: Iterable[str]) -> Dict[str, Optional[DownloadJob]]:
+        """Resolve many jobs at once, using a single pipeline for Redis misses."""
+        results: Dict[str, Optional[DownloadJob]] = {}
+        misses: List[str] = []
 
-            for field, value in updates.items():
-                if field not in DownloadJob.__dataclass_fields__:
+        with self._lock:
+            for process_id in process_ids:
+                if process_id in results:
                     continue
+                if self._redis:
+                    results[process_id] = self._terminal_cache.get(process_id)
+                    if results[process_id] is None:
+                        misses.append(process_id)
+                else:
+                    results[process_id] = self._jobs.get(process_id)
+
+        if misses and self._redis:
+            pipe = self._redis.pipeline(transaction=False)
+            for process_id in misses:
+                self._queue_read(pipe, process_id)
+            for process_id, raw in zip(misses, pipe.execute()):
+                results[process_id] = self._finish_redis_read(process_id, raw)
+
+        return results
+
+    def _finish_redis_read(self, process_id: str, raw) -> Optional[DownloadJob]:
+        job = self._decode_read(raw)
+        if not job:
+            return None
+        with self._lock:
+            pending = dict(self._pending.get(process_id) or {})
+            if not pending and self.is_terminal(job.status):
+                self._terminal_cache.set(process_id, job)
+        # Overlay progress that has not been flushed yet.
+        for field, value in pending.items():
+            setattr(job, field, value)
+        return job
+
+    def _queue_redis_update(
+        self,
+        pipe,
+        process_id: str,
+        updates: Dict[str, object],
+        current: Optional[Dict[str, object]] = None,
+    ) -> bool:
+        """Queue the writes for ``updates``; packed mode needs ``current`` unless
+        only fixed-offset fields change."""
+        key = self._redis_key(process_id)
+        applied = {
+            field: value
+            for field, value in updates.items()
+            if field in DownloadJob.__dataclass_fields__ and field != "version"
+        }
+        if not applied:
+            return False
+
+        version = self._next_version()
+        if self._packed:
+            if job_codec.FIXED_FIELDS.issuperset(applied):
+                for field, value in {**applied, "version": version}.items():
+                    offset, packed = job_codec.pack_field(field, value)
+                    pipe.setrange(key, offset, packed)
+                pipe.expire(key, self._redis_ttl_seconds)
+            elif current is not None:
+                data = dict(current)
+                data.update(applied)
+                data["version"] = version
+                pipe.set(key, job_codec.pack_job(data), ex=self._redis_ttl_seconds)
+            else:
+                return False
+        else:
+            mapping: Dict[str, str] = {}
+            deletions = []
+            for field, value in applied.items():
                 encoded = self._redis_encode(value)
                 if encoded is None:
                     deletions.append(field)
                 else:
                     mapping[field] = encoded
-
-            if not mapping and not deletions:
-                return
-
-            pipe = self._redis.pipeline()
-            if mapping:
-                pipe.hset(key, mapping=mapping)
+            mapping["version"] = str(version)
+            pipe.hset(key, mapping=mapping)
             if deletions:
                 pipe.hdel(key, *deletions)
             pipe.expire(key, self._redis_ttl_seconds)
-            pipe.execute()
+
+        self.events.queue_publish(pipe, JobEventBroker.build_event(process_id, version, applied))
+        return True
+
+    def update_job(self, process_id: str, **updates) -> None:
+        """Apply field updates to a job.
+
+        In Redis mode, progress-only updates are buffered and flushed on the
+        next tick; anything else (status, error, file_path, ...) is written
+        through immediately together with any buffered progress for the job.
+        """
+        self._update(process_id, updates)
+
+    def update_job_if_active(self, process_id: str, **updates) -> bool:
+        """Apply ``updates`` only if the job has not ended; False if it had.
+
+        The check and the write are one atomic step (WATCH/MULTI with
+        Redis), so e.g. a cancel can never overwrite a job that completed
+        in between.
+        """
+        return self._update(process_id, updates, only_active=True)
+
+    def _update(self, process_id: str, updates: Dict[str, object], only_active: bool = False) -> bool:
+        if self._redis:
+            if updates and PROGRESS_FIELDS.issuperset(updates) and not only_active:
+                with self._lock:
+                    self._pending.setdefault(process_id, {}).update(updates)
+                self._ensure_background()
+                return True
+
+            with self._write_lock:
+                with self._lock:
+                    merged = self._pending.pop(process_id, {})
+                    self._terminal_cache.pop(process_id)
+                buffered = dict(merged)
+                merged.update(updates)
+                try:
+                    if only_active or (
+                        self._packed and not job_codec.FIXED_FIELDS.issuperset(merged)
+                    ):
+                        # A check, or a read-modify-write of the packed value.
+                        written = self._write_watched(process_id, merged, only_active)
+                        if not written and buffered:
+                            self._requeue({process_id: buffered})
+                        return written
+                    pipe = self._redis.pipeline()
+                    if self._queue_redis_update(pipe, process_id, merged):
+                        pipe.execute()
+                except Exception:
+                    # The caller sees the error for its own update; keep the
+                    # buffered progress for the next flush.
+                    if buffered:
+                        self._requeue({process_id: buffered})
+                    raise
+            return True
+
+        applied = {
+            field: value
+            for field, value in updates.items()
+            if field in DownloadJob.__dataclass_fields__ and field != "version"
+        }
+        if not applied:
+            return False
+        version = self._next_version()
+        with self._lock:
+            if self._redis is not None:
+                job = None
+                promoted = True
+            else:
+                promoted = False
+                job = self._jobs.get(process_id)
+                if job and only_active and self.is_terminal(job.status):
+                    job = None
+                if job:
+                    for key, value in applied.items():
+                        setattr(job, key, value)
+                    job.version = version
+                    self._jobs.touch(process_id)
+        if promoted:
+            # Redis came back while we were deciding; retry on that path.
+            return self._update(process_id, updates, only_active)
+        if not job:
+            return False
+        self.events.publish_local(JobEventBroker.build_event(process_id, version, applied))
+        return True
+
+    def _write_watched(self, process_id: str, updates: Dict[str, object], only_active: bool) -> bool:
+        """Write ``updates`` if the job still exists (and, with ``only_active``,
+        has not ended), retrying if another process changes it meanwhile.
+
+        Packed values are rewritten whole, so without WATCH two processes
+        (API and worker) updating different fields would lose one update.
+        """
+        key = self._redis_key(process_id)
+        with self._redis.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    current = None
+                    if self._packed:
+                        current = job_codec.unpack_job(pipe.get(key))
+                        status = current.get("status") if current else None
+                    else:
+                        status = pipe.hget(key, "status")
+                    if status is None or (only_active and self.is_terminal(status)):
+                        pipe.unwatch()
+                        return False
+                    pipe.multi()
+                    if self._queue_redis_update(pipe, process_id, updates, current):
+                        pipe.execute()
+                    return True
+                except WatchError:
+                    # The job changed meanwhile; look again.
+                    continue
+
+    def progress_hook(self, process_id: str) -> Callable[[Dict], None]:
+        """Return a yt-dlp style progress hook that reports into this tracker."""
+
+        published = None
+
+        def hook(data: Dict) -> None:
+            nonlocal published
+            status = data.get("status")
+            if status == "downloading":
+                # Set by download_video for files that can be followed.
+                partial_path = data.get("partial_path")
+                if partial_path and partial_path != published:
+                    published = partial_path
+                    self.update_job(
+                        process_id,
+                        partial_path=partial_path,
+                        suggested_name=os.path.basename(data.get("filename") or partial_path),
+                    )
+                downloaded = int(data.get("downloaded_bytes") or 0)
+                total = data.get("total_bytes") or data.get("total_bytes_estimate")
+                progress = (
+                    (downloaded / total) * 100 if total and total > 0 else 0.0
+                )
+                self.update_job(
+                    process_id,
+                    bytes_downloaded=downloaded,
+                    total_bytes=int(total) if total else None,
+                    progress=progress,
+                )
+            elif status == "finished":
+                if data.get("format"):
+                    self.update_job(process_id, progress=100.0, selected_format=data["format"])
+                else:
+                    self.update_job(process_id, progress=100.0)
+
+        return hook
+
+    def flush(self) -> None:
+        """Write all buffered progress updates to Redis in a single pipeline."""
+        if not self._redis:
             return
+        with self._write_lock:
+            with self._lock:
+                if not self._pending:
+                    return
+                pending, self._pending = self._pending, {}
+                for process_id in pending:
+                    self._terminal_cache.pop(process_id)
+            try:
+                pipe = self._redis.pipeline(transaction=False)
+                queued = False
+                for process_id, updates in pending.items():
+                    queued = self._queue_redis_update(pipe, process_id, updates) or queued
+                if queued:
+                    pipe.execute()
+            except Exception:
+                self._requeue(pending)
+                raise
+
+    def _requeue(self, pending: Dict[str, Dict[str, object]]) -> None:
+        """Put back updates a failed write took out of the buffer, under any
+        newer ones buffered meanwhile, so the next flush writes them."""
+        with self._lock:
+            for process_id, updates in pending.items():
+                self._pending[process_id] = {**updates, **self._pending.get(process_id, {})}
+
+    def close(self, timeout: float = 2.0) -> None:
+        """Stop background threads and write out anything still buffered."""
+        self._stop_event.set()
+        if self._background_thread and self._background_thread.is_alive():
+            self._background_thread.join(timeout=timeout)
+        try:
+            self.flush()
+        except Exception:
+            pass
+        self.events.close(timeout=timeout)
 
+    def _ensure_background(self) -> None:
+        if self._background_thread and self._background_thread.is_alive():
+            return
         with self._lock:
-            job = self._jobs.get(process_id)
-            if not job:
+            if self._background_thread and self._background_thread.is_alive():
                 return
-            for key, value in updates.items():
-                if hasattr(job, key):
-                    setattr(job, key, value)
+            self._stop_event.clear()
+            self._background_thread = threading.Thread(target=self._background_loop, daemon=True)
+            self._background_thread.start()
+
+    def _background_loop(self) -> None:
+        while not self._stop_event.wait(timeout=self._flush_interval_seconds):
+            try:
+                if self._redis:
+                    self.flush()
+                else:
+                    self._maintain_memory_store()
+            except Exception:
+                # Never crash the background thread; a failed flush puts its
+                # updates back, so the next tick retries them.
+                pass
+
+    def _maintain_memory_store(self) -> None:
+        now = time.monotonic()
+        if now - self._last_reconnect_check < REDIS_RECONNECT_INTERVAL_SECONDS:
+            return
+        self._last_reconnect_check = now
+
+        with self._lock:
+            self._jobs.purge_expired()
+
+        client = get_redis(decode_responses=not self._packed)
+        if client is not None:
+            self._promote_to_redis(client)
+
+    def _promote_to_redis(self, client) -> None:
+        """Switch from the in-memory store to Redis, carrying live jobs over."""
+        with self._write_lock:
+            with self._lock:
+                if self._redis is not None:
+                    return
+                jobs = [(pid, asdict(job), self._jobs.ttl(pid)) for pid, job in self._jobs.items()]
+                self._redis = client
+                self._jobs.clear()
+            self.events.attach_redis(client)
+
+            pipe = client.pipeline(transaction=False)
+            for process_id, data, ttl in jobs:
+                if ttl > 0:
+                    self._queue_write_full(pipe, process_id, data, ttl)
+            pipe.execute()
+
+    def mark_polled(self, process_ids: Iterable[str]) -> None:
+        """Record that a client looked at these jobs (status read or stream)."""
+        now = time.time()
+        with self._lock:
+            fresh = [pid for pid in process_ids if self._recent_polls.get(pid) is None]
+            for pid in fresh:
+                self._recent_polls.set(pid, True)
+            if self._redis is None:
+                for pid in fresh:
+                    self._polls.set(pid, now)
+                return
+        if not fresh:
+            return
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.zadd(self._polls_key, {pid: now for pid in fresh})
+        if now - self._last_polls_trim > 60:
+            self._last_polls_trim = now
+            pipe.zremrangebyscore(self._polls_key, "-inf", now - self._redis_ttl_seconds)
+        pipe.execute()
+
+    def last_polled(self, process_id: str) -> Optional[float]:
+        """Epoch seconds of the last client poll (or creation) of a job."""
+        if self._redis:
+            return self._redis.zscore(self._polls_key, process_id)
+        with self._lock:
+            return self._polls.get(process_id)
 
     def serialize_job(self, process_id: str) -> Optional[Dict[str, object]]:
         job = self.get_job(process_id)
         if not job:
             return None
+        return self.job_payload(job)
+
+    def job_payload(self, job: DownloadJob) -> Dict[str, object]:
         payload = asdict(job)
+        if payload.pop("detached"):
+            payload.update(
+                status="cancelled",
+                error=DETACHED_ERROR,
+                file_path=None,
+                partial_path=None,
+                partial_bytes=None,
+            )
+        if payload.get("children"):
+            payload["children"] = payload["children"].split(",")
         if payload.get("file_path"):
-            payload["file_exists"] = os.path.exists(payload["file_path"])
+            payload["file_exists"] = self._file_exists(payload["file_path"])
         else:
             payload["file_exists"] = False
         return payload
 
+    def _file_exists(self, file_path: str) -> bool:
+        with self._lock:
+            cached = self._file_exists_cache.get(file_path)
+        if cached is not None:
+            return cached
+        exists = os.path.exists(file_path)
+        with self._lock:
+            self._file_exists_cache.set(file_path, exists)
+        return exists
+
+    @staticmethod
+    def job_fields() -> Iterable[str]:
+        return DownloadJob.__dataclass_fields__.keys()
+
+    @staticmethod
+    def job_from_dict(data: Dict[str, object]) -> DownloadJob:
+        return DownloadJob(**{k: v for k, v in data.items() if k in DownloadJob.__dataclass_fields__})
+
+    @staticmethod
+    def is_terminal(status: Optional[str]) -> bool:
+        return status in TERMINAL_STATUSES
+
     def protected_file_paths(self) -> set[str]:
         """Return file paths that should not be deleted yet (best-effort)."""
         protected: set[str] = set()
@@ -162,7 +664,11 @@ class DownloadTracker:
             # Best-effort: scan all known job keys.
             for key in self._redis.scan_iter(match=f"{self._redis_prefix}*"):
                 try:
-                    data = self._redis.hmget(key, "status", "file_path")
+                    if self._packed:
+                        job = job_codec.unpack_job(self._redis.get(key)) or {}
+                        data = [job.get("status"), job.get("file_path")]
+                    else:
+                        data = self._redis.hmget(key, "status", "file_path")
                 except Exception:
                     continue
                 status = data[0] if len(data) > 0 else None
@@ -172,7 +678,7 @@ class DownloadTracker:
             return protected
 
         with self._lock:
-            for job in self._jobs.values():
+            for _, job in self._jobs.items():
                 if job.status in {"pending", "running"} and job.file_path:
                     protected.add(job.file_path)
         return protected
@@ -0,0 +1,504 @@
+"""Health-scored pool of proxies and source addresses for yt-dlp traffic.
+
+``DOWNLOAD_EGRESS`` lists the ways out: proxies, local source addresses
+(several IPs on one host) or ``direct``. Every site (download source) keeps
+its own health record per egress, shared through Redis (in-process without
+it), because a proxy that YouTube rate limits may be fine for TikTok:
+
+- success rate over recent downloads (outcomes fade with
+  ``DOWNLOAD_EGRESS_HALF_LIFE_SECONDS``); only failures that point at the
+  egress count (429s, connection and proxy errors), not private or removed
+  videos;
+- throughput, an EWMA of bytes per second of finished downloads;
+- recent 429s, each of which halves the score until it fades.
+
+A job takes the egress with the best ``success rate × throughput × 0.5 ^
+recent 429s / (1 + downloads in flight)``. The success rate is sampled from
+its Beta distribution rather than taken as the mean, so new or recovered
+egresses still get tried. A 429, or ``DOWNLOAD_EGRESS_FAILURE_THRESHOLD``
+network failures in a row, takes the egress out of rotation for
+``DOWNLOAD_EGRESS_COOLDOWN_SECONDS``, doubling on each repeat up to
+``DOWNLOAD_EGRESS_COOLDOWN_MAX_SECONDS``; a success resets that.
+
+Without ``DOWNLOAD_EGRESS`` the pool is off and ``YOUTUBE_PROXY`` /
+``YOUTUBE_SOURCE_ADDRESS`` apply as before.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+from app.config import (
+    DOWNLOAD_EGRESS,
+    DOWNLOAD_EGRESS_COOLDOWN_MAX_SECONDS,
+    DOWNLOAD_EGRESS_COOLDOWN_SECONDS,
+    DOWNLOAD_EGRESS_FAILURE_THRESHOLD,
+    DOWNLOAD_EGRESS_HALF_LIFE_SECONDS,
+)
+from app.services.host_throttle import is_throttle_error
+from app.services.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+_STATE_TTL_SECONDS = 86400
+# In-flight leases of crashed processes stop counting after this long.
+_LEASE_SECONDS = 900
+# Weight of the newest sample in the throughput EWMA.
+_THROUGHPUT_ALPHA = 0.3
+# Info dicts remember the egress that extracted them under this key.
+EGRESS_INFO_KEY = "_egress"
+
+# Errors that say the way out is the problem rather than the video.
+_EGRESS_FAULT_MARKERS = (
+    "unable to connect",
+    "connection refused",
+    "connection reset",
+    "connection aborted",
+    "remote end closed",
+    "timed out",
+    "proxy",
+    "tunnel",
+    "network is unreachable",
+    "no route to host",
+    "transporterror",
+    "incompleteread",
+    "bytes, expected",  # body cut short
+)
+
+# KEYS: state hash. ARGV: outcome (ok | fail | throttle), bytes, seconds,
+# half-life ms, failure threshold, cooldown base ms, cooldown cap ms, EWMA
+# alpha. Returns the cooldown started, in ms (0 if none).
+_RECORD_SCRIPT = """
+local now = redis.call('TIME')
+local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local s = redis.call('HMGET', KEYS[1], 'ok', 'fail', 'throttle', 'decayed_ms', 'tput',
+  'streak', 'cooldowns', 'cooldown_until_ms')
+local keep = 0.5 ^ (math.max(now_ms - tonumber(s[4] or now_ms), 0) / tonumber(ARGV[4]))
+local ok = tonumber(s[1] or 0) * keep
+local fail = tonumber(s[2] or 0) * keep
+local throttle = tonumber(s[3] or 0) * keep
+local streak = tonumber(s[6] or 0)
+local cooldowns = tonumber(s[7] or 0)
+local cooldown = 0
+local outcome = ARGV[1]
+if outcome == 'ok' then
+  ok = ok + 1
+  streak = 0
+  cooldowns = 0
+  redis.call('HINCRBY', KEYS[1], 'successes', 1)
+  local nbytes = tonumber(ARGV[2])
+  local seconds = tonumber(ARGV[3])
+  if nbytes > 0 and seconds > 0 then
+    local rate = nbytes / seconds
+    local tput = tonumber(s[5] or rate)
+    redis.call('HSET', KEYS[1], 'tput', tput + (rate - tput) * tonumber(ARGV[8]))
+    redis.call('HINCRBY', KEYS[1], 'bytes', nbytes)
+    redis.call('HINCRBYFLOAT', KEYS[1], 'seconds', seconds)
+  end
+else
+  fail = fail + 1
+  redis.call('HINCRBY', KEYS[1], 'failures', 1)
+  if outcome == 'throttle' then
+    throttle = throttle + 1
+    redis.call('HINCRBY', KEYS[1], 'throttles', 1)
+  end
+  -- Jobs failing together while it already cools down count once.
+  if tonumber(s[8] or 0) <= now_ms then
+    streak = streak + 1
+    if outcome == 'throttle' or streak >= tonumber(ARGV[5]) then
+      cooldowns = cooldowns + 1
+      streak = 0
+      cooldown = math.floor(math.min(tonumber(ARGV[7]), tonumber(ARGV[6]) * 2 ^ (cooldowns - 1)))
+      redis.call('HSET', KEYS[1], 'cooldown_until_ms', now_ms + cooldown)
+      redis.call('HINCRBY', KEYS[1], 'cooled', 1)
+    end
+  end
+end
+redis.call('HSET', KEYS[1], 'ok', ok, 'fail', fail, 'throttle', throttle, 'decayed_ms', now_ms,
+  'streak', streak, 'cooldowns', cooldowns)
+redis.call('EXPIRE', KEYS[1], %(ttl)d)
+return cooldown
+""" % {"ttl": _STATE_TTL_SECONDS}
+
+
+@dataclass(frozen=True)
+class Egress:
+    """One way out: a proxy, a local source address, or neither (direct)."""
+
+    name: str
+    proxy: Optional[str] = None
+    source_address: Optional[str] = None
+
+    @property
+    def kind(self) -> str:
+        if self.proxy:
+            return "proxy"
+        return "source_address" if self.source_address else "direct"
+
+
+def parse_egress(entry: str) -> Egress:
+    """Build an ``Egress`` from a ``DOWNLOAD_EGRESS`` entry.
+
+    Proxy names drop the credentials, so stats and logs never show them.
+    """
+    entry = entry.strip()
+    if entry.lower() == "direct":
+        return Egress("direct")
+    if "://" in entry:
+        parts = urlsplit(entry)
+        host = parts.hostname or ""
+        name = f"{parts.scheme}://{host}:{parts.port}" if parts.port else f"{parts.scheme}://{host}"
+        return Egress(name, proxy=entry)
+    return Egress(f"source:{entry}", source_address=entry)
+
+
+def egress_outcome(error: Optional[BaseException]) -> Optional[str]:
+    """``ok``, ``throttle`` or ``fail`` for an egress; None if the error is not its fault."""
+    if error is None:
+        return "ok"
+    if is_throttle_error(error):
+        return "throttle"
+    message = str(error).lower()
+    if any(marker in message for marker in _EGRESS_FAULT_MARKERS):
+        return "fail"
+    return None
+
+
+def info_for_egress(info: Optional[Dict], lease: "EgressLease") -> Optional[Dict]:
+    """``info`` if it may be downloaded through the lease's egress, else None.
+
+    Media URLs in an info dict can be signed for the address that extracted it.
+    """
+    extracted_by = (info or {}).get(EGRESS_INFO_KEY)
+    if extracted_by and extracted_by != lease.name:
+        return None
+    return info
+
+
+@dataclass
+class EgressLease:
+    """An egress held by one download; ``egress`` is None when the pool is off."""
+
+    source: str
+    egress: Optional[Egress] = None
+    token: str = ""
+    started: float = 0.0
+    bytes: int = 0
+
+    @property
+    def name(self) -> Optional[str]:
+        return self.egress.name if self.egress else None
+
+
+def _f(state: Dict, field: str, default: float = 0.0) -> float:
+    value = state.get(field)
+    return float(value) if value not in (None, "") else default
+
+
+class EgressPool:
+    def __init__(
+        self,
+        entries: Sequence[str] = DOWNLOAD_EGRESS,
+        sources: Sequence[str] = ("youtube", "tiktok", "instagram"),
+        failure_threshold: int = DOWNLOAD_EGRESS_FAILURE_THRESHOLD,
+        cooldown_seconds: float = DOWNLOAD_EGRESS_COOLDOWN_SECONDS,
+        cooldown_max_seconds: float = DOWNLOAD_EGRESS_COOLDOWN_MAX_SECONDS,
+        half_life_seconds: float = DOWNLOAD_EGRESS_HALF_LIFE_SECONDS,
+        key_prefix: str = "egress:",
+    ) -> None:
+        egresses: Dict[str, Egress] = {}
+        for entry in entries:
+            egress = parse_egress(entry)
+            egresses.setdefault(egress.name, egress)
+        self.egresses: List[Egress] = list(egresses.values())
+        self.sources = tuple(sources)
+        self.failure_threshold = max(int(failure_threshold), 1)
+        self.cooldown_seconds = max(float(cooldown_seconds), 0.0)
+        self.cooldown_max_seconds = max(float(cooldown_max_seconds), self.cooldown_seconds)
+        self.half_life_seconds = max(float(half_life_seconds), 1.0)
+        self.key_prefix = key_prefix
+        self._scripts: Dict[str, object] = {}
+        self._client_id = None
+        self._lock = threading.Lock()
+        self._local: Dict[Tuple[str, str], Dict[str, float]] = {}
+        self._local_inflight: Dict[Tuple[str, str], int] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.egresses)
+
+    # -- Redis helpers -----------------------------------------------------
+
+    def _key(self, source: str, name: str) -> str:
+        return f"{self.key_prefix}{source}:{name}"
+
+    def _lease_key(self, source: str, name: str) -> str:
+        return f"{self.key_prefix}leases:{source}:{name}"
+
+    def _script(self, client, name: str, source: str):
+        if self._client_id != id(client):
+            self._scripts = {}
+            self._client_id = id(client)
+        script = self._scripts.get(name)
+        if script is None:
+            script = client.register_script(source)
+            self._scripts[name] = script
+        return script
+
+    async def _call(self, func, *args):
+        if get_redis() is None:
+            return func(*args)
+        return await asyncio.to_thread(func, *args)
+
+    def _read_sync(self, source: str) -> Tuple[float, List[Dict], List[int]]:
+        """``(now ms, state per egress, downloads in flight per egress)``."""
+        client = get_redis()
+        if client is None:
+            with self._lock:
+                states = [dict(self._local.get((source, e.name), {})) for e in self.egresses]
+                inflight = [self._local_inflight.get((source, e.name), 0) for e in self.egresses]
+            return time.time() * 1000, states, inflight
+        now = time.time()
+        pipe = client.pipeline(transaction=False)
+        pipe.time()
+        for egress in self.egresses:
+            lease_key = self._lease_key(source, egress.name)
+            pipe.hgetall(self._key(source, egress.name))
+            pipe.zremrangebyscore(lease_key, "-inf", now)
+            pipe.zcard(lease_key)
+        results = pipe.execute()
+        seconds, micros = results[0]
+        rest = results[1:]
+        return seconds * 1000 + micros / 1000, rest[0::3], [int(count) for count in rest[2::3]]
+
+    # -- Scoring -----------------------------------------------------------
+
+    def _decayed(self, state: Dict, now_ms: float) -> Tuple[float, float, float]:
+        age = max(now_ms - _f(state, "decayed_ms", now_ms), 0.0)
+        keep = 0.5 ** (age / (self.half_life_seconds * 1000))
+        return _f(state, "ok") * keep, _f(state, "fail") * keep, _f(state, "throttle") * keep
+
+    def _choose(
+        self, states: List[Dict], inflight: List[int], now_ms: float, prefer: Optional[str]
+    ) -> Egress:
+        known = [_f(state, "tput") for state in states if _f(state, "tput") > 0]
+        # Egresses without a measurement are assumed as fast as the best one.
+        fallback = max(known) if known else 1.0
+        best: Optional[Tuple[float, Egress]] = None
+        for egress, state, count in zip(self.egresses, states, inflight):
+            if _f(state, "cooldown_until_ms") > now_ms:
+                continue
+            if egress.name == prefer:
+                return egress
+            ok, fail, throttle = self._decayed(state, now_ms)
+            rate = random.betavariate(ok + 1, fail + 1)
+            throughput = _f(state, "tput") or fallback
+            score = rate * throughput * 0.5 ** throttle / (1 + count)
+            if best is None or score > best[0]:
+                best = (score, egress)
+        if best is not None:
+            return best[1]
+        # Everything is cooling down: use the one that recovers first.
+        index = min(
+            range(len(self.egresses)), key=lambda i: _f(states[i], "cooldown_until_ms")
+        )
+        return self.egresses[index]
+
+    # -- Leases ------------------------------------------------------------
+
+    def _acquire_sync(self, source: str, prefer: Optional[str]) -> EgressLease:
+        now_ms, states, inflight = self._read_sync(source)
+        egress = self._choose(states, inflight, now_ms, prefer)
+        lease = EgressLease(source, egress, uuid.uuid4().hex, time.monotonic())
+        client = get_redis()
+        if client is None:
+            with self._lock:
+                key = (source, egress.name)
+                self._local_inflight[key] = self._local_inflight.get(key, 0) + 1
+            return lease
+        lease_key = self._lease_key(source, egress.name)
+        pipe = client.pipeline(transaction=False)
+        pipe.zadd(lease_key, {lease.token: time.time() + _LEASE_SECONDS})
+        pipe.expire(lease_key, _LEASE_SECONDS)
+        pipe.execute()
+        return lease
+
+    async def acquire(self, source: str, prefer: Optional[str] = None) -> EgressLease:
+        """Take the best egress for a download from ``source``.
+
+        ``prefer`` (an egress name) is used whenever it is not cooling down,
+        e.g. for info extracted through it: signed media URLs can be bound
+        to the address that requested them.
+        """
+        if not self.enabled:
+            return EgressLease(source)
+        try:
+            return await self._call(self._acquire_sync, source, prefer)
+        except Exception as exc:
+            logger.warning("Choosing an egress for %s failed: %s", source, exc)
+            return EgressLease(source, random.choice(self.egresses), "", time.monotonic())
+
+    def _apply_local(self, state: Dict[str, float], outcome: str, nbytes: int, seconds: float) -> float:
+        """In-process twin of ``_RECORD_SCRIPT``; returns the cooldown started (ms)."""
+        now_ms = time.time() * 1000
+        ok, fail, throttle = self._decayed(state, now_ms)
+        cooldown = 0.0
+        if outcome == "ok":
+            ok += 1
+            state["streak"] = 0
+            state["cooldowns"] = 0
+            state["successes"] = _f(state, "successes") + 1
+            if nbytes > 0 and seconds > 0:
+                rate = nbytes / seconds
+                tput = _f(state, "tput") or rate
+                state["tput"] = tput + (rate - tput) * _THROUGHPUT_ALPHA
+                state["bytes"] = _f(state, "bytes") + nbytes
+                state["seconds"] = _f(state, "seconds") + seconds
+        else:
+            fail += 1
+            state["failures"] = _f(state, "failures") + 1
+            if outcome == "throttle":
+                throttle += 1
+                state["throttles"] = _f(state, "throttles") + 1
+            if _f(state, "cooldown_until_ms") <= now_ms:
+                state["streak"] = _f(state, "streak") + 1
+                if outcome == "throttle" or state["streak"] >= self.failure_threshold:
+                    state["cooldowns"] = _f(state, "cooldowns") + 1
+                    state["streak"] = 0
+                    cooldown = min(
+                        self.cooldown_max_seconds * 1000,
+                        self.cooldown_seconds * 1000 * 2 ** (state["cooldowns"] - 1),
+                    )
+                    state["cooldown_until_ms"] = now_ms + cooldown
+                    state["cooled"] = _f(state, "cooled") + 1
+        state.update(ok=ok, fail=fail, throttle=throttle, decayed_ms=now_ms)
+        return cooldown
+
+    def _release_sync(self, lease: EgressLease, outcome: Optional[str]) -> float:
+        name = lease.egress.name
+        seconds = max(time.monotonic() - lease.started, 0.0)
+        client = get_redis()
+        if client is None:
+            with self._lock:
+                key = (lease.source, name)
+                self._local_inflight[key] = max(self._local_inflight.get(key, 0) - 1, 0)
+                if outcome is None:
+                    return 0.0
+                state = self._local.setdefault(key, {})
+                return self._apply_local(state, outcome, lease.bytes, seconds) / 1000
+        if lease.token:
+            client.zrem(self._lease_key(lease.source, name), lease.token)
+        if outcome is None:
+            return 0.0
+        cooldown_ms = self._script(client, "record", _RECORD_SCRIPT)(
+            keys=[self._key(lease.source, name)],
+            args=[
+                outcome,
+                int(lease.bytes),
+                seconds,
+                int(self.half_life_seconds * 1000),
+                self.failure_threshold,
+                int(self.cooldown_seconds * 1000),
+                int(self.cooldown_max_seconds * 1000),
+                _THROUGHPUT_ALPHA,
+            ],
+        )
+        return int(cooldown_ms) / 1000
+
+    async def release(self, lease: EgressLease, outcome: Optional[str]) -> None:
+        """Return a lease and score its egress (``outcome`` None: leave the score alone)."""
+        if lease.egress is None:
+            return
+        try:
+            cooldown = await self._call(self._release_sync, lease, outcome)
+        except Exception as exc:
+            logger.warning("Recording the %s egress outcome failed: %s", lease.name, exc)
+            return
+        if cooldown:
+            logger.info(
+                "Egress %s is failing for %s; cooling it down for %.0fs",
+                lease.name,
+                lease.source,
+                cooldown,
+            )
+
+    @contextlib.asynccontextmanager
+    async def use(self, source: str, prefer: Optional[str] = None) -> AsyncIterator[EgressLease]:
+        """Hold an egress for the block; its outcome is read from how the block exits.
+
+        Set ``lease.bytes`` to the size downloaded so throughput is measured.
+        """
+        lease = await self.acquire(source, prefer)
+        try:
+            yield lease
+        except asyncio.CancelledError:
+            await asyncio.shield(self.release(lease, None))
+            raise
+        except Exception as exc:
+            await self.release(lease, egress_outcome(exc))
+            raise
+        else:
+            await self.release(lease, "ok")
+
+    # -- Metrics -----------------------------------------------------------
+
+    def _source_stats(self, state: Dict, inflight: int, now_ms: float) -> Dict[str, object]:
+        ok, fail, throttle = self._decayed(state, now_ms)
+        seconds = _f(state, "seconds")
+        return {
+            "success_rate": round((ok + 1) / (ok + fail + 2), 3),
+            "recent_throttles": round(throttle, 2),
+            "throughput_bps": int(_f(state, "tput")),
+            "average_throughput_bps": int(_f(state, "bytes") / seconds) if seconds else 0,
+            "bytes": int(_f(state, "bytes")),
+            "downloads": int(_f(state, "successes")),
+            "failures": int(_f(state, "failures")),
+            "throttle_events": int(_f(state, "throttles")),
+            "cooldowns": int(_f(state, "cooled")),
+            "cooling_for_seconds": round(max(_f(state, "cooldown_until_ms") - now_ms, 0.0) / 1000, 1),
+            "in_flight": inflight,
+        }
+
+    def stats(self) -> Dict[str, object]:
+        egresses = {
+            egress.name: {"kind": egress.kind, "bytes": 0, "seconds": 0.0, "sources": {}}
+            for egress in self.egresses
+        }
+        for source in self.sources:
+            now_ms, states, inflight = self._read_sync(source)
+            for egress, state, count in zip(self.egresses, states, inflight):
+                entry = egresses[egress.name]
+                entry["sources"][source] = self._source_stats(state, count, now_ms)
+                entry["bytes"] += int(_f(state, "bytes"))
+                entry["seconds"] += _f(state, "seconds")
+        for entry in egresses.values():
+            seconds = entry.pop("seconds")
+            entry["throughput_bps"] = int(entry["bytes"] / seconds) if seconds else 0
+        return {"enabled": self.enabled, "egresses": egresses}
+
+    def reset(self) -> None:
+        client = get_redis()
+        if client is not None:
+            keys = [
+                key
+                for source in self.sources
+                for egress in self.egresses
+                for key in (self._key(source, egress.name), self._lease_key(source, egress.name))
+            ]
+            if keys:
+                client.delete(*keys)
+        with self._lock:
+            self._local.clear()
+            self._local_inflight.clear()
+
+
+EGRESS_POOL = EgressPool()
@@ -0,0 +1,53 @@
+"""Faststart post-processing of downloaded MP4s (``MEDIA_FASTSTART``).
+
+yt-dlp's ffmpeg merge (and some sites' files) put the ``moov`` atom after
+the media data, so a player needs the whole file before it can start.
+``apply_faststart`` runs after ``download_video``:
+
+- it reads the top-level atom order and does nothing when ``moov`` already
+  comes first (the usual case for single-file formats);
+- otherwise ffmpeg remuxes the file with ``-c copy -movflags +faststart``
+  (no re-encoding), at most ``MEDIA_FASTSTART_CONCURRENCY`` at a time
+  across the cluster, and the result replaces the file before the job
+  completes;
+- a download that was published for following (``partial_path``) is left
+  as is, so clients already streaming it get the same file;
+- a failed remux keeps the original file: the job still completes.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+
+from app.config import MEDIA_FASTSTART, MEDIA_FASTSTART_CONCURRENCY
+from app.downloaders.common import needs_faststart, remux_faststart
+from app.services.distributed_semaphore import DistributedSemaphore
+from app.services.download_tracker import DOWNLOAD_TRACKER
+
+logger = logging.getLogger(__name__)
+
+_EXTENSIONS = (".mp4", ".m4a", ".m4v", ".mov")
+
+_FASTSTART_SEMAPHORE = DistributedSemaphore("media_faststart", MEDIA_FASTSTART_CONCURRENCY)
+
+
+async def apply_faststart(process_id: str, file_path: str) -> bool:
+    """Move ``file_path``'s ``moov`` atom to the front if needed; True if it was remuxed."""
+    if not MEDIA_FASTSTART or not file_path.lower().endswith(_EXTENSIONS):
+        return False
+    job = DOWNLOAD_TRACKER.get_job(process_id)
+    if job is not None and job.partial_path:
+        return False
+    try:
+        if not await asyncio.to_thread(needs_faststart, file_path):
+            return False
+        async with _FASTSTART_SEMAPHORE:
+            started = time.monotonic()
+            await remux_faststart(file_path)
+    except Exception as exc:
+        logger.warning("Faststart remux of %s failed; keeping it as is: %s", file_path, exc)
+        return False
+    logger.info("Moved moov to the front of %s in %.1fs", file_path, time.monotonic() - started)
+    return True
@@ -0,0 +1,82 @@
+"""Stream a download's result file while the job is still writing it.
+
+A job publishes ``partial_path`` once its bytes land in a file that becomes
+the result as is: a progressive yt-dlp format (``<name>.part``) or the
+remote downloader's file. Those writers append, so everything below the
+file's size is final; segmented remote transfers preallocate the file and
+publish the written prefix as ``partial_bytes`` instead. A writer that has
+to start over does so in a new file under a new ``partial_path``.
+
+The reader keeps its descriptor, which survives yt-dlp renaming ``.part``
+to the final name. When the job completes it sends the rest and stops; if
+the job fails, or the result turns out to be a different file (rewritten
+by a post-processor), it breaks off the response so the client sees an
+incomplete download rather than a wrong one.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+from typing import AsyncIterator, BinaryIO
+
+from app.config import CHUNK_SIZE, DOWNLOAD_FOLLOW_POLL_SECONDS
+from app.services.download_tracker import DOWNLOAD_TRACKER
+
+
+class FollowAborted(RuntimeError):
+    """The followed download cannot be finished; the response is cut off."""
+
+
+async def follow_job_file(
+    process_id: str,
+    handle: BinaryIO,
+    poll_seconds: float = DOWNLOAD_FOLLOW_POLL_SECONDS,
+    chunk_size: int = CHUNK_SIZE,
+) -> AsyncIterator[bytes]:
+    """Yield the bytes of ``handle`` (the job's ``partial_path``) as they become final.
+
+    Closes ``handle`` when done.
+    """
+    fd = handle.fileno()
+    path = handle.name
+    inode = os.fstat(fd).st_ino
+    sent = 0
+    try:
+        while True:
+            job = await asyncio.to_thread(DOWNLOAD_TRACKER.get_job, process_id)
+            if job is None:
+                raise FollowAborted(f"Job {process_id} is gone")
+            # A client reading the file is still waiting for the job.
+            DOWNLOAD_TRACKER.mark_polled([process_id])
+            completed = job.status == "completed"
+            if completed:
+                try:
+                    same_file = bool(job.file_path) and os.stat(job.file_path).st_ino == inode
+                except OSError:
+                    same_file = False
+                if not same_file:
+                    raise FollowAborted(f"Job {process_id} finished with a different file")
+                limit = os.fstat(fd).st_size
+            elif DOWNLOAD_TRACKER.is_terminal(job.status):
+                raise FollowAborted(f"Job {process_id} ended {job.status}")
+            elif job.partial_path != path:
+                raise FollowAborted(f"Job {process_id} moved on to another file")
+            else:
+                limit = os.fstat(fd).st_size
+                if job.partial_bytes is not None:
+                    limit = min(limit, job.partial_bytes)
+                if limit < sent:
+                    raise FollowAborted(f"Job {process_id} started its file over")
+
+            while sent < limit:
+                chunk = await asyncio.to_thread(os.pread, fd, min(chunk_size, limit - sent), sent)
+                if not chunk:
+                    break
+                sent += len(chunk)
+                yield chunk
+            if completed:
+                return
+            await asyncio.sleep(poll_seconds)
+    finally:
+        handle.close()
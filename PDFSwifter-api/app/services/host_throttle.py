@@ -0,0 +1,365 @@
+"""Adaptive concurrency and start-rate limiting per download host.
+
+Each source (YouTube, TikTok, Instagram) is one host family, and each gets
+one controller shared by every API instance and worker (Redis hash; an
+in-process state without Redis):
+
+- AIMD limit: every successful download raises the concurrency limit by
+  ``1 / limit`` (about +1 per limit's worth of successes); a throttle signal
+  (HTTP 429, "too many requests", YouTube's bot check) multiplies it by
+  ``DOWNLOAD_AIMD_DECREASE_FACTOR``. The limit stays between 1 and
+  ``DOWNLOAD_AIMD_MAX_FACTOR`` times the configured concurrency, which is
+  where it starts. Throttles within one backoff window count as one cut, so
+  a burst of 429s from jobs started together halves the limit once.
+- Token bucket: job starts take a token; tokens refill at
+  ``DOWNLOAD_START_RATE`` per second up to ``DOWNLOAD_START_BURST``.
+- Backoff: each cut also pauses new starts for a jittered, exponentially
+  growing time (base ``DOWNLOAD_BACKOFF_BASE_SECONDS``, capped at
+  ``DOWNLOAD_BACKOFF_MAX_SECONDS``); a success resets the exponent.
+
+``DownloadScheduler`` asks ``admit`` before dispatching, so a throttled host
+stops receiving new jobs at once instead of each job backing off alone.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from app.config import (
+    DOWNLOAD_ADAPTIVE_CONCURRENCY,
+    DOWNLOAD_AIMD_DECREASE_FACTOR,
+    DOWNLOAD_AIMD_MAX_FACTOR,
+    DOWNLOAD_BACKOFF_BASE_SECONDS,
+    DOWNLOAD_BACKOFF_MAX_SECONDS,
+    DOWNLOAD_START_BURST,
+    DOWNLOAD_START_RATE,
+    INSTAGRAM_CONCURRENCY,
+    TIKTOK_CONCURRENCY,
+    YOUTUBE_CONCURRENCY,
+)
+from app.services.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+_STATE_TTL_SECONDS = 86400
+
+_THROTTLE_MARKERS = (
+    "http error 429",
+    "too many requests",
+    "rate-limit",
+    "rate limit",
+    "not a bot",
+    "(429)",
+)
+
+# All scripts take KEYS: state hash. The limit starts at ARGV[1] (initial).
+
+# ARGV: initial, rate/s, burst.
+# Refills the bucket; returns {limit, whole tokens available, wait ms}.
+_ADMIT_SCRIPT = """
+local now = redis.call('TIME')
+local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local state = redis.call('HMGET', KEYS[1], 'limit', 'tokens', 'refilled_ms', 'paused_until_ms')
+local limit = tonumber(state[1] or ARGV[1])
+local rate = tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local tokens = tonumber(state[2] or ARGV[3])
+local refilled = tonumber(state[3] or now_ms)
+tokens = math.min(burst, tokens + rate * (now_ms - refilled) / 1000)
+redis.call('HSET', KEYS[1], 'limit', limit, 'tokens', tokens, 'refilled_ms', now_ms)
+redis.call('EXPIRE', KEYS[1], %(ttl)d)
+local paused_until = tonumber(state[4] or 0)
+if paused_until > now_ms then
+  return {math.floor(limit), 0, paused_until - now_ms}
+end
+if tokens >= 1 then
+  return {math.floor(limit), math.floor(tokens), 0}
+end
+return {math.floor(limit), 0, math.ceil((1 - tokens) * 1000 / rate)}
+""" % {"ttl": _STATE_TTL_SECONDS}
+
+# ARGV: initial, ceiling. Additive increase.
+_SUCCESS_SCRIPT = """
+local limit = tonumber(redis.call('HGET', KEYS[1], 'limit') or ARGV[1])
+limit = math.min(tonumber(ARGV[2]), limit + 1 / math.max(limit, 1))
+redis.call('HSET', KEYS[1], 'limit', limit, 'streak', 0)
+redis.call('HINCRBY', KEYS[1], 'successes', 1)
+redis.call('EXPIRE', KEYS[1], %(ttl)d)
+return tostring(limit)
+""" % {"ttl": _STATE_TTL_SECONDS}
+
+# ARGV: initial, decrease factor, backoff base ms, backoff cap ms, jitter (0-1).
+# Multiplicative decrease and pause, once per backoff window; returns the
+# pause in ms (the remaining one when the window is already open).
+_THROTTLE_SCRIPT = """
+local now = redis.call('TIME')
+local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local state = redis.call('HMGET', KEYS[1], 'limit', 'streak', 'paused_until_ms')
+redis.call('HINCRBY', KEYS[1], 'throttles', 1)
+redis.call('EXPIRE', KEYS[1], %(ttl)d)
+local paused_until = tonumber(state[3] or 0)
+if paused_until > now_ms then
+  return paused_until - now_ms
+end
+local limit = tonumber(state[1] or ARGV[1])
+local streak = tonumber(state[2] or 0) + 1
+limit = math.max(1, limit * tonumber(ARGV[2]))
+local backoff = math.min(tonumber(ARGV[4]), tonumber(ARGV[3]) * 2 ^ (streak - 1))
+local pause = math.floor(backoff * (0.5 + 0.5 * tonumber(ARGV[5])))
+redis.call('HSET', KEYS[1], 'limit', limit, 'streak', streak, 'paused_until_ms', now_ms + pause)
+redis.call('HINCRBY', KEYS[1], 'cuts', 1)
+return pause
+""" % {"ttl": _STATE_TTL_SECONDS}
+
+
+def is_throttle_error(error: object) -> bool:
+    """True if a download error says the host is rate limiting us."""
+    message = str(error).lower()
+    return any(marker in message for marker in _THROTTLE_MARKERS)
+
+
+@dataclass
+class _HostState:
+    limit: float
+    tokens: float
+    refilled: float
+    paused_until: float = 0.0
+    streak: int = 0
+    successes: int = 0
+    throttles: int = 0
+    cuts: int = 0
+
+
+class HostThrottle:
+    def __init__(
+        self,
+        initial_limits: Dict[str, int],
+        enabled: bool = DOWNLOAD_ADAPTIVE_CONCURRENCY,
+        max_factor: float = DOWNLOAD_AIMD_MAX_FACTOR,
+        decrease_factor: float = DOWNLOAD_AIMD_DECREASE_FACTOR,
+        start_rate: float = DOWNLOAD_START_RATE,
+        start_burst: float = DOWNLOAD_START_BURST,
+        backoff_base_seconds: float = DOWNLOAD_BACKOFF_BASE_SECONDS,
+        backoff_max_seconds: float = DOWNLOAD_BACKOFF_MAX_SECONDS,
+        key_prefix: str = "host_throttle:",
+    ) -> None:
+        self.enabled = enabled
+        self.initial = {source: max(int(limit), 1) for source, limit in initial_limits.items()}
+        self.ceiling = {
+            source: max(limit, math.ceil(limit * max(float(max_factor), 1.0)))
+            for source, limit in self.initial.items()
+        }
+        self.decrease_factor = min(max(float(decrease_factor), 0.05), 0.95)
+        self.start_rate = max(float(start_rate), 0.01)
+        self.start_burst = max(float(start_burst), 1.0)
+        self.backoff_base = max(float(backoff_base_seconds), 0.0)
+        self.backoff_max = max(float(backoff_max_seconds), self.backoff_base)
+        self.key_prefix = key_prefix
+        self._scripts: Dict[str, object] = {}
+        self._client_id = None
+        self._lock = threading.Lock()
+        self._local: Dict[str, _HostState] = {}
+
+    # -- Redis helpers -----------------------------------------------------
+
+    def _key(self, source: str) -> str:
+        return f"{self.key_prefix}{source}"
+
+    def _script(self, client, name: str, source: str):
+        if self._client_id != id(client):
+            self._scripts = {}
+            self._client_id = id(client)
+        script = self._scripts.get(name)
+        if script is None:
+            script = client.register_script(source)
+            self._scripts[name] = script
+        return script
+
+    async def _call(self, func, *args):
+        if get_redis() is None:
+            return func(*args)
+        return await asyncio.to_thread(func, *args)
+
+    def _state(self, source: str, now: float) -> _HostState:
+        state = self._local.get(source)
+        if state is None:
+            state = _HostState(self.initial[source], self.start_burst, now)
+            self._local[source] = state
+        return state
+
+    # -- Admission ---------------------------------------------------------
+
+    def _admit_sync(self, source: str) -> Tuple[int, int, float]:
+        client = get_redis()
+        if client is not None:
+            limit, tokens, wait_ms = self._script(client, "admit", _ADMIT_SCRIPT)(
+                keys=[self._key(source)],
+                args=[self.initial[source], self.start_rate, self.start_burst],
+            )
+            return int(limit), int(tokens), int(wait_ms) / 1000
+        now = time.monotonic()
+        with self._lock:
+            state = self._state(source, now)
+            state.tokens = min(
+                self.start_burst, state.tokens + self.start_rate * (now - state.refilled)
+            )
+            state.refilled = now
+            limit = int(state.limit)
+            if state.paused_until > now:
+                return limit, 0, state.paused_until - now
+            if state.tokens >= 1:
+                return limit, int(state.tokens), 0.0
+            return limit, 0, (1 - state.tokens) / self.start_rate
+
+    async def admit(self, source: str, default_limit: int) -> Tuple[int, int, float]:
+        """Return ``(concurrency limit, starts allowed now, seconds until the next start)``."""
+        if not self.enabled or source not in self.initial:
+            return default_limit, default_limit, 0.0
+        try:
+            return await self._call(self._admit_sync, source)
+        except Exception as exc:
+            logger.warning("Reading the %s throttle state failed: %s", source, exc)
+            return default_limit, default_limit, 0.0
+
+    def _consume_sync(self, source: str, count: int) -> None:
+        client = get_redis()
+        if client is not None:
+            # May go negative when instances race; the debt delays later starts.
+            client.hincrbyfloat(self._key(source), "tokens", -count)
+            return
+        with self._lock:
+            self._state(source, time.monotonic()).tokens -= count
+
+    async def consume(self, source: str, count: int) -> None:
+        """Take ``count`` start tokens."""
+        if not self.enabled or source not in self.initial or count <= 0:
+            return
+        try:
+            await self._call(self._consume_sync, source, count)
+        except Exception as exc:
+            logger.warning("Updating the %s throttle state failed: %s", source, exc)
+
+    # -- Feedback ----------------------------------------------------------
+
+    def _success_sync(self, source: str) -> None:
+        client = get_redis()
+        if client is not None:
+            self._script(client, "success", _SUCCESS_SCRIPT)(
+                keys=[self._key(source)], args=[self.initial[source], self.ceiling[source]]
+            )
+            return
+        with self._lock:
+            state = self._state(source, time.monotonic())
+            state.limit = min(self.ceiling[source], state.limit + 1 / max(state.limit, 1))
+            state.streak = 0
+            state.successes += 1
+
+    def _throttle_sync(self, source: str, jitter: float) -> float:
+        client = get_redis()
+        if client is not None:
+            pause_ms = self._script(client, "throttle", _THROTTLE_SCRIPT)(
+                keys=[self._key(source)],
+                args=[
+                    self.initial[source],
+                    self.decrease_factor,
+                    int(self.backoff_base * 1000),
+                    int(self.backoff_max * 1000),
+                    jitter,
+                ],
+            )
+            return int(pause_ms) / 1000
+        now = time.monotonic()
+        with self._lock:
+            state = self._state(source, now)
+            state.throttles += 1
+            if state.paused_until > now:
+                return state.paused_until - now
+            state.streak += 1
+            state.limit = max(1.0, state.limit * self.decrease_factor)
+            backoff = min(self.backoff_max, self.backoff_base * 2 ** (state.streak - 1))
+            pause = backoff * (0.5 + 0.5 * jitter)
+            state.paused_until = now + pause
+            state.cuts += 1
+            return pause
+
+    async def record(self, source: str, throttled: bool) -> float:
+        """Report a finished download; returns the backoff (seconds) after a throttle."""
+        if not self.enabled or source not in self.initial:
+            return 0.0
+        try:
+            if throttled:
+                pause = await self._call(self._throttle_sync, source, random.random())
+                logger.info("%s is throttling downloads; pausing starts for %.1fs", source, pause)
+                return pause
+            await self._call(self._success_sync, source)
+        except Exception as exc:
+            logger.warning("Updating the %s throttle state failed: %s", source, exc)
+        return 0.0
+
+    # -- Metrics -----------------------------------------------------------
+
+    def _stats_sync(self, source: str) -> Dict[str, object]:
+        client = get_redis()
+        if client is not None:
+            pipe = client.pipeline(transaction=False)
+            pipe.hgetall(self._key(source))
+            pipe.time()
+            raw, (seconds, micros) = pipe.execute()
+            now = seconds + micros / 1e6
+            state = _HostState(
+                limit=float(raw.get("limit") or self.initial[source]),
+                tokens=float(raw.get("tokens") or self.start_burst),
+                refilled=0.0,
+                paused_until=float(raw.get("paused_until_ms") or 0) / 1000,
+                successes=int(raw.get("successes") or 0),
+                throttles=int(raw.get("throttles") or 0),
+                cuts=int(raw.get("cuts") or 0),
+            )
+        else:
+            now = time.monotonic()
+            with self._lock:
+                state = _HostState(**vars(self._state(source, now)))
+        return {
+            "limit": int(state.limit),
+            "limit_exact": round(state.limit, 3),
+            "initial_limit": self.initial[source],
+            "max_limit": self.ceiling[source],
+            "tokens": round(max(state.tokens, 0.0), 2),
+            "paused_for_seconds": round(max(state.paused_until - now, 0.0), 1),
+            "successes": state.successes,
+            "throttle_events": state.throttles,
+            "limit_cuts": state.cuts,
+        }
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "enabled": self.enabled,
+            "start_rate": self.start_rate,
+            "start_burst": self.start_burst,
+            "hosts": {source: self._stats_sync(source) for source in self.initial},
+        }
+
+    def reset(self, source: Optional[str] = None) -> None:
+        sources = [source] if source else list(self.initial)
+        client = get_redis()
+        for name in sources:
+            if client is not None:
+                client.delete(self._key(name))
+            with self._lock:
+                self._local.pop(name, None)
+
+
+HOST_THROTTLE = HostThrottle(
+    {
+        "youtube": YOUTUBE_CONCURRENCY,
+        "tiktok": TIKTOK_CONCURRENCY,
+        "instagram": INSTAGRAM_CONCURRENCY,
+    }
+)
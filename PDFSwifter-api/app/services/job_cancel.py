@@ -0,0 +1,130 @@
+"""Cancellation of running jobs.
+
+A job is cancelled by writing ``status="cancelled"`` through
+``DownloadTracker`` (``DELETE /downloads/{id}``). Whichever process runs the
+job watches its event channel and cancels the handler task when that status
+arrives; handlers release their slots and remove partial files while the
+cancellation unwinds. The watcher also re-reads the job every few seconds in
+case an event was missed, and, with ``DOWNLOAD_ABANDON_AFTER_SECONDS`` set,
+cancels jobs that no client has polled for that long.
+
+A download that other requests follow (``single_flight``) is never cancelled
+for one caller: ``cancel_job`` only detaches that caller's job, which then
+reads as cancelled while the download goes on for the followers. It is
+stopped once none of them waits for it any more.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from app.config import DOWNLOAD_ABANDON_AFTER_SECONDS
+from app.services.download_tracker import DETACHED_ERROR, DOWNLOAD_TRACKER
+from app.services.single_flight import SINGLE_FLIGHT
+
+logger = logging.getLogger(__name__)
+
+CANCELLED = "cancelled"
+
+_RECHECK_SECONDS = 5.0
+
+
+def cancel_job(process_id: str, error: str) -> Optional[bool]:
+    """Cancel a job for its caller.
+
+    Returns True when it was cancelled, False when it was only detached (see
+    above) and None when it had already ended, which the check-and-write
+    makes sure of even if it ended a moment ago.
+    """
+    if SINGLE_FLIGHT.has_active_followers(process_id):
+        if DOWNLOAD_TRACKER.update_job_if_active(process_id, detached=True):
+            return False
+        return None
+    if DOWNLOAD_TRACKER.update_job_if_active(process_id, status=CANCELLED, error=error):
+        return True
+    return None
+
+
+def cancel_requested(process_id: str) -> bool:
+    """Return True (marking the job cancelled if needed) when it should stop now."""
+    job = DOWNLOAD_TRACKER.get_job(process_id)
+    if job is None:
+        return False
+    if job.status == CANCELLED:
+        return True
+    if DOWNLOAD_TRACKER.is_terminal(job.status):
+        return False
+    if job.detached:
+        if SINGLE_FLIGHT.has_active_followers(process_id):
+            return False
+        return DOWNLOAD_TRACKER.update_job_if_active(
+            process_id, status=CANCELLED, error=DETACHED_ERROR
+        )
+    if DOWNLOAD_ABANDON_AFTER_SECONDS <= 0:
+        return False
+    last_polled = DOWNLOAD_TRACKER.last_polled(process_id)
+    if last_polled is None or time.time() - last_polled < DOWNLOAD_ABANDON_AFTER_SECONDS:
+        return False
+    if SINGLE_FLIGHT.has_active_followers(process_id):
+        # Other callers are waiting on this download.
+        return False
+    return DOWNLOAD_TRACKER.update_job_if_active(
+        process_id,
+        status=CANCELLED,
+        error=f"Cancelled: not checked on for {DOWNLOAD_ABANDON_AFTER_SECONDS} seconds.",
+    )
+
+
+async def _watch(process_id: str, target: asyncio.Task) -> None:
+    subscriber = DOWNLOAD_TRACKER.events.subscribe(process_id)
+    try:
+        next_check = 0.0
+        while True:
+            if time.monotonic() >= next_check:
+                next_check = time.monotonic() + _RECHECK_SECONDS
+                try:
+                    if await asyncio.to_thread(cancel_requested, process_id):
+                        break
+                except Exception as exc:
+                    logger.warning("Checking job %s for cancellation failed: %s", process_id, exc)
+            try:
+                event = await asyncio.wait_for(
+                    subscriber.queue.get(), timeout=max(next_check - time.monotonic(), 0.01)
+                )
+            except asyncio.TimeoutError:
+                continue
+            if (event.get("updates") or {}).get("status") == CANCELLED:
+                break
+        logger.info("Cancelling job %s", process_id)
+        target.cancel()
+    finally:
+        DOWNLOAD_TRACKER.events.unsubscribe(process_id, subscriber)
+
+
+async def run_cancellable(
+    handler: Callable[[str, Dict[str, object]], Awaitable[None]],
+    process_id: str,
+    payload: Dict[str, object],
+) -> None:
+    """Run a job handler until it finishes or the job is cancelled.
+
+    Cancelling the caller (worker shutdown) still propagates; a cancelled
+    job just returns.
+    """
+    job_task = asyncio.create_task(handler(process_id, payload))
+    watcher = asyncio.create_task(_watch(process_id, job_task))
+    try:
+        await asyncio.wait({job_task})
+    except asyncio.CancelledError:
+        job_task.cancel()
+        await asyncio.gather(job_task, return_exceptions=True)
+        raise
+    finally:
+        watcher.cancel()
+
+    if job_task.cancelled():
+        return
+    job_task.result()
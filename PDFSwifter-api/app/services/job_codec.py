@@ -0,0 +1,134 @@
+"""Compact single-value encoding for download jobs (DOWNLOAD_JOB_ENCODING=packed).
+
+Layout (little endian)::
+
+    0   B   format version (0 means "no job": SETRANGE on a missing key zero-fills)
+    1   x   padding
+    2   d   progress
+    10  q   bytes_downloaded
+    18  q   total_bytes (-1 = None)
+    26  Q   version
+    34  ... string fields, each a uint32 length (0xFFFFFFFF = None) + UTF-8 bytes
+
+The numeric fields sit at fixed offsets so progress updates can be written
+with SETRANGE without reading the value first. New optional fields are
+appended to ``STRING_FIELDS`` (stored as text); values written before a field
+existed simply end early and read it as None.
+"""
+
+from __future__ import annotations
+
+import struct
+from typing import Dict, Optional, Tuple
+
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct("<BxdqqQ")
+_LENGTH = struct.Struct("<I")
+_NONE_LENGTH = 0xFFFFFFFF
+
+STRING_FIELDS = (
+    "process_id",
+    "source",
+    "url",
+    "status",
+    "file_path",
+    "suggested_name",
+    "error",
+    "queue_position",
+    "estimated_wait_seconds",
+    "quality",
+    "selected_format",
+    "bytes_resumed",
+    "partial_path",
+    "partial_bytes",
+    "batch_id",
+    "children",
+    "detached",
+)
+
+# Non-string values kept in the string section.
+_TEXT_TYPES = {
+    "queue_position": int,
+    "estimated_wait_seconds": float,
+    "bytes_resumed": int,
+    "partial_bytes": int,
+    "detached": lambda text: text == "1",
+}
+
+_FIELD_LAYOUT: Dict[str, Tuple[int, struct.Struct]] = {
+    "progress": (2, struct.Struct("<d")),
+    "bytes_downloaded": (10, struct.Struct("<q")),
+    "total_bytes": (18, struct.Struct("<q")),
+    "version": (26, struct.Struct("<Q")),
+}
+
+# Fields that can be rewritten in place with SETRANGE.
+FIXED_FIELDS = frozenset(_FIELD_LAYOUT)
+
+
+def _fixed_value(field: str, value) -> object:
+    if field == "progress":
+        return float(value or 0.0)
+    if field == "total_bytes":
+        return -1 if value is None else int(value)
+    return int(value or 0)
+
+
+def pack_job(data: Dict[str, object]) -> bytes:
+    parts = [
+        _HEADER.pack(
+            FORMAT_VERSION,
+            _fixed_value("progress", data.get("progress")),
+            _fixed_value("bytes_downloaded", data.get("bytes_downloaded")),
+            _fixed_value("total_bytes", data.get("total_bytes")),
+            _fixed_value("version", data.get("version")),
+        )
+    ]
+    for field in STRING_FIELDS:
+        value = data.get(field)
+        if value is None:
+            parts.append(_LENGTH.pack(_NONE_LENGTH))
+            continue
+        if isinstance(value, bool):
+            value = "1" if value else "0"
+        encoded = str(value).encode("utf-8")
+        parts.append(_LENGTH.pack(len(encoded)))
+        parts.append(encoded)
+    return b"".join(parts)
+
+
+def pack_field(field: str, value) -> Tuple[int, bytes]:
+    """Return ``(offset, bytes)`` for an in-place update of a fixed field."""
+    offset, codec = _FIELD_LAYOUT[field]
+    return offset, codec.pack(_fixed_value(field, value))
+
+
+def unpack_job(raw: Optional[bytes]) -> Optional[Dict[str, object]]:
+    if not raw or len(raw) < _HEADER.size or raw[0] != FORMAT_VERSION:
+        return None
+    try:
+        _, progress, bytes_downloaded, total_bytes, version = _HEADER.unpack_from(raw, 0)
+        data: Dict[str, object] = {
+            "progress": progress,
+            "bytes_downloaded": bytes_downloaded,
+            "total_bytes": None if total_bytes < 0 else total_bytes,
+            "version": version,
+        }
+        offset = _HEADER.size
+        for field in STRING_FIELDS:
+            if offset >= len(raw):
+                data[field] = None
+                continue
+            (length,) = _LENGTH.unpack_from(raw, offset)
+            offset += _LENGTH.size
+            if length == _NONE_LENGTH:
+                data[field] = None
+                continue
+            text = raw[offset:offset + length].decode("utf-8")
+            offset += length
+            cast = _TEXT_TYPES.get(field)
+            data[field] = cast(text) if cast else text
+    except (struct.error, UnicodeDecodeError, ValueError):
+        return None
+    return data
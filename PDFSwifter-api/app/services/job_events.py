@@ -0,0 +1,240 @@
+"""Push-based job state notifications.
+
+Every write made through ``DownloadTracker`` is published as a small delta
+event ``{"process_id", "version", "updates"}``. With Redis the event goes out
+on a pub/sub channel so every API process sees it; without Redis it is fanned
+out in-process. Streaming endpoints subscribe per job and turn the deltas into
+full job snapshots for the client.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from dataclasses import asdict
+from typing import AsyncIterator, Dict, Optional, Set, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import redis
+
+    from app.services.download_tracker import DownloadTracker
+
+logger = logging.getLogger(__name__)
+
+
+class _Subscriber:
+    __slots__ = ("loop", "queue", "stale")
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_queue: int) -> None:
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        # A delta was dropped; the next event is read against a fresh snapshot.
+        self.stale = False
+
+    def deliver(self, event: Dict[str, object]) -> None:
+        def put() -> None:
+            try:
+                self.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Slow consumer: drop the delta; the stream resyncs from a
+                # snapshot when it takes the next event off the queue.
+                self.stale = True
+
+        try:
+            self.loop.call_soon_threadsafe(put)
+        except RuntimeError:
+            # Event loop already closed.
+            pass
+
+
+class JobEventBroker:
+    def __init__(
+        self,
+        redis_client: Optional["redis.Redis"],
+        channel_prefix: str = "download_job_events:",
+        max_queue: int = 256,
+    ) -> None:
+        self._redis = redis_client
+        self._channel_prefix = channel_prefix
+        self._max_queue = max_queue
+        self._subscribers: Dict[str, Set[_Subscriber]] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._listener: Optional[threading.Thread] = None
+
+    def channel(self, process_id: str) -> str:
+        return f"{self._channel_prefix}{process_id}"
+
+    @staticmethod
+    def build_event(process_id: str, version: int, updates: Dict[str, object]) -> Dict[str, object]:
+        return {"process_id": process_id, "version": version, "updates": updates}
+
+    def queue_publish(self, pipe, event: Dict[str, object]) -> None:
+        """Add a publish for ``event`` to a Redis pipeline."""
+        pipe.publish(self.channel(str(event["process_id"])), json.dumps(event))
+
+    def publish_local(self, event: Dict[str, object]) -> None:
+        """Fan an event out to subscribers in this process."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(str(event["process_id"])) or ())
+        for subscriber in subscribers:
+            subscriber.deliver(event)
+
+    def subscribe(self, process_id: str) -> _Subscriber:
+        subscriber = _Subscriber(asyncio.get_running_loop(), self._max_queue)
+        with self._lock:
+            self._subscribers.setdefault(process_id, set()).add(subscriber)
+        if self._redis:
+            self._ensure_listener()
+        return subscriber
+
+    def unsubscribe(self, process_id: str, subscriber: _Subscriber) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(process_id)
+            if not subscribers:
+                return
+            subscribers.discard(subscriber)
+            if not subscribers:
+                self._subscribers.pop(process_id, None)
+
+    def attach_redis(self, redis_client: "redis.Redis") -> None:
+        """Move from in-process fan-out to Redis pub/sub (e.g. after a reconnect)."""
+        self._redis = redis_client
+        with self._lock:
+            has_subscribers = bool(self._subscribers)
+        if has_subscribers:
+            self._ensure_listener()
+
+    def close(self, timeout: float = 2.0) -> None:
+        self._stop_event.set()
+        if self._listener and self._listener.is_alive():
+            self._listener.join(timeout=timeout)
+
+    def _ensure_listener(self) -> None:
+        with self._lock:
+            if self._listener and self._listener.is_alive():
+                return
+            self._stop_event.clear()
+            self._listener = threading.Thread(target=self._listen_loop, daemon=True)
+            self._listener.start()
+
+    def _listen_loop(self) -> None:
+        while not self._stop_event.is_set():
+            pubsub = None
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(f"{self._channel_prefix}*")
+                while not self._stop_event.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if not message or message.get("type") != "pmessage":
+                        continue
+                    try:
+                        event = json.loads(message["data"])
+                    except (TypeError, ValueError):
+                        continue
+                    if isinstance(event, dict) and event.get("process_id"):
+                        self.publish_local(event)
+            except Exception as exc:
+                logger.warning("Job event listener disconnected: %s", exc)
+                self._stop_event.wait(timeout=1.0)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+
+async def iter_job_states(
+    tracker: "DownloadTracker",
+    process_id: str,
+    last_event_id: Optional[int] = None,
+    heartbeat_seconds: float = 15.0,
+) -> AsyncIterator[Tuple[str, Optional[Dict[str, object]]]]:
+    """Yield ``("state", payload)`` on every change and ``("heartbeat", None)`` when idle.
+
+    The current state is sent first unless the client already saw it
+    (``last_event_id`` >= its version). The iterator ends after a terminal state.
+    """
+
+    broker = tracker.events
+    # Subscribe before reading the snapshot so no change can fall in between.
+    subscriber = broker.subscribe(process_id)
+    try:
+        job = await asyncio.to_thread(tracker.get_job, process_id)
+        if not job:
+            return
+        state = tracker.job_payload(job)
+        version = int(state.get("version") or 0)
+
+        if last_event_id is None or version > last_event_id:
+            yield "state", state
+        if tracker.is_terminal(state.get("status")):
+            return
+
+        while True:
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), timeout=heartbeat_seconds)
+            except asyncio.TimeoutError:
+                # Resync from the store in case a delta was dropped.
+                fresh = await asyncio.to_thread(tracker.get_job, process_id)
+                if not fresh:
+                    return
+                if int(fresh.version or 0) > version:
+                    job = fresh
+                    state = tracker.job_payload(job)
+                    version = int(state.get("version") or 0)
+                    yield "state", state
+                    if tracker.is_terminal(state.get("status")):
+                        return
+                else:
+                    yield "heartbeat", None
+                continue
+
+            changed = False
+            if subscriber.stale:
+                # Deltas were dropped (versions are timestamps, so the gap
+                # does not show); the store has every write.
+                subscriber.stale = False
+                fresh = await asyncio.to_thread(tracker.get_job, process_id)
+                if not fresh:
+                    return
+                if int(fresh.version or 0) > version:
+                    job = fresh
+                    version = int(fresh.version or 0)
+                    changed = True
+
+            event_version = int(event.get("version") or 0)
+            if event_version > version:
+                # Merge into the job itself, not the payload: the payload's
+                # fields are reshaped for clients (e.g. ``children`` is a list).
+                updates = event.get("updates") or {}
+                raw = asdict(job)
+                raw.update({k: v for k, v in updates.items() if k in raw})
+                raw["version"] = event_version
+                job = tracker.job_from_dict(raw)
+                version = event_version
+                changed = True
+            if not changed:
+                continue
+            state = tracker.job_payload(job)
+            yield "state", state
+            if tracker.is_terminal(state.get("status")):
+                return
+    finally:
+        broker.unsubscribe(process_id, subscriber)
+
+
+def format_sse(event: str, data: Optional[Dict[str, object]] = None, event_id: Optional[int] = None) -> str:
+    """Encode one Server-Sent Events frame."""
+    if event == "heartbeat":
+        return f": heartbeat {int(time.time())}\n\n"
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
@@ -0,0 +1,247 @@
+"""Background job bodies, shared by the inline runner and ``worker.py``.
+
+Each handler takes ``(process_id, payload)``, reports through
+``DOWNLOAD_TRACKER`` and never raises for expected failures: it records a
+``failed`` status instead.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Dict, Optional
+
+from app.config import (
+    DOWNLOAD_FOLDER,
+    DOWNLOAD_RETENTION_SECONDS,
+    UPLOAD_RETENTION_SECONDS,
+)
+from app.downloaders.common import download_video
+from app.downloaders.youtube import YOUTUBE_DOWNLOADER
+from app.services.batch_downloads import BATCH_KIND, run_batch_job
+from app.services.distributed_semaphore import DistributedSemaphore
+from app.services.download_scheduler import DOWNLOAD_SCHEDULER
+from app.services.download_tracker import DOWNLOAD_TRACKER
+from app.services.egress_pool import EGRESS_INFO_KEY, EGRESS_POOL, info_for_egress
+from app.services.faststart import apply_faststart
+from app.services.media_cache import MEDIA_CACHE
+from app.services.media_info import MEDIA_INFO
+from app.utils.file_ops import delete_file_later
+from app.utils.pdf_ops import compress_pdf
+from app.utils.process_ops import run_in_process
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[str, Dict[str, object]], Awaitable[None]]
+
+PDF_COMPRESS_CONCURRENCY = int(os.environ.get("PDF_COMPRESS_CONCURRENCY", "4"))
+_PDF_COMPRESS_SEMAPHORE = DistributedSemaphore("pdf_compress", PDF_COMPRESS_CONCURRENCY)
+
+TIKTOK_OPTIONS = {
+    "retries": 5,
+    "fragment_retries": 5,
+    "skip_unavailable_fragments": True,
+    "extractor_retries": 3,
+    "http_headers": {
+        "User-Agent": (
+            "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
+            "AppleWebKit/537.36 (KHTML, like Gecko) "
+            "Chrome/120.0.0.0 Safari/537.36"
+        ),
+        "Referer": "https://www.tiktok.com/",
+    },
+}
+
+INSTAGRAM_OPTIONS = {
+    "retries": 5,
+    "fragment_retries": 5,
+    "skip_unavailable_fragments": True,
+    "extractor_retries": 3,
+    "http_headers": {
+        "User-Agent": (
+            "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
+            "AppleWebKit/537.36 (KHTML, like Gecko) "
+            "Chrome/121.0.0.0 Safari/537.36"
+        ),
+        "Referer": "https://www.instagram.com/",
+    },
+}
+
+
+async def _cache_download(
+    media_key: Optional[object],
+    file_path: Optional[str],
+    suggested_name: Optional[str],
+    selected_format: Optional[str] = None,
+) -> None:
+    if not media_key or not file_path or not MEDIA_CACHE.enabled:
+        return
+    try:
+        await asyncio.to_thread(
+            MEDIA_CACHE.store, str(media_key), file_path, suggested_name, selected_format
+        )
+    except Exception as exc:
+        logger.warning("Adding %s to the media cache failed: %s", file_path, exc)
+
+
+async def run_youtube_job(process_id: str, payload: Dict[str, object]) -> None:
+    url = str(payload["url"])
+    async with DOWNLOAD_SCHEDULER.running("youtube", process_id, payload):
+        try:
+            DOWNLOAD_TRACKER.update_job(process_id, status="running")
+            await YOUTUBE_DOWNLOADER.download(url, process_id, payload.get("quality"))
+        except Exception as exc:
+            DOWNLOAD_TRACKER.update_job(process_id, status="failed", error=str(exc))
+            return
+        job = DOWNLOAD_TRACKER.get_job(process_id)
+        if job and job.status == "completed":
+            await _cache_download(
+                payload.get("media_key"), job.file_path, job.suggested_name, job.selected_format
+            )
+
+
+async def _run_ytdlp_job(
+    source: str,
+    process_id: str,
+    payload: Dict[str, object],
+    output_template: str,
+    custom_options: Dict,
+) -> None:
+    url = str(payload["url"])
+    async with DOWNLOAD_SCHEDULER.running(source, process_id, payload):
+        await _download_with_ytdlp(
+            source,
+            process_id,
+            url,
+            output_template,
+            custom_options,
+            payload.get("media_key"),
+            payload.get("quality"),
+        )
+
+
+async def _download_with_ytdlp(
+    source: str,
+    process_id: str,
+    url: str,
+    output_template: str,
+    custom_options: Dict,
+    media_key: Optional[object] = None,
+    quality: Optional[str] = None,
+) -> None:
+    DOWNLOAD_TRACKER.update_job(process_id, status="running", progress=0.0)
+    hook = DOWNLOAD_TRACKER.progress_hook(process_id)
+    info = await MEDIA_INFO.cached(source, url)
+
+    try:
+        async with EGRESS_POOL.use(source, prefer=(info or {}).get(EGRESS_INFO_KEY)) as lease:
+            info = info_for_egress(info, lease)
+            filename = await download_video(
+                url,
+                output_template,
+                custom_options,
+                hook,
+                info=info,
+                quality=quality,
+                egress=lease.egress,
+            )
+            lease.bytes = os.path.getsize(filename)
+    except Exception as exc:
+        if info is not None:
+            await MEDIA_INFO.forget(source, url)
+        message = str(exc).replace("\n", " ").strip()
+        DOWNLOAD_TRACKER.update_job(process_id, status="failed", error=message)
+        return
+
+    await apply_faststart(process_id, filename)
+    job = DOWNLOAD_TRACKER.get_job(process_id)
+    selected_format = job.selected_format if job else None
+    await _cache_download(media_key, filename, os.path.basename(filename), selected_format)
+    size = os.path.getsize(filename)
+    DOWNLOAD_TRACKER.update_job(
+        process_id,
+        status="completed",
+        progress=100.0,
+        bytes_downloaded=size,
+        total_bytes=size,
+        file_path=filename,
+        suggested_name=os.path.basename(filename),
+    )
+    delete_file_later(filename, delay=DOWNLOAD_RETENTION_SECONDS)
+
+
+async def run_tiktok_job(process_id: str, payload: Dict[str, object]) -> None:
+    output_template = os.path.join(
+        DOWNLOAD_FOLDER, "tiktok_%(id)s_%(upload_date)s_%(timestamp)s.%(ext)s"
+    )
+    await _run_ytdlp_job("tiktok", process_id, payload, output_template, TIKTOK_OPTIONS)
+
+
+async def run_instagram_job(process_id: str, payload: Dict[str, object]) -> None:
+    output_template = os.path.join(
+        DOWNLOAD_FOLDER, "instagram_%(id)s_%(timestamp)s.%(ext)s"
+    )
+    await _run_ytdlp_job("instagram", process_id, payload, output_template, INSTAGRAM_OPTIONS)
+
+
+async def run_pdf_compress_job(process_id: str, payload: Dict[str, object]) -> None:
+    input_pdf_path = str(payload["input_path"])
+    output_pdf_path = str(payload["output_path"])
+    suggested_name = str(payload["suggested_name"])
+    level = str(payload.get("level") or "balanced")
+
+    DOWNLOAD_TRACKER.update_job(process_id, status="running", progress=0.0)
+
+    try:
+        async with _PDF_COMPRESS_SEMAPHORE:
+            # Ensure output directory exists
+            os.makedirs(os.path.dirname(output_pdf_path), exist_ok=True)
+            # A child process rather than a thread, so cancelling the job stops it.
+            await run_in_process(compress_pdf, input_pdf_path, output_pdf_path, level)
+
+            # Verify output was actually created and is valid
+            if not os.path.exists(output_pdf_path):
+                raise RuntimeError("Compression failed: output file was not created")
+            if os.path.getsize(output_pdf_path) < 100:
+                raise RuntimeError(f"Compression failed: output file is only {os.path.getsize(output_pdf_path)} bytes")
+    except asyncio.CancelledError:
+        if os.path.exists(output_pdf_path):
+            try:
+                os.remove(output_pdf_path)
+            except Exception:
+                pass
+        delete_file_later(input_pdf_path, delay=UPLOAD_RETENTION_SECONDS)
+        raise
+    except Exception as exc:
+        if os.path.exists(output_pdf_path):
+            try:
+                os.remove(output_pdf_path)
+            except Exception:
+                pass
+        message = str(exc).replace("\n", " ").strip()
+        DOWNLOAD_TRACKER.update_job(process_id, status="failed", error=message)
+        delete_file_later(input_pdf_path, delay=UPLOAD_RETENTION_SECONDS)
+        return
+
+    DOWNLOAD_TRACKER.update_job(
+        process_id,
+        status="completed",
+        progress=100.0,
+        file_path=output_pdf_path,
+        suggested_name=suggested_name,
+    )
+
+    delete_file_later(input_pdf_path, delay=UPLOAD_RETENTION_SECONDS)
+    delete_file_later(output_pdf_path, delay=DOWNLOAD_RETENTION_SECONDS)
+
+
+JOB_HANDLERS: Dict[str, JobHandler] = {
+    "youtube": run_youtube_job,
+    "tiktok": run_tiktok_job,
+    "instagram": run_instagram_job,
+    "pdf_compress": run_pdf_compress_job,
+    BATCH_KIND: run_batch_job,
+}
+
+# Kinds whose jobs only wait on other jobs; they do not take a worker slot,
+# so they can never hold every slot while their own children wait.
+COORDINATOR_KINDS = frozenset({BATCH_KIND})
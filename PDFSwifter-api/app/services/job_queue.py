@@ -0,0 +1,342 @@
+"""Background job submission and the out-of-process worker.
+
+``JOB_QUEUE_MODE=inline`` (default) runs jobs as asyncio tasks in the API
+process. ``JOB_QUEUE_MODE=redis`` appends them to one Redis stream per job
+kind; ``python worker.py`` consumes them through a consumer group:
+
+- a worker extends the visibility of messages it is processing by
+  re-claiming them for itself every third of the visibility timeout;
+- messages idle for longer than ``JOB_VISIBILITY_TIMEOUT_SECONDS`` (their
+  worker died) are claimed by another worker and run again;
+- after ``JOB_MAX_DELIVERIES`` attempts the job is marked failed and acked.
+- jobs that only wait on other jobs (batch downloads) do not count against
+  ``JOB_WORKER_CONCURRENCY``.
+
+In both modes a job cancelled before it starts is skipped, and one cancelled
+while running is stopped (see ``app/services/job_cancel.py``).
+
+``DownloadTracker`` stays the status source in both modes.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import signal
+import socket
+from typing import Dict, List, Optional, Set, Tuple, TYPE_CHECKING
+
+from app.config import (
+    JOB_MAX_DELIVERIES,
+    JOB_QUEUE_MODE,
+    JOB_STREAM_MAXLEN,
+    JOB_VISIBILITY_TIMEOUT_SECONDS,
+    JOB_WORKER_CONCURRENCY,
+)
+from app.services.download_tracker import DOWNLOAD_TRACKER
+from app.services.job_cancel import run_cancellable
+from app.services.redis_client import get_redis
+
+if TYPE_CHECKING:
+    import redis
+
+    from app.services.job_handlers import JobHandler
+
+logger = logging.getLogger(__name__)
+
+# Keep reads shorter than the client's socket timeout.
+_READ_BLOCK_MS = 500
+
+
+def _handlers() -> Dict[str, "JobHandler"]:
+    # Imported lazily: handlers pull in the downloaders and converters.
+    from app.services.job_handlers import JOB_HANDLERS
+
+    return JOB_HANDLERS
+
+
+def _coordinator_kinds() -> frozenset:
+    from app.services.job_handlers import COORDINATOR_KINDS
+
+    return COORDINATOR_KINDS
+
+
+async def run_job(kind: str, process_id: str, payload: Dict[str, object]) -> None:
+    job = await asyncio.to_thread(DOWNLOAD_TRACKER.get_job, process_id)
+    if job is not None and DOWNLOAD_TRACKER.is_terminal(job.status):
+        # Cancelled, or re-delivered after it finished (its worker died
+        # before acknowledging it): running it again would redo the work
+        # and could overwrite the result.
+        logger.info("Skipping %s %s job %s", job.status, kind, process_id)
+        return
+    await run_cancellable(_handlers()[kind], process_id, payload)
+
+
+class JobQueue:
+    def __init__(
+        self,
+        mode: str = JOB_QUEUE_MODE,
+        stream_prefix: str = "download_jobs:",
+        group: str = "download_workers",
+    ) -> None:
+        self.mode = mode
+        self.stream_prefix = stream_prefix
+        self.group = group
+        self._groups_ready: Set[str] = set()
+        self._local_tasks: Dict[str, Set[asyncio.Task]] = {}
+
+    def stream(self, kind: str) -> str:
+        return f"{self.stream_prefix}{kind}"
+
+    def redis(self) -> Optional["redis.Redis"]:
+        if self.mode != "redis":
+            return None
+        return get_redis()
+
+    def ensure_group(self, client: "redis.Redis", kind: str) -> None:
+        if kind in self._groups_ready:
+            return
+        try:
+            client.xgroup_create(self.stream(kind), self.group, id="0", mkstream=True)
+        except Exception as exc:
+            if "BUSYGROUP" not in str(exc):
+                raise
+        self._groups_ready.add(kind)
+
+    def submit(self, kind: str, process_id: str, payload: Dict[str, object]) -> None:
+        """Hand a job to the worker pool (Redis mode) or start it in-process."""
+        if kind not in _handlers():
+            raise KeyError(f"Unknown job kind: {kind}")
+
+        client = self.redis()
+        if client is not None:
+            self.ensure_group(client, kind)
+            client.xadd(
+                self.stream(kind),
+                {"process_id": process_id, "payload": json.dumps(payload)},
+                maxlen=JOB_STREAM_MAXLEN,
+                approximate=True,
+            )
+            return
+
+        if self.mode == "redis":
+            logger.warning("Redis unavailable; running %s job %s inline", kind, process_id)
+
+        task = asyncio.create_task(run_job(kind, process_id, payload))
+        tasks = self._local_tasks.setdefault(kind, set())
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    def backlog(self, kind: str) -> int:
+        """Jobs of ``kind`` that are queued or running and not yet finished."""
+        client = self.redis()
+        if client is None:
+            return len(self._local_tasks.get(kind, ()))
+        try:
+            groups = client.xinfo_groups(self.stream(kind))
+        except Exception:
+            return 0
+        for info in groups:
+            if info.get("name") == self.group:
+                return int(info.get("pending") or 0) + int(info.get("lag") or 0)
+        return int(client.xlen(self.stream(kind)))
+
+
+class JobWorker:
+    """Consumes jobs from Redis Streams and runs them with bounded concurrency."""
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        concurrency: int = JOB_WORKER_CONCURRENCY,
+        consumer: Optional[str] = None,
+        visibility_timeout_seconds: float = JOB_VISIBILITY_TIMEOUT_SECONDS,
+        max_deliveries: int = JOB_MAX_DELIVERIES,
+        kinds: Optional[List[str]] = None,
+    ) -> None:
+        self.queue = queue
+        self.concurrency = max(int(concurrency), 1)
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.visibility_ms = int(max(visibility_timeout_seconds, 5) * 1000)
+        self.max_deliveries = max(int(max_deliveries), 1)
+        self.kinds = list(kinds or _handlers().keys())
+        self._active: Dict[str, asyncio.Task] = {}
+        # Message ids of running coordinator jobs (not counted as busy).
+        self._coordinators: Set[str] = set()
+        self._stopping = asyncio.Event()
+
+    def _client(self) -> "redis.Redis":
+        client = get_redis()
+        if client is None:
+            raise RuntimeError("The job worker requires a reachable Redis (REDIS_URL).")
+        return client
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    def _free(self) -> int:
+        return self.concurrency - (len(self._active) - len(self._coordinators))
+
+    async def run(self, grace_seconds: float = 30.0) -> None:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        client = self._client()
+        for kind in self.kinds:
+            self.queue.ensure_group(client, kind)
+        logger.info("Job worker %s consuming %s", self.consumer, ", ".join(self.kinds))
+
+        reclaimer = asyncio.create_task(self._reclaim_loop())
+        try:
+            while not self._stopping.is_set():
+                free = self._free()
+                if free <= 0:
+                    await asyncio.wait(
+                        list(self._active.values()),
+                        timeout=1.0,
+                        return_when=asyncio.FIRST_COMPLETED,
+                    )
+                    continue
+                try:
+                    messages = await asyncio.to_thread(self._read, free)
+                except Exception as exc:
+                    logger.warning("Job stream read failed: %s", exc)
+                    await asyncio.sleep(1.0)
+                    continue
+                for kind, message_id, fields in messages:
+                    self._start(kind, message_id, fields)
+        finally:
+            reclaimer.cancel()
+            if self._active:
+                # Unfinished jobs stay pending and are re-delivered elsewhere.
+                await asyncio.wait(list(self._active.values()), timeout=grace_seconds)
+                for task in self._active.values():
+                    task.cancel()
+            DOWNLOAD_TRACKER.close()
+
+    def _read(self, count: int) -> List[Tuple[str, str, Dict[str, str]]]:
+        client = self._client()
+        streams = {self.queue.stream(kind): ">" for kind in self.kinds}
+        response = client.xreadgroup(
+            self.queue.group, self.consumer, streams, count=count, block=_READ_BLOCK_MS
+        )
+        messages = []
+        for stream, entries in response or []:
+            kind = stream[len(self.queue.stream_prefix):]
+            for message_id, fields in entries:
+                messages.append((kind, message_id, fields))
+        return messages
+
+    def _start(self, kind: str, message_id: str, fields: Dict[str, str]) -> None:
+        if message_id in self._active:
+            return
+        task = asyncio.create_task(self._process(kind, message_id, fields))
+        self._active[message_id] = task
+        if kind in _coordinator_kinds():
+            self._coordinators.add(message_id)
+
+        def done(_) -> None:
+            self._active.pop(message_id, None)
+            self._coordinators.discard(message_id)
+
+        task.add_done_callback(done)
+
+    async def _process(self, kind: str, message_id: str, fields: Dict[str, str]) -> None:
+        process_id = fields.get("process_id") or ""
+        heartbeat = asyncio.create_task(self._extend_visibility(kind, message_id))
+        try:
+            payload = json.loads(fields.get("payload") or "{}")
+            await run_job(kind, process_id, payload)
+        except asyncio.CancelledError:
+            # Shutting down: leave the message pending for re-delivery.
+            raise
+        except Exception as exc:
+            logger.exception("Job %s (%s) crashed", process_id, kind)
+            if process_id:
+                DOWNLOAD_TRACKER.update_job(process_id, status="failed", error=str(exc))
+        finally:
+            heartbeat.cancel()
+        await asyncio.to_thread(self._ack, kind, message_id)
+
+    def _ack(self, kind: str, message_id: str) -> None:
+        self._client().xack(self.queue.stream(kind), self.queue.group, message_id)
+
+    async def _extend_visibility(self, kind: str, message_id: str) -> None:
+        interval = self.visibility_ms / 3000
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(
+                    self._client().xclaim,
+                    self.queue.stream(kind),
+                    self.queue.group,
+                    self.consumer,
+                    0,
+                    [message_id],
+                    justid=True,
+                )
+            except Exception as exc:
+                logger.warning("Could not extend visibility of %s: %s", message_id, exc)
+
+    async def _reclaim_loop(self) -> None:
+        interval = self.visibility_ms / 2000
+        while True:
+            await asyncio.sleep(interval)
+            for kind in self.kinds:
+                try:
+                    await self._reclaim(kind)
+                except Exception as exc:
+                    logger.warning("Reclaiming stale %s jobs failed: %s", kind, exc)
+
+    async def _reclaim(self, kind: str) -> None:
+        free = self._free()
+        if free <= 0:
+            return
+        client = self._client()
+        stream = self.queue.stream(kind)
+        stale = await asyncio.to_thread(
+            client.xpending_range,
+            stream,
+            self.queue.group,
+            min="-",
+            max="+",
+            count=free,
+            idle=self.visibility_ms,
+        )
+        for entry in stale:
+            message_id = entry["message_id"]
+            if message_id in self._active:
+                continue
+            if int(entry.get("times_delivered") or 0) >= self.max_deliveries:
+                await asyncio.to_thread(self._dead_letter, kind, message_id)
+                continue
+            claimed = await asyncio.to_thread(
+                client.xclaim, stream, self.queue.group, self.consumer, self.visibility_ms, [message_id]
+            )
+            for claimed_id, fields in claimed or []:
+                if fields:
+                    logger.info("Re-delivering %s job %s", kind, fields.get("process_id"))
+                    self._start(kind, claimed_id, fields)
+
+    def _dead_letter(self, kind: str, message_id: str) -> None:
+        client = self._client()
+        stream = self.queue.stream(kind)
+        entries = client.xrange(stream, min=message_id, max=message_id)
+        if entries:
+            process_id = entries[0][1].get("process_id")
+            if process_id:
+                DOWNLOAD_TRACKER.update_job(
+                    process_id,
+                    status="failed",
+                    error="Job was interrupted too many times; please retry.",
+                )
+        client.xack(stream, self.queue.group, message_id)
+
+
+JOB_QUEUE = JobQueue()
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class _Entry(Generic[T]):
+    __slots__ = ("value", "expires_at")
+
+    def __init__(self, value: T, expires_at: float) -> None:
+        self.value = value
+        self.expires_at = expires_at
+
+
+class MemoryJobStore(Generic[T]):
+    """Bounded in-memory map with Redis-like TTL semantics and an LRU cap.
+
+    Writes refresh the TTL (like ``EXPIRE`` after every ``HSET``); reads only
+    refresh recency. Once ``max_entries`` is exceeded the least recently used
+    entries are evicted. Not thread-safe: callers hold their own lock.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: int,
+        max_entries: int,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._ttl_seconds = max(int(ttl_seconds), 1)
+        self._max_entries = max(int(max_entries), 1)
+        self._clock = clock
+        self._entries: "OrderedDict[str, _Entry[T]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[T]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= self._clock():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry.value
+
+    def set(self, key: str, value: T) -> None:
+        self._entries[key] = _Entry(value, self._clock() + self._ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: str) -> Optional[T]:
+        entry = self._entries.pop(key, None)
+        return entry.value if entry is not None else None
+
+    def touch(self, key: str) -> None:
+        """Refresh the TTL and recency of an existing entry."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        entry.expires_at = self._clock() + self._ttl_seconds
+        self._entries.move_to_end(key)
+
+    def ttl(self, key: str) -> int:
+        """Remaining lifetime in whole seconds (0 if missing or expired)."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return 0
+        return max(int(entry.expires_at - self._clock()), 0)
+
+    def purge_expired(self) -> int:
+        now = self._clock()
+        expired = [key for key, entry in self._entries.items() if entry.expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+        return len(expired)
+
+    def items(self) -> Iterator[tuple[str, T]]:
+        now = self._clock()
+        for key, entry in list(self._entries.items()):
+            if entry.expires_at > now:
+                yield key, entry.value
+
+    def clear(self) -> None:
+        self._entries.clear()
@@ -0,0 +1,277 @@
+"""Disk cache of finished media downloads.
+
+Entries are keyed by ``media_key`` (extractor, video id, format). Each entry is
+a media file plus a JSON sidecar (key, suggested name, size, hits, last
+access) in ``MEDIA_CACHE_FOLDER``. The folder itself is the index, so API and
+worker processes sharing the data volume see one cache.
+
+- ``store`` hard-links a finished download into the cache, then evicts
+  entries (LRU or LFU) until the cache fits ``MEDIA_CACHE_MAX_MB``.
+- ``checkout`` hard-links a cached file into the download folder for a new
+  job. Either link can be deleted without affecting the other, so job
+  retention and cache eviction never need to coordinate.
+- Hits, misses and bytes saved are counted in Redis when available (cluster
+  totals), else per process.
+"""
+
+from __future__ import annotations
+
+import errno
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from app.config import MEDIA_CACHE_FOLDER, MEDIA_CACHE_MAX_MB, MEDIA_CACHE_POLICY
+from app.services.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Media files without a sidecar (a crash mid-store) are removed after this long.
+_ORPHAN_GRACE_SECONDS = 3600
+
+_COUNTERS = ("hits", "misses", "bytes_saved", "stores", "evictions", "evicted_bytes")
+
+
+@dataclass(frozen=True)
+class CachedMedia:
+    file_path: str
+    suggested_name: str
+    size: int
+    selected_format: Optional[str] = None
+
+
+def _link(source: str, target: str) -> None:
+    try:
+        os.link(source, target)
+    except OSError as exc:
+        if exc.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+            raise
+        # Different filesystem or no hard links: fall back to a copy.
+        shutil.copyfile(source, target)
+
+
+class MediaCache:
+    def __init__(
+        self,
+        folder: str = str(MEDIA_CACHE_FOLDER),
+        max_bytes: int = MEDIA_CACHE_MAX_MB * 1024 * 1024,
+        policy: str = MEDIA_CACHE_POLICY,
+        stats_key: str = "media_cache:stats",
+    ) -> None:
+        self.folder = str(folder)
+        self.max_bytes = max(int(max_bytes), 0)
+        self.policy = policy if policy in {"lru", "lfu"} else "lru"
+        self.stats_key = stats_key
+        self._lock = threading.Lock()
+        self._local_stats: Dict[str, int] = dict.fromkeys(_COUNTERS, 0)
+        if self.enabled:
+            os.makedirs(self.folder, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    # -- Entries -----------------------------------------------------------
+
+    def _meta_path(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.folder, f"{digest}.json")
+
+    @staticmethod
+    def _read_meta(meta_path: str) -> Optional[Dict[str, object]]:
+        try:
+            with open(meta_path, "r", encoding="utf-8") as handle:
+                meta = json.load(handle)
+        except (OSError, ValueError):
+            return None
+        return meta if isinstance(meta, dict) and meta.get("file") else None
+
+    @staticmethod
+    def _write_meta(meta_path: str, meta: Dict[str, object]) -> None:
+        temp_path = f"{meta_path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as handle:
+            json.dump(meta, handle)
+        os.replace(temp_path, meta_path)
+
+    def _entries(self) -> List[Dict[str, object]]:
+        entries = []
+        referenced = set()
+        for meta_path in glob.glob(os.path.join(self.folder, "*.json")):
+            meta = self._read_meta(meta_path)
+            if meta is None:
+                continue
+            meta["meta_path"] = meta_path
+            referenced.add(str(meta["file"]))
+            entries.append(meta)
+
+        cutoff = time.time() - _ORPHAN_GRACE_SECONDS
+        for name in os.listdir(self.folder):
+            if name.endswith(".json") or name in referenced:
+                continue
+            path = os.path.join(self.folder, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+        return entries
+
+    # -- Lookup and store --------------------------------------------------
+
+    def checkout(self, key: str, destination_folder: str) -> Optional[CachedMedia]:
+        """Link the cached file for ``key`` into ``destination_folder``, if any."""
+        if not self.enabled:
+            return None
+        meta_path = self._meta_path(key)
+        meta = self._read_meta(meta_path)
+        if meta is None or meta.get("key") != key:
+            self._count(misses=1)
+            return None
+
+        cached_name = str(meta["file"])
+        target = os.path.join(
+            destination_folder, f"{uuid.uuid4().hex}{os.path.splitext(cached_name)[1]}"
+        )
+        try:
+            _link(os.path.join(self.folder, cached_name), target)
+        except FileNotFoundError:
+            # Evicted between reading the sidecar and linking.
+            self._count(misses=1)
+            return None
+
+        meta["hits"] = int(meta.get("hits") or 0) + 1
+        meta["last_access"] = time.time()
+        try:
+            self._write_meta(meta_path, meta)
+        except OSError:
+            pass
+        size = os.path.getsize(target)
+        self._count(hits=1, bytes_saved=size)
+        return CachedMedia(
+            file_path=target,
+            suggested_name=str(meta.get("suggested_name") or cached_name),
+            size=size,
+            selected_format=meta.get("selected_format"),
+        )
+
+    def store(
+        self,
+        key: str,
+        file_path: str,
+        suggested_name: Optional[str] = None,
+        selected_format: Optional[str] = None,
+    ) -> bool:
+        """Add a finished download to the cache; False if it does not fit."""
+        if not self.enabled or not os.path.isfile(file_path):
+            return False
+        size = os.path.getsize(file_path)
+        if size > self.max_bytes:
+            return False
+
+        meta_path = self._meta_path(key)
+        cached_name = os.path.basename(meta_path)[: -len(".json")] + os.path.splitext(file_path)[1]
+        cached_path = os.path.join(self.folder, cached_name)
+        temp_path = f"{cached_path}.{uuid.uuid4().hex}.tmp"
+        _link(file_path, temp_path)
+        os.replace(temp_path, cached_path)
+
+        now = time.time()
+        self._write_meta(
+            meta_path,
+            {
+                "key": key,
+                "file": cached_name,
+                "suggested_name": suggested_name or os.path.basename(file_path),
+                "size": size,
+                "selected_format": selected_format,
+                "hits": 0,
+                "created": now,
+                "last_access": now,
+            },
+        )
+        self._count(stores=1)
+        self._evict(keep=meta_path)
+        return True
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        entries = self._entries()
+        total = sum(int(entry.get("size") or 0) for entry in entries)
+        if total <= self.max_bytes:
+            return
+        # The entry just stored has no hits yet; under LFU it would go first.
+        entries = [entry for entry in entries if entry["meta_path"] != keep]
+
+        if self.policy == "lfu":
+            entries.sort(key=lambda entry: (int(entry.get("hits") or 0), float(entry.get("last_access") or 0)))
+        else:
+            entries.sort(key=lambda entry: float(entry.get("last_access") or 0))
+
+        evicted = evicted_bytes = 0
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            size = int(entry.get("size") or 0)
+            # Sidecar first, so a concurrent checkout sees a miss, not a
+            # dangling entry.
+            for path in (str(entry["meta_path"]), os.path.join(self.folder, str(entry["file"]))):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            evicted += 1
+            evicted_bytes += size
+        if evicted:
+            logger.info("Evicted %d media cache entries (%d bytes)", evicted, evicted_bytes)
+            self._count(evictions=evicted, evicted_bytes=evicted_bytes)
+
+    # -- Metrics -----------------------------------------------------------
+
+    def _count(self, **amounts: int) -> None:
+        client = get_redis()
+        if client is not None:
+            try:
+                pipe = client.pipeline(transaction=False)
+                for name, amount in amounts.items():
+                    pipe.hincrby(self.stats_key, name, amount)
+                pipe.execute()
+                return
+            except Exception as exc:
+                logger.warning("Updating media cache stats failed: %s", exc)
+        with self._lock:
+            for name, amount in amounts.items():
+                self._local_stats[name] += amount
+
+    def stats(self) -> Dict[str, object]:
+        counters = dict.fromkeys(_COUNTERS, 0)
+        client = get_redis()
+        if client is not None:
+            for name, value in (client.hgetall(self.stats_key) or {}).items():
+                if name in counters:
+                    counters[name] = int(value)
+        else:
+            with self._lock:
+                counters.update(self._local_stats)
+
+        entries = self._entries() if self.enabled else []
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            "enabled": self.enabled,
+            "policy": self.policy,
+            "entries": len(entries),
+            "bytes": sum(int(entry.get("size") or 0) for entry in entries),
+            "max_bytes": self.max_bytes,
+            "hit_rate": round(counters["hits"] / lookups, 4) if lookups else None,
+            **counters,
+        }
+
+
+MEDIA_CACHE = MediaCache()
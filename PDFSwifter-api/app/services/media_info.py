@@ -0,0 +1,193 @@
+"""Cached yt-dlp metadata probes.
+
+``probe`` runs yt-dlp extraction only (page fetch, player JS, format list) and
+keeps the info dict for ``MEDIA_INFO_TTL_SECONDS``: in Redis when available
+(zlib-compressed JSON, shared by every API instance and worker), else
+in-process. Downloads of the same video hand the cached dict to yt-dlp
+(``--load-info-json``) and skip extraction, so a probe followed by a download
+extracts once.
+
+Signed format URLs expire (after hours, for YouTube); the TTL stays well
+below that, and yt-dlp re-extracts from the page by itself if a saved URL is
+rejected.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import zlib
+from typing import Dict, Optional, Tuple
+
+from app.config import MEDIA_INFO_CONCURRENCY, MEDIA_INFO_TTL_SECONDS
+from app.downloaders.common import extract_video_info, media_id, normalize_quality, select_format
+from app.services.distributed_semaphore import DistributedSemaphore
+from app.services.egress_pool import EGRESS_INFO_KEY, EGRESS_POOL
+from app.services.job_store import MemoryJobStore
+from app.services.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Large parts of the info dict that downloads never use.
+_UNUSED_KEYS = ("automatic_captions", "subtitles", "thumbnails", "heatmap")
+
+
+# Output container of the tiers that convert after downloading.
+_TIER_EXTENSIONS = {"audio": "m4a", "mp3": "mp3"}
+
+
+def describe_info(info: Dict, quality: Optional[str] = None) -> Dict[str, object]:
+    """Client-facing summary of an info dict for a quality tier.
+
+    Runs yt-dlp's format selection (no network access), so one cached info
+    dict serves every tier.
+    """
+    tier = normalize_quality(quality)
+    info = select_format(info, tier)
+    requested = info.get("requested_formats") or [info]
+    sizes = [fmt.get("filesize") or fmt.get("filesize_approx") for fmt in requested]
+    # mp3 is transcoded; its size is the source's.
+    exact = tier != "mp3" and all(fmt.get("filesize") for fmt in requested)
+    return {
+        "id": info.get("id"),
+        "extractor": info.get("extractor_key"),
+        "title": info.get("title"),
+        "duration": info.get("duration"),
+        "uploader": info.get("uploader"),
+        "thumbnail": info.get("thumbnail"),
+        "webpage_url": info.get("webpage_url"),
+        "quality": tier,
+        "format": info.get("format"),
+        "ext": _TIER_EXTENSIONS.get(tier) or info.get("ext"),
+        "filesize": int(sum(sizes)) if sizes and all(sizes) else None,
+        "filesize_is_estimate": not exact,
+    }
+
+
+class MediaInfoCache:
+    def __init__(
+        self,
+        ttl_seconds: int = MEDIA_INFO_TTL_SECONDS,
+        concurrency: int = MEDIA_INFO_CONCURRENCY,
+        key_prefix: str = "media_info:",
+        max_local_entries: int = 256,
+    ) -> None:
+        self.ttl_seconds = max(int(ttl_seconds), 0)
+        self.key_prefix = key_prefix
+        self._local: MemoryJobStore[Dict] = MemoryJobStore(
+            ttl_seconds=max(self.ttl_seconds, 1), max_entries=max_local_entries
+        )
+        # Extractions hit the sites directly, so they get their own small cap.
+        self._slots = DistributedSemaphore("media_info", concurrency)
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0
+
+    # -- Storage -----------------------------------------------------------
+
+    def _get_sync(self, identifier: str) -> Optional[Dict]:
+        client = get_redis(decode_responses=False)
+        if client is None:
+            return self._local.get(identifier)
+        raw = client.get(f"{self.key_prefix}{identifier}")
+        return json.loads(zlib.decompress(raw)) if raw else None
+
+    def _set_sync(self, identifiers, info: Dict) -> None:
+        client = get_redis(decode_responses=False)
+        if client is None:
+            for identifier in identifiers:
+                self._local.set(identifier, info)
+            return
+        packed = zlib.compress(json.dumps(info).encode("utf-8"))
+        pipe = client.pipeline(transaction=False)
+        for identifier in identifiers:
+            pipe.set(f"{self.key_prefix}{identifier}", packed, ex=self.ttl_seconds)
+        pipe.execute()
+
+    def _forget_sync(self, identifier: str) -> None:
+        client = get_redis(decode_responses=False)
+        if client is None:
+            self._local.pop(identifier)
+        else:
+            client.delete(f"{self.key_prefix}{identifier}")
+
+    # -- Public API ----------------------------------------------------------
+
+    async def cached(self, source: str, url: str) -> Optional[Dict]:
+        """Return the cached info dict for a URL, if a probe stored one."""
+        identifier = media_id(source, url) if self.enabled else None
+        if not identifier:
+            return None
+        try:
+            return await asyncio.to_thread(self._get_sync, identifier)
+        except Exception as exc:
+            logger.warning("Reading cached info for %s failed: %s", identifier, exc)
+            return None
+
+    async def forget(self, source: str, url: str) -> None:
+        """Drop a URL's cached info (e.g. after a download with it failed)."""
+        identifier = media_id(source, url) if self.enabled else None
+        if not identifier:
+            return
+        try:
+            await asyncio.to_thread(self._forget_sync, identifier)
+        except Exception as exc:
+            logger.warning("Dropping cached info for %s failed: %s", identifier, exc)
+
+    async def probe(
+        self, source: str, url: str, custom_options: Optional[Dict] = None
+    ) -> Tuple[Dict, bool]:
+        """Return ``(info dict, served from cache)`` for a URL.
+
+        Concurrent probes of the same video in this process share one
+        extraction.
+        """
+        cached = await self.cached(source, url)
+        if cached is not None:
+            return cached, True
+
+        identifier = media_id(source, url)
+        flight = identifier or url
+        pending = self._inflight.get(flight)
+        if pending is not None:
+            return await asyncio.shield(pending), True
+
+        pending = asyncio.get_running_loop().create_future()
+        self._inflight[flight] = pending
+        try:
+            async with self._slots:
+                async with EGRESS_POOL.use(source) as lease:
+                    info = await extract_video_info(url, custom_options, egress=lease.egress)
+            for key in _UNUSED_KEYS:
+                info.pop(key, None)
+            if lease.name:
+                # Downloads with this info go out the same way (info_for_egress).
+                info[EGRESS_INFO_KEY] = lease.name
+            if self.enabled:
+                # Also under the id yt-dlp reports, for URLs that do not
+                # show it (short links).
+                identifiers = {identifier} if identifier else set()
+                if info.get("extractor_key") not in (None, "Generic") and info.get("id"):
+                    identifiers.add(f"{info['extractor_key']}:{info['id']}")
+                try:
+                    await asyncio.to_thread(self._set_sync, identifiers, info)
+                except Exception as exc:
+                    logger.warning("Caching info for %s failed: %s", flight, exc)
+            pending.set_result(info)
+            return info, False
+        except BaseException as exc:
+            if isinstance(exc, asyncio.CancelledError):
+                pending.cancel()
+            else:
+                pending.set_exception(exc)
+                # Waiters re-raise it; this copy needs no retrieval.
+                pending.exception()
+            raise
+        finally:
+            self._inflight.pop(flight, None)
+
+
+MEDIA_INFO = MediaInfoCache()
@@ -1,24 +1,20 @@
 from __future__ import annotations
 
-from functools import lru_cache
-from typing import Optional, TYPE_CHECKING
+import threading
+import time
+from typing import Dict, Optional, TYPE_CHECKING
 
-from app.config import REDIS_URL
+from app.config import REDIS_RECONNECT_INTERVAL_SECONDS, REDIS_URL
 
 if TYPE_CHECKING:
     import redis
 
+_clients: Dict[bool, "redis.Redis"] = {}
+_last_attempt: Dict[bool, float] = {}
+_lock = threading.Lock()
 
-@lru_cache(maxsize=1)
-def get_redis() -> Optional["redis.Redis"]:
-    """Return a configured Redis client, or None if Redis is not configured/available.
-
-    This is intentionally best-effort so the API can still run without Redis.
-    """
-
-    if not REDIS_URL:
-        return None
 
+def _connect(decode_responses: bool = True) -> Optional["redis.Redis"]:
     try:
         import redis  # type: ignore
     except Exception:
@@ -26,7 +22,7 @@ def get_redis() -> Optional["redis.Redis"]:
 
     client = redis.Redis.from_url(
         REDIS_URL,
-        decode_responses=True,
+        decode_responses=decode_responses,
         socket_connect_timeout=1.0,
         socket_timeout=1.0,
         health_check_interval=30,
@@ -39,3 +35,35 @@ def get_redis() -> Optional["redis.Redis"]:
         return None
 
     return client
+
+
+def get_redis(decode_responses: bool = True) -> Optional["redis.Redis"]:
+    """Return a configured Redis client, or None if Redis is not configured/available.
+
+    This is intentionally best-effort so the API can still run without Redis.
+    A successful client is cached; after a failed ping another attempt is made
+    at most every REDIS_RECONNECT_INTERVAL_SECONDS so a blip at boot does not
+    pin the process to in-memory mode.
+
+    Pass ``decode_responses=False`` for a client that returns raw bytes.
+    """
+
+    client = _clients.get(decode_responses)
+    if client is not None:
+        return client
+    if not REDIS_URL:
+        return None
+
+    with _lock:
+        client = _clients.get(decode_responses)
+        if client is not None:
+            return client
+        now = time.monotonic()
+        last_attempt = _last_attempt.get(decode_responses, 0.0)
+        if last_attempt and now - last_attempt < REDIS_RECONNECT_INTERVAL_SECONDS:
+            return None
+        _last_attempt[decode_responses] = now
+        client = _connect(decode_responses)
+        if client is not None:
+            _clients[decode_responses] = client
+        return client
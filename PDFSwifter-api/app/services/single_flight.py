@@ -0,0 +1,285 @@
+"""Single-flight coalescing of identical downloads.
+
+Requests are keyed by ``(extractor, video id, format)`` (``media_key``), so
+different spellings of a video's URL share a key.
+
+The first request for a key leads: its job is queued and downloaded as usual.
+Requests for the same key while the leader is unfinished follow it. Each
+follower gets its own job, which takes no queue slot and mirrors the leader's
+status and progress; when the leader ends, followers get its final state and
+result file.
+
+- With Redis, flights and follower sets live in Redis, so requests reaching
+  different API instances share one download.
+- Each process mirrors progress to the followers it created, from the
+  leader's job events. The final state is copied to every follower by
+  ``finish``, wherever the leader ends, and again by the mirrors.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+from typing import Dict, Iterable, Optional, Set
+
+from app.config import DOWNLOAD_JOB_TTL_SECONDS
+from app.services.download_tracker import DOWNLOAD_TRACKER, PROGRESS_FIELDS, DownloadJob
+from app.services.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Job fields a follower takes over from its leader.
+MIRRORED_FIELDS = (
+    "status",
+    "progress",
+    "bytes_downloaded",
+    "total_bytes",
+    "error",
+    "file_path",
+    "suggested_name",
+    "queue_position",
+    "estimated_wait_seconds",
+    "selected_format",
+    "partial_path",
+    "partial_bytes",
+)
+
+# Resync from the leader's stored state when no event arrived for this long.
+_RESYNC_SECONDS = 15.0
+
+# KEYS: flight key. ARGV: process id, expected leader ('' = none), ttl ms.
+# Makes ARGV[1] the leader if the flight's leader is still ARGV[2] and
+# returns whoever leads afterwards.
+_CLAIM_SCRIPT = """
+local current = redis.call('GET', KEYS[1]) or ''
+if current == ARGV[2] then
+  redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[3])
+  return ARGV[1]
+end
+return current
+"""
+
+# KEYS: flight key. ARGV: leader. Deletes the flight if it is still ours.
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def _mirrored_state(job: DownloadJob) -> Dict[str, object]:
+    state = {field: getattr(job, field) for field in MIRRORED_FIELDS}
+    if job.status == "cancelled":
+        # Followers did not ask for that; let them retry.
+        state["status"] = "failed"
+        state["error"] = "The shared download was cancelled. Please retry."
+    return state
+
+
+class SingleFlight:
+    def __init__(
+        self,
+        key_prefix: str = "single_flight:",
+        ttl_seconds: int = DOWNLOAD_JOB_TTL_SECONDS,
+    ) -> None:
+        self.key_prefix = key_prefix
+        self.ttl_ms = max(int(ttl_seconds), 1) * 1000
+        self._scripts: Dict[str, object] = {}
+        self._client_id = None
+        self._lock = threading.Lock()
+        # Without Redis: flight -> leader. Followers per leader are all of
+        # them without Redis, else the ones this process mirrors.
+        self._leaders: Dict[str, str] = {}
+        self._followers: Dict[str, Set[str]] = {}
+        self._mirrors: Dict[str, asyncio.Task] = {}
+
+    # -- Redis helpers -----------------------------------------------------
+
+    def _flight_key(self, key: str) -> str:
+        return f"{self.key_prefix}{key}"
+
+    def _followers_key(self, leader: str) -> str:
+        return f"{self.key_prefix}followers:{leader}"
+
+    def _script(self, client, name: str, source: str):
+        if self._client_id != id(client):
+            self._scripts = {}
+            self._client_id = id(client)
+        script = self._scripts.get(name)
+        if script is None:
+            script = client.register_script(source)
+            self._scripts[name] = script
+        return script
+
+    async def _call(self, func, *args):
+        if get_redis() is None:
+            return func(*args)
+        return await asyncio.to_thread(func, *args)
+
+    # -- Joining -----------------------------------------------------------
+
+    def _claim(self, client, key: str, process_id: str, expected: str) -> str:
+        if client is not None:
+            leader = self._script(client, "claim", _CLAIM_SCRIPT)(
+                keys=[self._flight_key(key)], args=[process_id, expected, self.ttl_ms]
+            )
+            return str(leader or "")
+        with self._lock:
+            leader = self._leaders.get(key, "")
+            if leader == expected:
+                self._leaders[key] = leader = process_id
+            return leader
+
+    def _join_sync(self, key: str, process_id: str) -> Optional[str]:
+        client = get_redis()
+        expected = ""
+        for _ in range(3):
+            leader = self._claim(client, key, process_id, expected)
+            if leader == process_id:
+                return None
+            job = DOWNLOAD_TRACKER.get_job(leader)
+            if job is None or DOWNLOAD_TRACKER.is_terminal(job.status):
+                # Left behind by a finished (or lost) leader; take it over.
+                expected = leader
+                continue
+
+            if client is not None:
+                followers_key = self._followers_key(leader)
+                pipe = client.pipeline()
+                pipe.sadd(followers_key, process_id)
+                pipe.expire(followers_key, self.ttl_ms // 1000)
+                pipe.execute()
+            with self._lock:
+                self._followers.setdefault(leader, set()).add(process_id)
+
+            # Read again: the leader may have ended (and copied its result to
+            # the followers it knew of) before this one was added.
+            job = DOWNLOAD_TRACKER.get_job(leader) or job
+            DOWNLOAD_TRACKER.update_job(process_id, **_mirrored_state(job))
+            return leader
+        return None
+
+    async def join(self, key: str, process_id: str) -> Optional[str]:
+        """Lead or follow the flight for ``key``.
+
+        Returns the leader's process id when ``process_id`` now follows it,
+        None when it leads (and must be downloaded).
+        """
+        leader = await self._call(self._join_sync, key, process_id)
+        if leader is not None:
+            logger.info("Download %s follows in-flight download %s", process_id, leader)
+            self._ensure_mirror(leader)
+        return leader
+
+    def has_active_followers(self, leader: str) -> bool:
+        """True while a follower of ``leader`` is still waiting for its result."""
+        client = get_redis()
+        with self._lock:
+            followers = set(self._followers.get(leader) or ())
+        if client is not None:
+            followers.update(str(member) for member in client.smembers(self._followers_key(leader)))
+        if not followers:
+            return False
+        jobs = DOWNLOAD_TRACKER.get_jobs(list(followers))
+        return any(job and not DOWNLOAD_TRACKER.is_terminal(job.status) for job in jobs.values())
+
+    # -- Mirroring ---------------------------------------------------------
+
+    def _copy(
+        self, updates: Dict[str, object], followers: Iterable[str], check_status: bool = True
+    ) -> None:
+        followers = list(followers)
+        if check_status:
+            # Never overwrite a follower that was cancelled on its own.
+            jobs = DOWNLOAD_TRACKER.get_jobs(followers)
+            followers = [
+                process_id
+                for process_id in followers
+                if jobs.get(process_id) and not DOWNLOAD_TRACKER.is_terminal(jobs[process_id].status)
+            ]
+        for process_id in followers:
+            DOWNLOAD_TRACKER.update_job(process_id, **updates)
+
+    def _ensure_mirror(self, leader: str) -> None:
+        task = self._mirrors.get(leader)
+        if task is None or task.done():
+            self._mirrors[leader] = asyncio.create_task(self._mirror(leader))
+
+    async def _mirror(self, leader: str) -> None:
+        subscriber = DOWNLOAD_TRACKER.events.subscribe(leader)
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), timeout=_RESYNC_SECONDS)
+                except asyncio.TimeoutError:
+                    job = await asyncio.to_thread(DOWNLOAD_TRACKER.get_job, leader)
+                    if job is None:
+                        with self._lock:
+                            self._followers.pop(leader, None)
+                        return
+                    updates = _mirrored_state(job)
+                else:
+                    updates = {
+                        field: value
+                        for field, value in (event.get("updates") or {}).items()
+                        if field in MIRRORED_FIELDS
+                    }
+                if not updates:
+                    continue
+                with self._lock:
+                    followers = list(self._followers.get(leader) or ())
+                if DOWNLOAD_TRACKER.is_terminal(updates.get("status")):
+                    await self.finish(leader)
+                    return
+                # Progress ticks are copied blindly; status changes are rare
+                # enough to skip followers that were cancelled meanwhile.
+                check_status = not PROGRESS_FIELDS.issuperset(updates)
+                await self._call(self._copy, updates, followers, check_status)
+        except Exception as exc:
+            logger.warning("Mirroring download %s to its followers failed: %s", leader, exc)
+        finally:
+            DOWNLOAD_TRACKER.events.unsubscribe(leader, subscriber)
+            if self._mirrors.get(leader) is asyncio.current_task():
+                self._mirrors.pop(leader, None)
+
+    # -- Finishing ---------------------------------------------------------
+
+    def _finish_sync(self, leader: str, key: Optional[str]) -> int:
+        job = DOWNLOAD_TRACKER.get_job(leader)
+        if job is None or not DOWNLOAD_TRACKER.is_terminal(job.status):
+            # Not over yet (e.g. a worker shut down and the job is re-run).
+            return 0
+
+        followers: Set[str] = set()
+        client = get_redis()
+        if client is not None:
+            pipe = client.pipeline()
+            if key:
+                self._script(client, "release", _RELEASE_SCRIPT)(
+                    keys=[self._flight_key(key)], args=[leader], client=pipe
+                )
+            pipe.smembers(self._followers_key(leader))
+            followers.update(str(member) for member in pipe.execute()[-1])
+        with self._lock:
+            followers.update(self._followers.pop(leader, ()))
+            for flight, current in list(self._leaders.items()):
+                if current == leader:
+                    del self._leaders[flight]
+        if followers:
+            self._copy(_mirrored_state(job), followers)
+        return len(followers)
+
+    async def finish(self, leader: str, key: Optional[str] = None) -> None:
+        """Give the followers of a finished leader its final state and file."""
+        try:
+            count = await self._call(self._finish_sync, leader, key)
+        except Exception as exc:
+            logger.warning("Finishing followers of download %s failed: %s", leader, exc)
+            return
+        if count:
+            logger.info("Download %s shared with %d follower(s)", leader, count)
+
+
+SINGLE_FLIGHT = SingleFlight()
@@ -0,0 +1,145 @@
+"""Responses for result files: validators, byte ranges and proxy offload.
+
+- Every response carries a strong ``ETag`` (inode, size and mtime in
+  nanoseconds; files are never rewritten in place) and ``Last-Modified``,
+  and advertises ``Accept-Ranges: bytes``.
+- ``If-None-Match`` answers ``304``. A single ``Range`` answers ``206``,
+  unless ``If-Range`` names another version, in which case the whole file
+  is sent. A range past the end answers ``416``. Multiple ranges and
+  malformed ``Range`` headers are ignored, so the whole file is sent, as
+  RFC 9110 allows.
+- With ``offload``, no bytes are sent. The response names the file in
+  ``X-Accel-Redirect`` (its path under ``DATA_ROOT``), and Caddy serves it
+  from the shared volume, with validators and ranges of its own.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import mimetypes
+import os
+from email.utils import formatdate
+from typing import AsyncIterator, BinaryIO, Dict, Optional, Tuple
+from urllib.parse import quote
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+from app.config import CHUNK_SIZE, DATA_ROOT
+
+OFFLOAD_HEADER = "X-Accel-Redirect"
+
+
+def file_etag(stat_result: os.stat_result) -> str:
+    return '"%x-%x-%x"' % (stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """``If-None-Match`` comparison (weak: ``W/`` prefixes are ignored)."""
+    if header.strip() == "*":
+        return True
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return etag in tags
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Return ``(start, end)`` (end exclusive) for one byte range, else None.
+
+    Raises ``ValueError`` when the range starts past the end of the file.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, dash, last = (part.strip() for part in spec.partition("-"))
+    if not dash or not (first or last) or not (first + last).isdigit():
+        return None
+    if not first:
+        if int(last) == 0 or size == 0:
+            raise ValueError("empty suffix range")
+        return max(size - int(last), 0), size
+    start = int(first)
+    end = int(last) + 1 if last else size
+    if start >= size:
+        raise ValueError("range starts past the end")
+    if end <= start:
+        return None
+    return start, min(end, size)
+
+
+async def _read_file(handle: BinaryIO, start: int, end: int) -> AsyncIterator[bytes]:
+    try:
+        fd = handle.fileno()
+        offset = start
+        while offset < end:
+            chunk = await asyncio.to_thread(os.pread, fd, min(CHUNK_SIZE, end - offset), offset)
+            if not chunk:
+                break
+            offset += len(chunk)
+            yield chunk
+    finally:
+        handle.close()
+
+
+def offload_path(file_path: str) -> Optional[str]:
+    """URI path of ``file_path`` relative to ``DATA_ROOT``, or None if outside it."""
+    root = os.path.realpath(str(DATA_ROOT))
+    path = os.path.realpath(file_path)
+    if os.path.commonpath([root, path]) != root:
+        return None
+    return quote("/" + os.path.relpath(path, root).replace(os.sep, "/"))
+
+
+def serve_file(
+    request: Request, file_path: str, filename: str, offload: bool = False
+) -> Response:
+    """Answer a GET for ``file_path`` (see module docstring)."""
+    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    headers: Dict[str, str] = {
+        "Content-Disposition": f'attachment; filename="{filename}"',
+    }
+    if offload:
+        target = offload_path(file_path)
+        if target:
+            headers[OFFLOAD_HEADER] = target
+            return Response(status_code=200, headers=headers, media_type=media_type)
+
+    handle = open(file_path, "rb")
+    try:
+        stat_result = os.fstat(handle.fileno())
+        size = stat_result.st_size
+        etag = file_etag(stat_result)
+        last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+        headers.update({"ETag": etag, "Last-Modified": last_modified, "Accept-Ranges": "bytes"})
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None and _etag_matches(if_none_match, etag):
+            handle.close()
+            return Response(status_code=304, headers=headers)
+
+        start, end, status_code = 0, size, 200
+        range_header = request.headers.get("range")
+        if_range = request.headers.get("if-range")
+        if range_header and (if_range is None or if_range.strip() in (etag, last_modified)):
+            try:
+                bounds = _parse_range(range_header, size)
+            except ValueError:
+                handle.close()
+                return Response(
+                    status_code=416,
+                    headers={**headers, "Content-Range": f"bytes */{size}"},
+                )
+            if bounds:
+                start, end = bounds
+                status_code = 206
+                headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+    except BaseException:
+        handle.close()
+        raise
+
+    headers["Content-Length"] = str(end - start)
+    return StreamingResponse(
+        _read_file(handle, start, end),
+        status_code=status_code,
+        headers=headers,
+        media_type=media_type,
+    )
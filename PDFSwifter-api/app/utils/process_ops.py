@@ -0,0 +1,52 @@
+import asyncio
+import multiprocessing
+from typing import Callable
+
+
+def _process_context():
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+def _run_child(conn, func: Callable, args: tuple) -> None:
+    try:
+        func(*args)
+    except Exception as exc:
+        conn.send(str(exc) or exc.__class__.__name__)
+    else:
+        conn.send(None)
+    finally:
+        conn.close()
+
+
+async def run_in_process(func: Callable, *args, poll_interval: float = 0.1) -> None:
+    """Run ``func(*args)`` in a child process and wait for it without a thread.
+
+    Unlike ``asyncio.to_thread`` the work can be stopped: cancelling the
+    awaiting task kills the child. Exceptions come back as ``RuntimeError``
+    with the original message. ``func`` must be importable (module level).
+    """
+    context = _process_context()
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_run_child, args=(sender, func, args), daemon=True)
+    process.start()
+    sender.close()
+    try:
+        # poll() also turns true when the child exits without a result.
+        while not receiver.poll():
+            await asyncio.sleep(poll_interval)
+        try:
+            error = receiver.recv()
+        except EOFError:
+            process.join(timeout=1.0)
+            raise RuntimeError(f"Worker process exited with code {process.exitcode}") from None
+    except BaseException:
+        if process.is_alive():
+            process.kill()
+        raise
+    finally:
+        receiver.close()
+        process.join(timeout=1.0)
+    if error is not None:
+        raise RuntimeError(error)
@@ -4,9 +4,14 @@ from starlette.middleware.trustedhost import TrustedHostMiddleware
 
 from app.config import ALLOWED_HOSTS, ALLOWED_ORIGINS, ENVIRONMENT
 from app.routes.tiktok import router as tiktok_router
+from app.routes.youtube import router as youtube_router
 from app.routes.instagram import router as instagram_router
 from app.routes.downloads import router as downloads_router
 from app.routes.pdf import router as pdf_router
+from app.downloaders.cookie_manager import COOKIE_POOL
+from app.downloaders.youtube import YOUTUBE_DOWNLOADER
+from app.downloaders.ytdlp_pool import YTDLP_POOL, YTDLP_PROBE_POOL
+from app.services.download_tracker import DOWNLOAD_TRACKER
 
 is_production = ENVIRONMENT == "production"
 
@@ -29,11 +34,38 @@ if ALLOWED_ORIGINS:
     )
 
 app.include_router(tiktok_router)
+app.include_router(youtube_router)
 app.include_router(instagram_router)
 app.include_router(downloads_router)
 app.include_router(pdf_router)
 
 
+@app.on_event("startup")
+def start_cookie_checks():
+    COOKIE_POOL.start()
+
+
+@app.on_event("shutdown")
+def stop_cookie_checks():
+    COOKIE_POOL.stop()
+
+
+@app.on_event("shutdown")
+async def close_remote_connections():
+    await YOUTUBE_DOWNLOADER.aclose()
+
+
+@app.on_event("shutdown")
+def flush_download_tracker():
+    DOWNLOAD_TRACKER.close()
+
+
+@app.on_event("shutdown")
+def stop_ytdlp_workers():
+    YTDLP_POOL.close()
+    YTDLP_PROBE_POOL.close()
+
+
 @app.get("/health", include_in_schema=False)
 def health_check():
     return {"status": "ok"}
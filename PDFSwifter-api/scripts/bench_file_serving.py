@@ -0,0 +1,168 @@
+"""Benchmark result-file serving: throughput and API CPU per GB served.
+
+A uvicorn child process serves one generated file three ways:
+
+- ``FileResponse``: ``GET /downloads/{id}/file`` as it was before;
+- ``serve_file``: the current handler (ranges and validators, ``pread``);
+- ``offload``: ``serve_file`` with ``DOWNLOAD_FILE_OFFLOAD``. The API only
+  sends the ``X-Accel-Redirect`` header and the bytes come from Caddy, so
+  the API's share is the header response (no MB/s: the proxy's speed is
+  not measured here).
+
+Each mode downloads the file ``--requests`` times over ``--clients``
+concurrent connections (httpx, bytes discarded). CPU is the child's user +
+system time from ``/proc/<pid>/stat`` (Linux). Before timing, the
+``serve_file`` route is checked for ``206``, ``304``, ``416`` and
+``If-Range`` answers.
+
+    python scripts/bench_file_serving.py --size-mb 256 --requests 8 --clients 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import FileResponse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _serve(path: str, port: int) -> None:
+    import uvicorn
+
+    from app.utils.file_serving import serve_file
+
+    app = FastAPI()
+
+    @app.get("/fileresponse")
+    async def fileresponse():
+        return FileResponse(path, filename="clip.mp4")
+
+    @app.get("/serve_file")
+    async def serve(request: Request):
+        return serve_file(request, path, "clip.mp4")
+
+    @app.get("/offload")
+    async def offload(request: Request):
+        return serve_file(request, path, "clip.mp4", offload=True)
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+
+def _cpu_seconds(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as handle:
+        fields = handle.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def _check(client, base: str, size: int) -> None:
+    full = await client.get(f"{base}/serve_file")
+    etag = full.headers["etag"]
+    checks = [
+        ({"Range": "bytes=0-99"}, 206, 100),
+        ({"Range": f"bytes=-{size // 2}"}, 206, size // 2),
+        ({"Range": f"bytes={size}-"}, 416, 0),
+        ({"Range": "bytes=0-99", "If-Range": etag}, 206, 100),
+        ({"Range": "bytes=0-99", "If-Range": '"stale"'}, 200, size),
+        ({"If-None-Match": etag}, 304, 0),
+    ]
+    for headers, status, length in checks:
+        response = await client.get(f"{base}/serve_file", headers=headers)
+        if response.status_code != status or len(response.content) != length:
+            raise SystemExit(f"{headers}: got {response.status_code}, {len(response.content)} bytes")
+    tail = await client.get(f"{base}/serve_file", headers={"Range": "bytes=-100"})
+    if tail.content != full.content[-100:]:
+        raise SystemExit("suffix range returned the wrong bytes")
+
+
+async def _download(client, url: str) -> int:
+    received = 0
+    async with client.stream("GET", url) as response:
+        async for chunk in response.aiter_raw():
+            received += len(chunk)
+    return received
+
+
+async def _run_mode(label, client, url, args, pid, size) -> None:
+    queue = list(range(args.requests))
+
+    async def worker():
+        sent = 0
+        while queue:
+            queue.pop()
+            sent += await _download(client, url)
+        return sent
+
+    cpu = _cpu_seconds(pid)
+    started = time.monotonic()
+    received = sum(await asyncio.gather(*(worker() for _ in range(args.clients))))
+    elapsed = time.monotonic() - started
+    cpu = _cpu_seconds(pid) - cpu
+    served_gb = size * args.requests / 1e9
+    if label != "offload" and received != size * args.requests:
+        raise SystemExit(f"{label}: received {received} bytes")
+    rate = "proxy" if label == "offload" else f"{size * args.requests / 1e6 / elapsed:.0f}"
+    print(f"{label:<14} {rate:>9} {cpu:>8.2f} {cpu / served_gb:>10.2f}")
+
+
+async def _main(args, port: int, pid: int, size: int) -> None:
+    import httpx
+
+    base = f"http://127.0.0.1:{port}"
+    limits = httpx.Limits(max_connections=args.clients)
+    async with httpx.AsyncClient(timeout=60, limits=limits) as client:
+        for _ in range(100):
+            try:
+                await client.get(f"{base}/offload")
+                break
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+        await _check(client, base, size)
+        print(f"{'mode':<14} {'MB/s':>9} {'API CPU':>8} {'CPU s/GB':>10}")
+        for label in ("fileresponse", "serve_file", "offload"):
+            await _run_mode(label, client, f"{base}/{label}", args, pid, size)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--requests", type=int, default=8)
+    parser.add_argument("--clients", type=int, default=4)
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix="serve-bench-")
+    os.environ.update({"REDIS_URL": "", "DATA_ROOT": folder})
+    path = os.path.join(folder, "clip.mp4")
+    with open(path, "wb") as handle:
+        for _ in range(args.size_mb):
+            handle.write(os.urandom(1024 * 1024))
+    size = os.path.getsize(path)
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    child = multiprocessing.get_context("spawn").Process(target=_serve, args=(path, port))
+    child.start()
+    try:
+        print(
+            f"{args.size_mb} MiB file, {args.requests} downloads per mode,"
+            f" {args.clients} concurrent clients"
+        )
+        asyncio.run(_main(args, port, child.pid, size))
+    finally:
+        child.terminate()
+        child.join()
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
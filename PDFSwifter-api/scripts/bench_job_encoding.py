@@ -0,0 +1,127 @@
+"""Compare DownloadTracker Redis encodings ("hash" vs "packed").
+
+Measures create / progress update / status update / get throughput and the
+Redis memory used per job. Needs a reachable Redis in REDIS_URL; keys are
+written under a bench-only prefix and removed afterwards.
+
+    REDIS_URL=redis://localhost:6379/15 python scripts/bench_job_encoding.py --jobs 10000 100000
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.download_tracker import DownloadTracker  # noqa: E402
+
+MEMORY_SAMPLE = 500
+BATCH = 100
+
+
+def _rate(count: int, seconds: float) -> str:
+    return f"{count / seconds:>10,.0f}/s" if seconds > 0 else "       inf/s"
+
+
+def _cleanup(tracker: DownloadTracker, prefix: str) -> None:
+    client = tracker._redis
+    batch = []
+    for key in client.scan_iter(match=f"{prefix}*", count=1000):
+        batch.append(key)
+        if len(batch) >= 1000:
+            client.unlink(*batch)
+            batch = []
+    if batch:
+        client.unlink(*batch)
+
+
+def _memory_per_job(tracker: DownloadTracker, process_ids: list[str]) -> str:
+    client = tracker._redis
+    sample = process_ids[:MEMORY_SAMPLE]
+    try:
+        pipe = client.pipeline(transaction=False)
+        for process_id in sample:
+            pipe.memory_usage(tracker._redis_key(process_id), samples=0)
+        sizes = [size for size in pipe.execute() if size]
+    except Exception as exc:
+        return f"n/a ({exc.__class__.__name__})"
+    if not sizes:
+        return "n/a"
+    return f"{sum(sizes) / len(sizes):,.0f} B"
+
+
+def run(encoding: str, jobs: int) -> None:
+    prefix = f"bench_download_job_{encoding}:"
+    tracker = DownloadTracker(encoding=encoding, redis_prefix=prefix, flush_interval_seconds=3600)
+    if tracker._redis is None:
+        raise SystemExit("REDIS_URL is not set or Redis is unreachable.")
+    _cleanup(tracker, prefix)
+
+    try:
+        started = time.perf_counter()
+        process_ids = [
+            tracker.create_job("youtube", f"https://www.youtube.com/watch?v={i:011d}").process_id
+            for i in range(jobs)
+        ]
+        create_s = time.perf_counter() - started
+
+        # Progress goes through the write-behind buffer: one pipeline per flush.
+        started = time.perf_counter()
+        for step in range(1, 4):
+            for process_id in process_ids:
+                tracker.update_job(
+                    process_id,
+                    progress=step * 25.0,
+                    bytes_downloaded=step * 1_048_576,
+                    total_bytes=4 * 1_048_576,
+                )
+            tracker.flush()
+        progress_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for process_id in process_ids:
+            tracker.update_job(process_id, status="running", error=None)
+        status_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for offset in range(0, jobs, BATCH):
+            tracker.get_jobs(process_ids[offset:offset + BATCH])
+        batch_get_s = time.perf_counter() - started
+
+        single = process_ids[: min(jobs, 10000)]
+        started = time.perf_counter()
+        for process_id in single:
+            tracker.get_job(process_id)
+        get_s = time.perf_counter() - started
+
+        memory = _memory_per_job(tracker, process_ids)
+    finally:
+        _cleanup(tracker, prefix)
+        tracker.close()
+
+    print(
+        f"{encoding:<7} {jobs:>7,} jobs | create {_rate(jobs, create_s)}"
+        f" | progress {_rate(jobs * 3, progress_s)}"
+        f" | status {_rate(jobs, status_s)}"
+        f" | get {_rate(len(single), get_s)}"
+        f" | get_jobs({BATCH}) {_rate(jobs, batch_get_s)}"
+        f" | memory/job {memory}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--encodings", nargs="+", default=["hash", "packed"])
+    args = parser.parse_args()
+
+    for jobs in args.jobs:
+        for encoding in args.encodings:
+            run(encoding, jobs)
+
+
+if __name__ == "__main__":
+    main()
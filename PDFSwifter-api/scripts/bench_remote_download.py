@@ -0,0 +1,237 @@
+"""Benchmark RemoteYouTubeDownloader against a bandwidth-limited stand-in server.
+
+The stand-in plays the remote download endpoint: it serves one generated
+file for any ``GET`` (query ignored), with ``Content-Length``, ``ETag``,
+``Accept-Ranges`` and single-range ``206`` responses, keeps connections
+alive, and paces every connection to ``--rate-mbps`` MB/s. New connections
+pay ``--handshake-ms`` (a stand-in for TCP + TLS setup over a real
+network).
+
+Each mode downloads the file ``--jobs`` times in a row through the real
+downloader (in-memory tracker) and checks the bytes:
+
+- ``per-job client``: one stream, and a fresh client per job (as before);
+- ``shared client``: one stream over the process-wide keep-alive client;
+- ``N segments``: the shared client plus N parallel byte ranges.
+
+With ``--drops N`` the stand-in instead cuts the first N responses of each
+job halfway through, and the file is downloaded with resumption (``ETag``
+sent) and with restarts (no validator, so every retry starts over), one
+stream and ``--segments`` ranges each; the table shows the bytes the server
+sent and the job's ``bytes_resumed``.
+
+    python scripts/bench_remote_download.py --size-mb 32 --rate-mbps 8 --segments 2 4 8
+    python scripts/bench_remote_download.py --drops 2 --segments 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StandInServer:
+    def __init__(self, payload: bytes, rate: float, handshake: float, ranges: bool) -> None:
+        self.payload = payload
+        self.rate = rate
+        self.handshake = handshake
+        self.ranges = ranges
+        self.etag = '"%s"' % hashlib.sha1(payload).hexdigest()[:16]
+        self.validators = True
+        self.drops = 0
+        self.connections = 0
+        self.requests = 0
+        self.sent = 0
+
+    async def start(self) -> int:
+        server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return server.sockets[0].getsockname()[1]
+
+    async def _handle(self, reader, writer) -> None:
+        self.connections += 1
+        await asyncio.sleep(self.handshake)
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                self.requests += 1
+                headers = {}
+                for line in head.decode("latin-1").split("\r\n")[1:]:
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                await self._respond(writer, headers)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, headers) -> None:
+        total = len(self.payload)
+        start, end, status = 0, total - 1, "200 OK"
+        extra = ""
+        spec = headers.get("range", "")
+        if_range = headers.get("if-range", self.etag)
+        if self.ranges and spec.startswith("bytes=") and if_range == self.etag:
+            first, _, last = spec[len("bytes="):].partition("-")
+            start = int(first)
+            end = min(int(last), total - 1) if last else total - 1
+            status = "206 Partial Content"
+            extra = f"Content-Range: bytes {start}-{end}/{total}\r\n"
+        writer.write(
+            (
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Length: {end - start + 1}\r\n"
+                "Content-Type: video/mp4\r\n"
+                'Content-Disposition: attachment; filename="clip.mp4"\r\n'
+                + (f"ETag: {self.etag}\r\n" if self.validators else "")
+                + ("Accept-Ranges: bytes\r\n" if self.ranges else "")
+                + extra
+                + "\r\n"
+            ).encode("latin-1")
+        )
+        # Per-connection pacing in 64 KiB steps.
+        step = 64 * 1024
+        view = memoryview(self.payload)
+        cut = None
+        if self.drops > 0 and end - start > 2 * step:
+            self.drops -= 1
+            cut = start + (end - start + 1) // 2
+        began = time.monotonic()
+        sent = 0
+        for offset in range(start, end + 1, step):
+            if cut is not None and offset >= cut:
+                writer.transport.abort()
+                raise ConnectionError("dropped on purpose")
+            chunk = view[offset:min(offset + step, end + 1)]
+            writer.write(chunk)
+            await writer.drain()
+            sent += len(chunk)
+            self.sent += len(chunk)
+            ahead = sent / self.rate - (time.monotonic() - began)
+            if ahead > 0:
+                await asyncio.sleep(ahead)
+
+
+async def _run_mode(label, downloader, jobs, expected, server, per_job_client):
+    from app.services.download_tracker import DOWNLOAD_TRACKER
+
+    connections, requests = server.connections, server.requests
+    elapsed_total = 0.0
+    for _ in range(jobs):
+        job = DOWNLOAD_TRACKER.create_job("youtube", "https://youtu.be/bench")
+        started = time.monotonic()
+        await downloader.download("https://youtu.be/bench", job.process_id)
+        elapsed_total += time.monotonic() - started
+        if per_job_client:
+            await downloader.aclose()
+        job = DOWNLOAD_TRACKER.get_job(job.process_id)
+        if job.status != "completed":
+            raise SystemExit(f"{label}: job ended {job.status}: {job.error}")
+        with open(job.file_path, "rb") as handle:
+            if hashlib.sha1(handle.read()).hexdigest() != expected:
+                raise SystemExit(f"{label}: downloaded bytes differ")
+        os.remove(job.file_path)
+    await downloader.aclose()
+    size_mb = len(server.payload) / 1e6
+    print(
+        f"{label:<22} {elapsed_total / jobs:>8.2f} {size_mb * jobs / elapsed_total:>8.1f}"
+        f" {server.connections - connections:>11} {server.requests - requests:>8}"
+    )
+
+
+async def _run_drops(label, downloader, jobs, expected, server, drops):
+    from app.services.download_tracker import DOWNLOAD_TRACKER
+
+    sent, resumed, elapsed_total = server.sent, 0, 0.0
+    for _ in range(jobs):
+        server.drops = drops
+        job = DOWNLOAD_TRACKER.create_job("youtube", "https://youtu.be/bench")
+        started = time.monotonic()
+        await downloader.download("https://youtu.be/bench", job.process_id)
+        elapsed_total += time.monotonic() - started
+        job = DOWNLOAD_TRACKER.get_job(job.process_id)
+        if job.status != "completed":
+            raise SystemExit(f"{label}: job ended {job.status}: {job.error}")
+        with open(job.file_path, "rb") as handle:
+            if hashlib.sha1(handle.read()).hexdigest() != expected:
+                raise SystemExit(f"{label}: downloaded bytes differ")
+        os.remove(job.file_path)
+        resumed += job.bytes_resumed or 0
+    await downloader.aclose()
+    size_mb = len(server.payload) / 1e6
+    print(
+        f"{label:<22} {elapsed_total / jobs:>8.2f} {(server.sent - sent) / 1e6 / jobs:>10.1f}"
+        f" {size_mb:>9.1f} {resumed / 1e6 / jobs:>9.1f}"
+    )
+
+
+async def _main(args) -> None:
+    from app.downloaders.youtube import RemoteYouTubeDownloader
+
+    payload = os.urandom(args.size_mb * 1024 * 1024)
+    expected = hashlib.sha1(payload).hexdigest()
+    server = StandInServer(
+        payload, args.rate_mbps * 1e6, args.handshake_ms / 1000, not args.no_ranges
+    )
+    port = await server.start()
+    endpoint = f"http://127.0.0.1:{port}/download"
+    folder = tempfile.mkdtemp(prefix="remote-bench-")
+    try:
+        print(
+            f"{args.size_mb} MiB file, {args.rate_mbps:g} MB/s per connection,"
+            f" {args.handshake_ms:g} ms per new connection, {args.jobs} jobs per mode"
+        )
+
+        def downloader(segments):
+            return RemoteYouTubeDownloader(
+                endpoint, folder, segments=segments, segment_min_bytes=1, http2=args.http2
+            )
+
+        if args.drops:
+            print(f"first {args.drops} responses of each job cut halfway")
+            print(f"{'mode':<22} {'s/job':>8} {'sent MB/job':>10} {'file MB':>9} {'saved MB':>9}")
+            for validators in (True, False):
+                server.validators = validators
+                for segments in (1, max(args.segments)):
+                    label = f"{'resume' if validators else 'restart'}, {segments} stream(s)"
+                    await _run_drops(
+                        label, downloader(segments), args.jobs, expected, server, args.drops
+                    )
+            return
+
+        print(f"{'mode':<22} {'s/job':>8} {'MB/s':>8} {'connections':>11} {'requests':>8}")
+        await _run_mode("per-job client", downloader(1), args.jobs, expected, server, True)
+        await _run_mode("shared client", downloader(1), args.jobs, expected, server, False)
+        for segments in args.segments:
+            await _run_mode(
+                f"{segments} segments", downloader(segments), args.jobs, expected, server, False
+            )
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size-mb", type=int, default=32)
+    parser.add_argument("--rate-mbps", type=float, default=8.0, help="MB/s per connection")
+    parser.add_argument("--handshake-ms", type=float, default=50.0)
+    parser.add_argument("--jobs", type=int, default=3)
+    parser.add_argument("--segments", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--no-ranges", action="store_true", help="server ignores Range")
+    parser.add_argument("--drops", type=int, default=0, help="cut responses, compare resume/restart")
+    parser.add_argument("--http2", action="store_true", help="HTTP/2 for the main client (needs h2)")
+    args = parser.parse_args()
+
+    os.environ.update({"REDIS_URL": "", "YOUTUBE_RETRY_DELAY_SECONDS": "0"})
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Compare warm yt-dlp workers with one yt-dlp process per download.
+
+Serves short synthetic clips from a local HTTP server (standing in for many
+small TikTok videos) and downloads them through both paths of
+``download_video``: the ``yt-dlp`` executable and ``YtDlpWorkerPool``.
+Reports per-download startup overhead (an empty-bodied clip) and clip
+throughput at the given concurrency.
+
+    python scripts/bench_ytdlp_pool.py --clips 40 --size-kb 512 --concurrency 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import functools
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.downloaders.common import (  # noqa: E402
+    build_ytdlp_args,
+    resolve_downloaded_file,
+    run_ytdlp_subprocess,
+)
+from app.downloaders.ytdlp_pool import YtDlpWorkerPool  # noqa: E402
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args) -> None:
+        pass
+
+
+class _QuietServer(ThreadingHTTPServer):
+    # yt-dlp's generic extractor probes the URL and hangs up early.
+    def handle_error(self, request, client_address) -> None:
+        pass
+
+
+def _serve(directory: str) -> ThreadingHTTPServer:
+    handler = functools.partial(_QuietHandler, directory=directory)
+    server = _QuietServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _make_clips(directory: str, count: int, size_kb: int) -> None:
+    payload = os.urandom(size_kb * 1024)
+    for index in range(count):
+        with open(os.path.join(directory, f"clip_{index}.mp4"), "wb") as handle:
+            handle.write(payload)
+
+
+def _run(label: str, download, urls: list[str], out_dir: str, concurrency: int) -> None:
+    def one(index_url):
+        index, url = index_url
+        template = os.path.join(out_dir, f"{label}_{index}.%(ext)s")
+        started = time.perf_counter()
+        resolve_downloaded_file(download(url, build_ytdlp_args(template)), template)
+        return time.perf_counter() - started
+
+    # Startup overhead: the first clip alone, then its median over a few runs.
+    latencies = [one((f"probe{i}", urls[0])) for i in range(3)]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        durations = list(executor.map(one, enumerate(urls)))
+    elapsed = time.perf_counter() - started
+
+    print(
+        f"{label:<10} single clip {statistics.median(latencies) * 1000:>7.0f} ms"
+        f" | {len(urls)} clips x{concurrency}: {elapsed:>6.2f} s"
+        f" ({len(urls) / elapsed:>5.1f} clips/s, median {statistics.median(durations) * 1000:.0f} ms)"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clips", type=int, default=40)
+    parser.add_argument("--size-kb", type=int, default=512)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    if not shutil.which("yt-dlp"):
+        raise SystemExit("The yt-dlp executable is not on PATH.")
+
+    serve_dir = tempfile.mkdtemp(prefix="bench_clips_")
+    out_dir = tempfile.mkdtemp(prefix="bench_out_")
+    server = _serve(serve_dir)
+    pool = YtDlpWorkerPool(size=args.concurrency)
+    try:
+        _make_clips(serve_dir, args.clips, args.size_kb)
+        port = server.server_address[1]
+        urls = [f"http://127.0.0.1:{port}/clip_{i}.mp4" for i in range(args.clips)]
+
+        def subprocess_download(url, ytdlp_args):
+            return asyncio.run(run_ytdlp_subprocess(url, ytdlp_args))
+
+        _run("subprocess", subprocess_download, urls, out_dir, args.concurrency)
+
+        started = time.perf_counter()
+        pool.prestart()
+        print(f"pool       warm-up of {args.concurrency} workers: {time.perf_counter() - started:.2f} s (one-off)")
+        _run("pool", pool.download, urls, out_dir, args.concurrency)
+    finally:
+        pool.close()
+        server.shutdown()
+        shutil.rmtree(serve_dir, ignore_errors=True)
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
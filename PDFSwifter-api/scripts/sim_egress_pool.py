@@ -0,0 +1,260 @@
+"""Run real yt-dlp downloads through stand-in proxies and watch the egress pool.
+
+Starts a local origin serving one media file and a set of local HTTP proxies
+that forward to it, each with its own behaviour:
+
+- ``fast``: no limit;
+- ``slow``: paced to ``--slow-rate`` bytes per second;
+- ``throttled``: answers everything with HTTP 429;
+- ``flaky``: drops about half of the connections mid-response;
+- ``dead``: nothing listens on its port.
+
+``--jobs`` downloads (``--concurrency`` at a time) go through
+``download_video`` with the egress ``EGRESS_POOL`` picks (in-process mode),
+after ``--warmup`` downloads that let the pool learn, then again with a
+random egress per job for comparison. Prints where the jobs went, the pool's
+stats and the wall time of both runs, and exits non-zero unless the dead and
+throttled proxies were cooled down and the health-scored run beat the random
+one on both completed downloads and the share that went through ``fast``.
+
+    python scripts/sim_egress_pool.py --jobs 40 --size-mb 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import collections
+import functools
+import http.server
+import os
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args) -> None:
+        pass
+
+
+class _QuietServer(http.server.ThreadingHTTPServer):
+    def handle_error(self, request, client_address) -> None:
+        pass  # proxies drop connections on purpose
+
+
+def _start_origin(directory: str) -> _QuietServer:
+    handler = functools.partial(_QuietHandler, directory=directory)
+    server = _QuietServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class StandInProxy:
+    """Minimal forward proxy for plain-HTTP requests with a failure mode."""
+
+    def __init__(self, behaviour: str, origin_port: int, slow_rate: int) -> None:
+        self.behaviour = behaviour
+        self.origin_port = origin_port
+        self.slow_rate = slow_rate
+        self.requests = 0
+
+    async def start(self) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self._handle, "127.0.0.1", 0)
+
+    async def _handle(self, reader, writer) -> None:
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+            self.requests += 1
+            if self.behaviour == "throttled":
+                writer.write(
+                    b"HTTP/1.1 429 Too Many Requests\r\nContent-Length: 0\r\n"
+                    b"Connection: close\r\n\r\n"
+                )
+                await writer.drain()
+                return
+            # Absolute-form request line to origin-form; one request per connection.
+            lines = head.decode("latin-1").split("\r\n")
+            method, target, version = lines[0].split(" ", 2)
+            path = "/" + target.split("://", 1)[-1].split("/", 1)[-1]
+            headers = [line for line in lines[1:] if line and not line.lower().startswith(
+                ("connection:", "proxy-connection:", "keep-alive:")
+            )]
+            request = "\r\n".join([f"{method} {path} {version}", *headers, "Connection: close", "", ""])
+            upstream_reader, upstream_writer = await asyncio.open_connection(
+                "127.0.0.1", self.origin_port
+            )
+            upstream_writer.write(request.encode("latin-1"))
+            await upstream_writer.drain()
+            drop_after = (
+                random.randint(64 * 1024, 512 * 1024)
+                if self.behaviour == "flaky" and random.random() < 0.5
+                else None
+            )
+            sent = 0
+            while True:
+                chunk = await upstream_reader.read(64 * 1024)
+                if not chunk:
+                    break
+                writer.write(chunk)
+                await writer.drain()
+                sent += len(chunk)
+                if drop_after is not None and sent >= drop_after:
+                    writer.transport.abort()
+                    break
+                if self.behaviour == "slow":
+                    await asyncio.sleep(len(chunk) / self.slow_rate)
+            upstream_writer.close()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass  # cancelled: the simulation is shutting down
+        finally:
+            writer.close()
+
+
+async def _run(pool, egresses, url: str, workdir: str, args, scored: bool, jobs: int, label: str):
+    from app.downloaders.common import download_video
+    from app.services.egress_pool import EgressLease
+
+    picks = collections.Counter()
+    outcomes = collections.Counter()
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def job(index: int) -> None:
+        template = os.path.join(workdir, f"{label}_{index}.%(ext)s")
+        async with semaphore:
+            try:
+                if scored:
+                    async with pool.use("tiktok") as lease:
+                        path = await download_video(url, template, egress=lease.egress)
+                        lease.bytes = os.path.getsize(path)
+                else:
+                    lease = EgressLease("tiktok", random.choice(egresses))
+                    path = await download_video(url, template, egress=lease.egress)
+                os.remove(path)
+                outcomes["ok"] += 1
+            except Exception:
+                outcomes["failed"] += 1
+            picks[lease.name] += 1
+
+    started = time.monotonic()
+    await asyncio.gather(*(job(index) for index in range(jobs)))
+    elapsed = time.monotonic() - started
+
+    print(f"\n{label}: {jobs} jobs in {elapsed:.1f}s, {outcomes['ok']} ok, {outcomes['failed']} failed")
+    for egress in egresses:
+        print(f"  {egress.name:<28} {picks[egress.name]:>3} jobs")
+    return elapsed, picks, outcomes["ok"]
+
+
+def _check(stats, names, scored, baseline) -> None:
+    """Exit non-zero unless the pool routed better than picking at random.
+
+    ``scored`` and ``baseline`` are ``(picks, completed)`` of the two runs.
+    """
+    by_behaviour = {names[name]: entry["sources"]["tiktok"] for name, entry in stats.items()}
+    for behaviour in ("dead", "throttled"):
+        if not by_behaviour[behaviour]["cooldowns"]:
+            raise SystemExit(f"the {behaviour} proxy was never cooled down")
+    (scored_picks, scored_ok), (random_picks, random_ok) = scored, baseline
+    if scored_ok <= random_ok:
+        raise SystemExit(f"health-scored run completed {scored_ok} downloads, random {random_ok}")
+    fast = next(name for name, behaviour in names.items() if behaviour == "fast")
+    if scored_picks[fast] <= random_picks[fast]:
+        raise SystemExit(
+            f"fast carried {scored_picks[fast]} health-scored jobs, {random_picks[fast]} random ones"
+        )
+
+
+async def _main(args) -> None:
+    workdir = tempfile.mkdtemp(prefix="egress-sim-")
+    origin = None
+    proxies = []
+    try:
+        media_dir = os.path.join(workdir, "origin")
+        os.makedirs(media_dir)
+        with open(os.path.join(media_dir, "clip.mp4"), "wb") as handle:
+            handle.write(os.urandom(args.size_mb * 1024 * 1024))
+        origin = _start_origin(media_dir)
+        origin_port = origin.server_address[1]
+
+        entries = []
+        names = {}
+        for behaviour in ("fast", "slow", "throttled", "flaky", "dead"):
+            if behaviour == "dead":
+                port = _free_port()
+            else:
+                proxies.append(await StandInProxy(behaviour, origin_port, args.slow_rate).start())
+                port = proxies[-1].sockets[0].getsockname()[1]
+            entries.append(f"http://127.0.0.1:{port}")
+            names[f"http://127.0.0.1:{port}"] = behaviour
+
+        from app.services.egress_pool import EgressPool
+
+        pool = EgressPool(
+            entries,
+            sources=("tiktok",),
+            cooldown_seconds=args.cooldown,
+            cooldown_max_seconds=args.cooldown * 8,
+        )
+        egresses = pool.egresses
+        print("egresses:")
+        for egress in egresses:
+            print(f"  {egress.name:<28} {names[egress.name]}")
+
+        url = f"http://127.0.0.1:{origin_port}/clip.mp4"
+        pool.reset()
+        await _run(pool, egresses, url, workdir, args, scored=True, jobs=args.warmup, label="warm-up")
+        scored, scored_picks, scored_ok = await _run(
+            pool, egresses, url, workdir, args, scored=True, jobs=args.jobs, label="health-scored"
+        )
+        stats = pool.stats()["egresses"]
+        print(f"\n{'egress':<12} {'downloads':>9} {'failures':>8} {'429s':>5} {'cooldowns':>9} {'MB/s':>7}")
+        for name, entry in stats.items():
+            health = entry["sources"]["tiktok"]
+            print(
+                f"{names[name]:<12} {health['downloads']:>9} {health['failures']:>8}"
+                f" {health['throttle_events']:>5} {health['cooldowns']:>9}"
+                f" {entry['throughput_bps'] / 1e6:>7.2f}"
+            )
+        baseline, random_picks, random_ok = await _run(
+            pool, egresses, url, workdir, args, scored=False, jobs=args.jobs, label="random"
+        )
+        print(f"\nwall time: health-scored {scored:.1f}s, random {baseline:.1f}s")
+        _check(stats, names, (scored_picks, scored_ok), (random_picks, random_ok))
+    finally:
+        for proxy in proxies:
+            proxy.close()
+        if origin is not None:
+            origin.shutdown()
+            origin.server_close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--jobs", type=int, default=40)
+    parser.add_argument("--warmup", type=int, default=10, help="unscored jobs first")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--size-mb", type=int, default=4)
+    parser.add_argument("--slow-rate", type=int, default=2 * 1024 * 1024, help="bytes/s")
+    parser.add_argument("--cooldown", type=float, default=5.0)
+    args = parser.parse_args()
+
+    os.environ.update({"REDIS_URL": "", "YOUTUBE_MAX_RETRIES": "0", "YOUTUBE_SOCKET_TIMEOUT_SECONDS": "5"})
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
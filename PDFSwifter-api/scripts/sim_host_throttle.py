@@ -0,0 +1,178 @@
+"""Watch the adaptive per-host limit converge against a simulated host.
+
+The stand-in host serves ``--capacity`` concurrent downloads and answers
+anything beyond that with HTTP 429; halfway through, its capacity changes to
+``--capacity-after``. Jobs go through the real ``DownloadScheduler`` and
+``HostThrottle`` (in-process mode) with a handler that "downloads" from the
+stand-in, and the queue is kept full. Times are scaled down: a download takes
+``--duration`` seconds and backoffs start at ``--backoff`` seconds.
+
+Prints the limit over time, then 429s and completed downloads per phase,
+once with adaptive limits and once with the fixed starting limit. Exits
+non-zero unless the adaptive limit ends between one multiplicative cut
+below ``--capacity-after`` and one above it, and its throttled share after
+the drop is at most half the fixed limit's.
+
+    python scripts/sim_host_throttle.py --start 4 --capacity 8 --capacity-after 3
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class SimulatedHost:
+    """A host that serves ``capacity`` downloads at once and 429s the rest."""
+
+    def __init__(self, capacity: int, duration: float) -> None:
+        self.capacity = capacity
+        self.duration = duration
+        self.active = 0
+        self.completed = 0
+        self.throttled = 0
+
+    async def download(self) -> None:
+        if self.active >= self.capacity:
+            self.throttled += 1
+            await asyncio.sleep(0.01)
+            raise RuntimeError("ERROR: unable to download video data: HTTP Error 429: Too Many Requests")
+        self.active += 1
+        try:
+            await asyncio.sleep(self.duration * random.uniform(0.8, 1.2))
+        finally:
+            self.active -= 1
+        self.completed += 1
+
+
+async def _simulate(args, adaptive: bool):
+    from app.services import job_handlers
+    from app.services.download_scheduler import DOWNLOAD_SCHEDULER
+    from app.services.download_tracker import DOWNLOAD_TRACKER
+    from app.services.host_throttle import HOST_THROTTLE
+
+    HOST_THROTTLE.enabled = adaptive
+    HOST_THROTTLE.reset()
+    host = SimulatedHost(args.capacity, args.duration)
+
+    async def handler(process_id, payload):
+        async with DOWNLOAD_SCHEDULER.running("tiktok", process_id, payload):
+            try:
+                await host.download()
+            except RuntimeError as exc:
+                DOWNLOAD_TRACKER.update_job(process_id, status="failed", error=str(exc))
+                return
+            DOWNLOAD_TRACKER.update_job(process_id, status="completed", progress=100.0)
+
+    job_handlers.JOB_HANDLERS["tiktok"] = handler
+
+    counter = 0
+    phase_seconds = args.seconds / 2
+    started = time.monotonic()
+    phases = []
+    marks = (0, 0)
+    label = "adaptive" if adaptive else "fixed"
+    print(f"\n{label}: host capacity {host.capacity}, then {args.capacity_after}")
+    print(f"{'t (s)':>6} {'capacity':>8} {'limit':>6} {'active':>6} {'429s':>5} {'done':>5}")
+    next_sample = 0.0
+    while True:
+        elapsed = time.monotonic() - started
+        if elapsed >= args.seconds:
+            break
+        if not phases and elapsed >= phase_seconds:
+            phases.append((host.throttled - marks[0], host.completed - marks[1]))
+            marks = (host.throttled, host.completed)
+            host.capacity = args.capacity_after
+        # Keep the queue full.
+        backlog = sum(len(q.waiting) for q in DOWNLOAD_SCHEDULER._local.values())
+        for _ in range(max(0, 20 - backlog)):
+            counter += 1
+            await DOWNLOAD_SCHEDULER.submit(
+                "tiktok", f"https://host.invalid/clip/{counter}", {"url": "x"}, f"ip:{counter % 5}"
+            )
+        if elapsed >= next_sample:
+            limit = DOWNLOAD_SCHEDULER.slots["tiktok"].limit
+            print(
+                f"{elapsed:>6.1f} {host.capacity:>8} {limit:>6} {host.active:>6}"
+                f" {host.throttled:>5} {host.completed:>5}"
+            )
+            next_sample += args.sample
+        await asyncio.sleep(0.05)
+    phases.append((host.throttled - marks[0], host.completed - marks[1]))
+    limit = DOWNLOAD_SCHEDULER.slots["tiktok"].limit
+
+    for index, (throttled, completed) in enumerate(phases):
+        capacity = args.capacity if index == 0 else args.capacity_after
+        print(
+            f"{label} phase {index + 1} (capacity {capacity}): {completed} downloads,"
+            f" {throttled} throttled ({throttled / max(completed + throttled, 1):.0%})"
+        )
+    if adaptive:
+        stats = HOST_THROTTLE.stats()["hosts"]["tiktok"]
+        print(f"throttle stats: {stats}")
+
+    # Drain.
+    for queue in DOWNLOAD_SCHEDULER._local.values():
+        queue.waiting.clear()
+        queue.payloads.clear()
+    await asyncio.sleep(args.duration * 2)
+    return phases, limit
+
+
+def _throttled_share(phase) -> float:
+    throttled, completed = phase
+    return throttled / max(completed + throttled, 1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--start", type=int, default=4, help="starting concurrency")
+    parser.add_argument("--max-factor", type=float, default=3.0)
+    parser.add_argument("--capacity", type=int, default=8)
+    parser.add_argument("--capacity-after", type=int, default=3)
+    parser.add_argument("--duration", type=float, default=0.3)
+    parser.add_argument("--backoff", type=float, default=0.5)
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--sample", type=float, default=1.0)
+    args = parser.parse_args()
+
+    os.environ.update(
+        {
+            "REDIS_URL": "",
+            "TIKTOK_CONCURRENCY": str(args.start),
+            "TIKTOK_QUEUE_SIZE": "1000",
+            "DOWNLOAD_AIMD_MAX_FACTOR": str(args.max_factor),
+            "DOWNLOAD_BACKOFF_BASE_SECONDS": str(args.backoff),
+            "DOWNLOAD_BACKOFF_MAX_SECONDS": str(args.backoff * 8),
+            "DOWNLOAD_START_RATE": "50",
+            "DOWNLOAD_START_BURST": "10",
+            "DOWNLOAD_SINGLE_FLIGHT": "false",
+            "MEDIA_CACHE_MAX_MB": "0",
+        }
+    )
+
+    async def run() -> None:
+        from app.config import DOWNLOAD_AIMD_DECREASE_FACTOR
+
+        adaptive, limit = await _simulate(args, adaptive=True)
+        fixed, _ = await _simulate(args, adaptive=False)
+        floor = max(1, int(args.capacity_after * DOWNLOAD_AIMD_DECREASE_FACTOR))
+        if not floor <= limit <= args.capacity_after + 1:
+            raise SystemExit(f"adaptive limit ended at {limit}, host capacity {args.capacity_after}")
+        adaptive_share, fixed_share = _throttled_share(adaptive[-1]), _throttled_share(fixed[-1])
+        if adaptive_share > fixed_share / 2:
+            raise SystemExit(
+                f"adaptive limit throttled {adaptive_share:.0%} after the drop, fixed {fixed_share:.0%}"
+            )
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import asyncio
+import functools
+import http.server
+import os
+import random
+import socket
+import threading
+
+import pytest
+
+os.environ["REDIS_URL"] = ""
+
+from app.downloaders.common import download_video  # noqa: E402
+from app.services.egress_pool import EgressPool  # noqa: E402
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args) -> None:
+        pass
+
+
+async def _forward(origin_port: int, reader, writer) -> None:
+    """Stand-in proxy: passes one plain-HTTP request per connection to the origin."""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        method, target, version = lines[0].split(" ", 2)
+        path = "/" + target.split("://", 1)[-1].split("/", 1)[-1]
+        headers = [
+            line
+            for line in lines[1:]
+            if line and not line.lower().startswith(("connection:", "proxy-connection:", "keep-alive:"))
+        ]
+        request = "\r\n".join([f"{method} {path} {version}", *headers, "Connection: close", "", ""])
+        upstream_reader, upstream_writer = await asyncio.open_connection("127.0.0.1", origin_port)
+        upstream_writer.write(request.encode("latin-1"))
+        await upstream_writer.drain()
+        while chunk := await upstream_reader.read(64 * 1024):
+            writer.write(chunk)
+            await writer.drain()
+        upstream_writer.close()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+@pytest.fixture
+def origin(tmp_path):
+    (tmp_path / "clip.mp4").write_bytes(os.urandom(256 * 1024))
+    handler = functools.partial(_QuietHandler, directory=str(tmp_path))
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield server.server_address[1]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_dead_proxy_is_cooled_down_and_jobs_move_to_the_live_one(origin, tmp_path):
+    random.seed(0)
+
+    async def scenario():
+        proxy = await asyncio.start_server(
+            functools.partial(_forward, origin), "127.0.0.1", 0
+        )
+        fast = f"http://127.0.0.1:{proxy.sockets[0].getsockname()[1]}"
+        dead = f"http://127.0.0.1:{_free_port()}"
+        pool = EgressPool(
+            [fast, dead], sources=("tiktok",), failure_threshold=1, cooldown_seconds=60
+        )
+        url = f"http://127.0.0.1:{origin}/clip.mp4"
+        picks = []
+
+        async def job(index, prefer=None):
+            async with pool.use("tiktok", prefer=prefer) as lease:
+                picks.append(lease.name)
+                path = await download_video(
+                    url, str(tmp_path / f"job_{index}.%(ext)s"), egress=lease.egress
+                )
+                lease.bytes = os.path.getsize(path)
+
+        try:
+            with pytest.raises(Exception):
+                await job(0, prefer=dead)
+            for index in range(1, 4):
+                await job(index)
+            # A cooling-down egress is skipped even when asked for.
+            await job(4, prefer=dead)
+        finally:
+            proxy.close()
+
+        stats = pool.stats()["egresses"]
+        assert picks == [dead, fast, fast, fast, fast]
+        assert stats[dead]["sources"]["tiktok"]["cooldowns"] == 1
+        assert stats[fast]["sources"]["tiktok"]["downloads"] == 4
+        assert stats[fast]["sources"]["tiktok"]["failures"] == 0
+
+    asyncio.run(scenario())
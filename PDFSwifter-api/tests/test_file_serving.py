@@ -0,0 +1,103 @@
+import os
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from app.utils import file_serving
+from app.utils.file_serving import OFFLOAD_HEADER, serve_file
+
+SIZE = 1000
+
+
+@pytest.fixture
+def served(tmp_path):
+    payload = os.urandom(SIZE)
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(payload)
+    app = FastAPI()
+
+    @app.get("/file")
+    def get_file(request: Request, offload: bool = False, name: str = "clip.mp4"):
+        return serve_file(request, str(tmp_path / name), "clip.mp4", offload=offload)
+
+    return TestClient(app), payload
+
+
+@pytest.mark.parametrize(
+    "header, start, end",
+    [
+        ("bytes=0-0", 0, 1),
+        ("bytes=-100", SIZE - 100, SIZE),
+        ("bytes=-5000", 0, SIZE),
+        ("bytes=900-", 900, SIZE),
+        ("bytes=10-19", 10, 20),
+        ("bytes=990-5000", 990, SIZE),
+    ],
+)
+def test_single_range(served, header, start, end):
+    client, payload = served
+    response = client.get("/file", headers={"Range": header})
+    assert response.status_code == 206
+    assert response.content == payload[start:end]
+    assert response.headers["content-range"] == f"bytes {start}-{end - 1}/{SIZE}"
+    assert response.headers["content-length"] == str(end - start)
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=5000-6000", "bytes=-0"])
+def test_unsatisfiable_range(served, header):
+    client, _ = served
+    response = client.get("/file", headers={"Range": header})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{SIZE}"
+
+
+@pytest.mark.parametrize("header", ["bytes=0-9,20-29", "bytes=abc", "items=0-9", "bytes=20-10"])
+def test_ignored_range_sends_the_whole_file(served, header):
+    client, payload = served
+    response = client.get("/file", headers={"Range": header})
+    assert response.status_code == 200
+    assert response.content == payload
+    assert "content-range" not in response.headers
+
+
+def test_if_range(served):
+    client, payload = served
+    etag = client.get("/file").headers["etag"]
+    stale = client.get("/file", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert stale.status_code == 200 and stale.content == payload
+    current = client.get("/file", headers={"Range": "bytes=0-9", "If-Range": etag})
+    assert current.status_code == 206 and current.content == payload[:10]
+
+
+def test_if_none_match(served):
+    client, _ = served
+    full = client.get("/file")
+    assert full.headers["accept-ranges"] == "bytes"
+    etag = full.headers["etag"]
+    for header in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+        response = client.get("/file", headers={"If-None-Match": header})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+    assert client.get("/file", headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_offload_stays_inside_data_root(served, monkeypatch, tmp_path):
+    client, payload = served
+    root = tmp_path / "root"
+    (root / "downloads").mkdir(parents=True)
+    (root / "downloads" / "a b.mp4").write_bytes(payload)
+    os.symlink(tmp_path / "clip.mp4", root / "downloads" / "escape.mp4")
+    monkeypatch.setattr(file_serving, "DATA_ROOT", root)
+
+    inside = client.get("/file", params={"offload": True, "name": "root/downloads/a b.mp4"})
+    assert inside.status_code == 200
+    assert inside.headers[OFFLOAD_HEADER] == "/downloads/a%20b.mp4"
+    assert inside.content == b""
+
+    # Outside DATA_ROOT (directly or through a symlink) the bytes are sent instead.
+    for name in ("clip.mp4", "root/downloads/escape.mp4", "root/../clip.mp4"):
+        response = client.get("/file", params={"offload": True, "name": name})
+        assert OFFLOAD_HEADER.lower() not in response.headers
+        assert response.content == payload
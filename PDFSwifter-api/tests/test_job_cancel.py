@@ -0,0 +1,50 @@
+import asyncio
+import os
+
+os.environ["REDIS_URL"] = ""
+
+from app.services import job_codec  # noqa: E402
+from app.services.download_tracker import DOWNLOAD_TRACKER  # noqa: E402
+from app.services.job_cancel import CANCELLED, cancel_job, cancel_requested  # noqa: E402
+from app.services.single_flight import SINGLE_FLIGHT  # noqa: E402
+
+
+def test_cancelling_a_shared_leader_detaches_it():
+    async def scenario():
+        leader = DOWNLOAD_TRACKER.create_job("tiktok", "https://example.com/v/1", "")
+        follower = DOWNLOAD_TRACKER.create_job("tiktok", "https://example.com/v/1", "")
+        DOWNLOAD_TRACKER.update_job(leader.process_id, status="running")
+        assert await SINGLE_FLIGHT.join("cancel-test", leader.process_id) is None
+        assert await SINGLE_FLIGHT.join("cancel-test", follower.process_id) == leader.process_id
+
+        assert cancel_job(leader.process_id, "Cancelled by user") is False
+        assert DOWNLOAD_TRACKER.get_job(leader.process_id).status == "running"
+        assert DOWNLOAD_TRACKER.serialize_job(leader.process_id)["status"] == CANCELLED
+        assert not cancel_requested(leader.process_id)
+
+        # Once no follower waits any more, the download itself stops.
+        DOWNLOAD_TRACKER.update_job(follower.process_id, status=CANCELLED)
+        assert cancel_requested(leader.process_id)
+        assert DOWNLOAD_TRACKER.get_job(leader.process_id).status == CANCELLED
+        await SINGLE_FLIGHT.finish(leader.process_id, "cancel-test")
+
+    asyncio.run(scenario())
+
+
+def test_unshared_job_is_cancelled():
+    job = DOWNLOAD_TRACKER.create_job("tiktok", "https://example.com/v/2", "")
+    assert cancel_job(job.process_id, "Cancelled by user") is True
+    assert DOWNLOAD_TRACKER.get_job(job.process_id).status == CANCELLED
+
+
+def test_packed_encoding_keeps_detached():
+    for flag in (True, False):
+        data = job_codec.unpack_job(job_codec.pack_job({"process_id": "x", "detached": flag}))
+        assert data["detached"] is flag
+
+
+def test_cancel_loses_to_completion():
+    job = DOWNLOAD_TRACKER.create_job("tiktok", "https://example.com/v/3", "")
+    DOWNLOAD_TRACKER.update_job(job.process_id, status="completed", file_path="/tmp/done.mp4")
+    assert cancel_job(job.process_id, "Cancelled by user") is None
+    assert DOWNLOAD_TRACKER.get_job(job.process_id).status == "completed"
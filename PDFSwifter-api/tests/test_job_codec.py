@@ -0,0 +1,82 @@
+from app.services import job_codec
+
+
+def _job(**overrides):
+    data = {
+        "process_id": "abc123",
+        "source": "youtube",
+        "url": "https://youtu.be/x?t=1&é",
+        "status": "running",
+        "progress": 42.5,
+        "bytes_downloaded": 1234,
+        "total_bytes": 5678,
+        "version": 1_700_000_000_123_456,
+        "file_path": None,
+        "suggested_name": "clip.mp4",
+        "error": "",
+        "queue_position": 3,
+        "estimated_wait_seconds": 12.5,
+        "quality": "720p",
+        "selected_format": None,
+        "bytes_resumed": 0,
+        "partial_path": "/downloads/abc.part",
+        "partial_bytes": 1024,
+        "batch_id": None,
+        "children": "a,b",
+        "detached": False,
+    }
+    data.update(overrides)
+    return data
+
+
+def test_round_trip_keeps_none_bool_and_typed_text_fields():
+    data = _job()
+    decoded = job_codec.unpack_job(job_codec.pack_job(data))
+    assert decoded == data
+    assert isinstance(decoded["queue_position"], int)
+    assert isinstance(decoded["estimated_wait_seconds"], float)
+    assert decoded["detached"] is False
+    assert job_codec.unpack_job(job_codec.pack_job(_job(detached=True)))["detached"] is True
+
+
+def test_unknown_total_bytes_is_stored_as_minus_one():
+    raw = job_codec.pack_job(_job(total_bytes=None))
+    offset, encoded = job_codec.pack_field("total_bytes", None)
+    assert raw[offset:offset + len(encoded)] == (-1).to_bytes(8, "little", signed=True)
+    assert job_codec.unpack_job(raw)["total_bytes"] is None
+    assert job_codec.unpack_job(job_codec.pack_job(_job(total_bytes=0)))["total_bytes"] == 0
+
+
+def test_setrange_patch_decodes():
+    raw = bytearray(job_codec.pack_job(_job()))
+    for field, value in (("progress", 99.5), ("bytes_downloaded", 9999), ("total_bytes", None), ("version", 7)):
+        offset, encoded = job_codec.pack_field(field, value)
+        raw[offset:offset + len(encoded)] = encoded
+    decoded = job_codec.unpack_job(bytes(raw))
+    assert decoded["progress"] == 99.5
+    assert decoded["bytes_downloaded"] == 9999
+    assert decoded["total_bytes"] is None
+    assert decoded["version"] == 7
+    assert decoded["partial_path"] == "/downloads/abc.part"
+
+
+def test_value_from_before_a_field_existed_reads_it_as_none(monkeypatch):
+    newer = job_codec.STRING_FIELDS
+    older = newer[: newer.index("partial_path")]
+    monkeypatch.setattr(job_codec, "STRING_FIELDS", older)
+    raw = job_codec.pack_job(_job())
+    monkeypatch.setattr(job_codec, "STRING_FIELDS", newer)
+
+    decoded = job_codec.unpack_job(raw)
+    assert decoded["suggested_name"] == "clip.mp4"
+    assert decoded["bytes_resumed"] == 0
+    for field in newer[len(older):]:
+        assert decoded[field] is None
+
+
+def test_missing_or_zero_filled_value_is_no_job():
+    assert job_codec.unpack_job(None) is None
+    assert job_codec.unpack_job(b"") is None
+    # SETRANGE on a missing key leaves a zero version byte in front.
+    offset, encoded = job_codec.pack_field("progress", 50.0)
+    assert job_codec.unpack_job(bytes(offset) + encoded) is None
@@ -0,0 +1,55 @@
+import asyncio
+import os
+
+os.environ["REDIS_URL"] = ""
+
+from app.services.download_tracker import DownloadTracker  # noqa: E402
+from app.services.job_events import iter_job_states  # noqa: E402
+
+
+def test_batch_parent_stream_survives_deltas():
+    async def scenario():
+        tracker = DownloadTracker()
+        job = tracker.create_job("batch", "https://example.com/list", "")
+        tracker.update_job(job.process_id, children="a,b,c")
+
+        states = iter_job_states(tracker, job.process_id, heartbeat_seconds=5)
+        event, state = await states.__anext__()
+        assert event == "state" and state["children"] == ["a", "b", "c"]
+
+        tracker.update_job(job.process_id, progress=33.3)
+        event, state = await asyncio.wait_for(states.__anext__(), timeout=5)
+        assert state["progress"] == 33.3
+        assert state["children"] == ["a", "b", "c"]
+
+        tracker.update_job(job.process_id, status="completed", progress=100.0)
+        event, state = await asyncio.wait_for(states.__anext__(), timeout=5)
+        assert state["status"] == "completed" and state["children"] == ["a", "b", "c"]
+        await states.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_stream_resyncs_after_dropping_deltas():
+    async def scenario():
+        tracker = DownloadTracker()
+        tracker.events._max_queue = 2
+        job = tracker.create_job("tiktok", "https://example.com/v/1", "")
+
+        states = iter_job_states(tracker, job.process_id, heartbeat_seconds=60)
+        event, state = await states.__anext__()
+        assert state["status"] == "pending"
+
+        # The consumer is not reading: only the first two deltas fit.
+        tracker.update_job(job.process_id, status="running", progress=10.0)
+        tracker.update_job(job.process_id, progress=20.0)
+        tracker.update_job(job.process_id, status="retrying", error="Connection reset")
+        tracker.update_job(job.process_id, progress=30.0)
+
+        event, state = await asyncio.wait_for(states.__anext__(), timeout=5)
+        assert state["status"] == "retrying"
+        assert state["error"] == "Connection reset"
+        assert state["progress"] == 30.0
+        await states.aclose()
+
+    asyncio.run(scenario())
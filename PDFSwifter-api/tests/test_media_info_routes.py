@@ -0,0 +1,56 @@
+import os
+
+import pytest
+
+os.environ["REDIS_URL"] = ""
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.routes import instagram, tiktok  # noqa: E402
+from app.services.media_info import MEDIA_INFO  # noqa: E402
+from main import app  # noqa: E402
+
+
+@pytest.fixture
+def probes(monkeypatch):
+    calls = []
+
+    async def probe(source, url, custom_options=None):
+        calls.append((source, url))
+        return {"id": "clip"}, False
+
+    monkeypatch.setattr(MEDIA_INFO, "probe", probe)
+    for module in (tiktok, instagram):
+        monkeypatch.setattr(module, "describe_info", lambda info, quality: {"id": info["id"]})
+    return calls
+
+
+@pytest.mark.parametrize(
+    "path, url",
+    [
+        ("/tiktok/info", "ftp://x"),
+        ("/tiktok/info", "https://example.com/@user/video/1"),
+        ("/tiktok/info", "https://tiktok.com.example.com/@user/video/1"),
+        ("/instagram/info", "http://169.254.169.254/latest/meta-data"),
+        ("/youtube/info", "https://example.com/watch?v=1"),
+    ],
+)
+def test_info_rejects_other_hosts_before_probing(probes, path, url):
+    response = TestClient(app).get(path, params={"url": url})
+    assert response.status_code == 400
+    assert probes == []
+
+
+@pytest.mark.parametrize(
+    "path, url",
+    [
+        ("/tiktok/info", "https://www.tiktok.com/@user/video/1"),
+        ("/tiktok/info", "https://vm.tiktok.com/ZMabc/"),
+        ("/instagram/info", "https://www.instagram.com/reel/abc/"),
+    ],
+)
+def test_info_probes_platform_urls(probes, path, url):
+    response = TestClient(app).get(path, params={"url": url})
+    assert response.status_code == 200
+    assert response.json() == {"id": "clip", "cached": False}
+    assert probes == [(path.split("/")[1], url)]
@@ -0,0 +1,91 @@
+import asyncio
+import http.server
+import os
+import threading
+import time
+
+import pytest
+
+os.environ["REDIS_URL"] = ""
+
+from app.downloaders import youtube  # noqa: E402
+from app.downloaders.youtube import RemoteYouTubeDownloader  # noqa: E402
+from app.services.download_tracker import DOWNLOAD_TRACKER  # noqa: E402
+from app.services.file_follow import FollowAborted, follow_job_file  # noqa: E402
+
+SIZE = 512 * 1024
+
+
+class _RestartingRemote(http.server.BaseHTTPRequestHandler):
+    """Cuts the first response off halfway, without Range support, then
+    serves different bytes: a retry has to fetch the file from the start."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        self.server.requests += 1
+        first = self.server.requests == 1
+        payload = self.server.payloads[0 if first else 1]
+        self.send_response(200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        if first:
+            self.wfile.write(payload[: len(payload) // 2])
+            self.wfile.flush()
+            time.sleep(0.5)  # time for a follower to open the file
+            self.close_connection = True
+            return
+        self.wfile.write(payload)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def remote():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _RestartingRemote)
+    server.requests = 0
+    server.payloads = [os.urandom(SIZE), os.urandom(SIZE)]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_restart_moves_followers_off_the_old_file(remote, monkeypatch, tmp_path):
+    monkeypatch.setattr(youtube, "YOUTUBE_RETRY_DELAY_SECONDS", 0)
+    downloader = RemoteYouTubeDownloader(
+        f"http://127.0.0.1:{remote.server_address[1]}/download", str(tmp_path)
+    )
+    job = DOWNLOAD_TRACKER.create_job("youtube", "https://youtu.be/restart", "")
+
+    async def follow() -> bytes:
+        while not (path := DOWNLOAD_TRACKER.get_job(job.process_id).partial_path):
+            await asyncio.sleep(0.01)
+        while not os.path.exists(path):
+            await asyncio.sleep(0.01)
+        received = b""
+        # Polls slowly enough for the retry to overtake what was sent.
+        with pytest.raises(FollowAborted):
+            async for chunk in follow_job_file(job.process_id, open(path, "rb"), poll_seconds=1.0):
+                received += chunk
+        return received
+
+    async def scenario():
+        follower = asyncio.ensure_future(follow())
+        await downloader.download("https://youtu.be/restart", job.process_id)
+        received = await asyncio.wait_for(follower, timeout=10)
+        await downloader.aclose()
+        return received
+
+    received = asyncio.run(scenario())
+    finished = DOWNLOAD_TRACKER.get_job(job.process_id)
+    assert finished.status == "completed"
+    with open(finished.file_path, "rb") as handle:
+        assert handle.read() == remote.payloads[1]
+    # The follower only ever saw bytes of the first file.
+    assert remote.payloads[0].startswith(received)
+    assert os.listdir(tmp_path) == [os.path.basename(finished.file_path)]
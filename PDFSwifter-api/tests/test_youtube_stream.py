@@ -0,0 +1,141 @@
+import asyncio
+import http.server
+import os
+import threading
+from urllib.parse import urlencode
+
+import pytest
+
+os.environ["REDIS_URL"] = ""
+
+from fastapi.testclient import TestClient  # noqa: E402
+from starlette.requests import ClientDisconnect  # noqa: E402
+
+from app.downloaders.youtube import RemoteYouTubeDownloader  # noqa: E402
+from app.services import direct_stream  # noqa: E402
+from app.services.download_scheduler import DOWNLOAD_SCHEDULER  # noqa: E402
+from app.services.media_cache import MEDIA_CACHE  # noqa: E402
+from main import app  # noqa: E402
+
+VIDEO_URL = "https://www.youtube.com/watch?v=stream-test"
+
+
+class _RemoteHandler(http.server.BaseHTTPRequestHandler):
+    """Stand-in remote endpoint: answers every GET with ``server.payload``."""
+
+    def do_GET(self) -> None:
+        payload = self.server.payload
+        self.send_response(200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("Content-Disposition", 'attachment; filename="clip.mp4"')
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class _RemoteServer(http.server.ThreadingHTTPServer):
+    def handle_error(self, request, client_address) -> None:
+        pass  # the client hangs up mid-body on purpose
+
+
+@pytest.fixture
+def remote(monkeypatch, tmp_path):
+    server = _RemoteServer(("127.0.0.1", 0), _RemoteHandler)
+    server.payload = os.urandom(256 * 1024)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    downloader = RemoteYouTubeDownloader(
+        f"http://127.0.0.1:{server.server_address[1]}/download",
+        str(tmp_path),
+        direct_buffer_bytes=64 * 1024,
+    )
+    monkeypatch.setattr(direct_stream, "YOUTUBE_DOWNLOADER", downloader)
+    monkeypatch.setattr(MEDIA_CACHE, "max_bytes", 0)
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _slots_in_use() -> int:
+    return asyncio.run(DOWNLOAD_SCHEDULER.slots["youtube"].count())
+
+
+def test_stream_pipes_the_remote_body(remote):
+    response = TestClient(app).get("/youtube/stream", params={"url": VIDEO_URL})
+    assert response.status_code == 200
+    assert response.content == remote.payload
+    assert response.headers["content-disposition"] == 'attachment; filename="clip.mp4"'
+    assert _slots_in_use() == 0
+
+
+def test_stream_is_refused_when_every_slot_is_taken(remote):
+    slots = DOWNLOAD_SCHEDULER.slots["youtube"]
+
+    async def take_all():
+        leases = []
+        while (lease := await slots.try_acquire()) is not None:
+            leases.append(lease)
+        return leases
+
+    leases = asyncio.run(take_all())
+    try:
+        response = TestClient(app).get("/youtube/stream", params={"url": VIDEO_URL})
+        assert response.status_code == 429
+    finally:
+        for lease in leases:
+            asyncio.run(slots.release(lease))
+    assert _slots_in_use() == 0
+
+
+@pytest.mark.parametrize("gone_before_headers", [True, False])
+def test_client_disconnect_frees_the_slot(remote, gone_before_headers):
+    remote.payload = os.urandom(16 * 1024 * 1024)
+
+    async def scenario():
+        first_chunk = asyncio.Event()
+        requested = False
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await first_chunk.wait()
+            return {"type": "http.disconnect"}
+
+        received = []
+
+        async def send(message):
+            if gone_before_headers:
+                # ASGI 2.4 servers raise on send once the client is gone.
+                raise OSError("client went away")
+            if message["type"] == "http.response.body" and message.get("body"):
+                received.append(len(message["body"]))
+                first_chunk.set()
+
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0", "spec_version": "2.4" if gone_before_headers else "2.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": "/youtube/stream",
+            "raw_path": b"/youtube/stream",
+            "query_string": urlencode({"url": VIDEO_URL}).encode(),
+            "root_path": "",
+            "headers": [(b"host", b"testserver")],
+            "client": ("127.0.0.1", 50000),
+            "server": ("testserver", 80),
+        }
+        try:
+            await asyncio.wait_for(app(scope, receive, send), timeout=10)
+        except ClientDisconnect:
+            assert gone_before_headers
+        assert sum(received) < len(remote.payload)
+        assert await DOWNLOAD_SCHEDULER.slots["youtube"].count() == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,32 @@
+"""Background job worker.
+
+Consumes jobs enqueued by the API when JOB_QUEUE_MODE=redis:
+
+    python worker.py
+"""
+
+import asyncio
+import logging
+import os
+
+from app.downloaders.cookie_manager import COOKIE_POOL
+from app.downloaders.ytdlp_pool import YTDLP_POOL, YTDLP_PROBE_POOL
+from app.services.job_queue import JOB_QUEUE, JobWorker
+
+
+def main() -> None:
+    logging.basicConfig(
+        level=os.environ.get("LOG_LEVEL", "info").upper(),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+    COOKIE_POOL.start()
+    try:
+        asyncio.run(JobWorker(JOB_QUEUE).run())
+    finally:
+        COOKIE_POOL.stop()
+        YTDLP_POOL.close()
+        YTDLP_PROBE_POOL.close()
+
+
+if __name__ == "__main__":
+    main()